@@ -0,0 +1,287 @@
+import argparse
+import json
+import socket
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+from controller import Controller
+from model import RealSenseModel, DEPTH_MODES, ALIGN_MODES
+from landmark_backends import LANDMARK_BACKENDS
+from settings import DEFAULT_CONFIG, build_osc_sender, build_smoothing_chain
+from software_camera import SoftwareCamera
+
+# カメラなしでの end-to-end ベンチマーク
+# 合成した顔画像とデプスを rs.software_device から流し、main.py と同じ
+# RealSenseModel -> Controller (デプロジェクション・スムージング) -> OSCSender の経路を通して、
+# ローカルの UDP 受信側に届いた時刻から fps とフレーム入力からパケット到着までの遅延を測る
+
+FACE_DEPTH = 600         # mm
+BACKGROUND_DEPTH = 1500  # mm
+
+def render_face(width, height, cx, cy, scale, face_image=None):
+    # FaceMesh / Haar カスケードの検出器が顔とみなす程度の陰影をつけた正面顔を描く
+    # face_image (RGB) を渡したときは、描く代わりにその画像を顔の位置に貼る
+    image = np.full((height, width, 3), (96, 110, 124), np.uint8)
+    depth = np.full((height, width), BACKGROUND_DEPTH, np.uint16)
+    s = scale * height
+    center = (int(cx * width), int(cy * height))
+    axes = (int(0.16 * s), int(0.22 * s))
+    if face_image is not None:
+        h = int(0.6 * s)
+        w = int(face_image.shape[1] * h / face_image.shape[0])
+        face = cv2.resize(face_image, (w, h), interpolation=cv2.INTER_AREA)
+        x0, y0 = center[0] - w // 2, center[1] - h // 2
+        sx, sy = max(0, -x0), max(0, -y0)
+        ex, ey = min(w, width - x0), min(h, height - y0)
+        image[y0 + sy:y0 + ey, x0 + sx:x0 + ex] = face[sy:ey, sx:ex]
+        return image, _face_depth(depth, center, axes)
+    cv2.ellipse(image, center, axes, 0, 0, 360, (205, 160, 135), -1, cv2.LINE_AA)
+    cv2.ellipse(image, (center[0], center[1] - int(0.2 * s)), (int(0.17 * s), int(0.1 * s)), 0, 180, 360, (60, 40, 30), -1, cv2.LINE_AA)
+    for side in (-1, 1):
+        eye = (center[0] + side * int(0.065 * s), center[1] - int(0.03 * s))
+        cv2.ellipse(image, (eye[0], eye[1] - int(0.035 * s)), (int(0.035 * s), int(0.008 * s)), 0, 0, 360, (70, 50, 40), -1, cv2.LINE_AA)
+        cv2.ellipse(image, eye, (int(0.03 * s), int(0.014 * s)), 0, 0, 360, (240, 240, 240), -1, cv2.LINE_AA)
+        cv2.circle(image, eye, int(0.012 * s), (80, 60, 40), -1, cv2.LINE_AA)
+        cv2.circle(image, eye, int(0.005 * s), (10, 10, 10), -1, cv2.LINE_AA)
+    nose = np.array([(center[0], center[1] - int(0.01 * s)), (center[0] - int(0.02 * s), center[1] + int(0.06 * s)),
+                     (center[0] + int(0.02 * s), center[1] + int(0.06 * s))], np.int32)
+    cv2.fillConvexPoly(image, nose, (180, 135, 110), cv2.LINE_AA)
+    cv2.ellipse(image, (center[0], center[1] + int(0.12 * s)), (int(0.05 * s), int(0.015 * s)), 0, 0, 360, (150, 70, 70), -1, cv2.LINE_AA)
+    image = cv2.GaussianBlur(image, (5, 5), 0)
+    return image, _face_depth(depth, center, axes)
+
+def _face_depth(depth, center, axes):
+    # 顔の部分は手前に丸く膨らんだ面、背景は平面
+    height, width = depth.shape
+    yy, xx = np.mgrid[0:height, 0:width]
+    r2 = ((xx - center[0]) / axes[0]) ** 2 + ((yy - center[1]) / axes[1]) ** 2
+    inside = r2 < 1
+    depth[inside] = (FACE_DEPTH + 40 * r2[inside]).astype(np.uint16)
+    return depth
+
+class SyntheticSource:
+    # RealSenseModel の source として使う合成カメラ (ReplaySource と同じ属性を持つ)
+    # あらかじめ描いたフレームを順に software_device へ流し、wait_for_frames() が返した時刻をフレームの入力時刻とする
+    def __init__(self, width, height, fps=30, realtime=True, frames=60, face_image=None):
+        self.camera = SoftwareCamera(width, height, fps)
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.realtime = realtime
+        self.depth_scale = self.camera.depth_units
+        self.is_stereo = True
+        self.color_format = "rgb8"
+        self.color_intrinsics = self.camera.color_intrinsics
+        self.depth_intrinsics = self.camera.depth_intrinsics
+        self.color_to_depth = self.camera.color_to_depth
+        self.depth_to_color = self.camera.depth_to_color
+        self.finished = False
+        # 顔がゆっくり左右に動くループ
+        phases = np.linspace(0, 2 * np.pi, frames, endpoint=False)
+        self.frames = [render_face(width, height, 0.5 + 0.08 * np.sin(p), 0.5 + 0.03 * np.cos(p), 1.0, face_image)
+                       for p in phases]
+        self.index = 0
+        self.next_time = None
+        self.input_times = {}
+
+    def wait_for_frames(self, timeout_ms=1000):
+        if self.realtime:
+            now = time.perf_counter()
+            if self.next_time is None:
+                self.next_time = now
+            delay = self.next_time - now
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time += 1.0 / self.fps
+        color, depth = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        self.camera.push(color, depth)
+        frames = self.camera.wait_for_frames(timeout_ms)
+        self.input_times[frames.get_color_frame().get_frame_number()] = time.perf_counter()
+        return frames
+
+    def stop(self):
+        self.camera.stop()
+
+class NullView:
+    # Controller が使う表示側の口だけを持つ (プレビューは描かない)
+    preview_interval_ms = 100
+
+    def set_smoothing_handler(self, handler, current):
+        pass
+
+class OSCReceiver:
+    # 受信したパケットの OSC アドレスと到着時刻を記録する
+    def __init__(self, address):
+        self.address = address.encode("ascii")
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.arrivals = []
+        self.packets = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name="bench-osc-receiver", daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while self.running:
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            t = time.perf_counter()
+            self.packets += 1
+            # bundle (#bundle) は 1 パケットに right/left/center がまとめて入っている
+            if data.startswith(b"#bundle\0") or data[:data.index(b"\0")] == self.address:
+                self.arrivals.append(t)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)), "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)), "max": float(values.max()), "mean": float(values.mean()),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark with a software RealSense device and synthetic faces.")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--max-rate", action="store_true", help="feed frames as fast as they are consumed")
+    parser.add_argument("--depth-mode", choices=DEPTH_MODES, default=DEFAULT_CONFIG["depth_mode"])
+    parser.add_argument("--align-mode", choices=ALIGN_MODES, default=DEFAULT_CONFIG["align_mode"])
+    parser.add_argument("--smoothing", default="none")
+    parser.add_argument("--keyframe-interval", type=int, default=1,
+                        help="run the landmark backend every N frames and track the irises with optical flow in between")
+    parser.add_argument("--landmark-backend", choices=LANDMARK_BACKENDS, default=DEFAULT_CONFIG["landmark_backend"])
+    parser.add_argument("--face-image", help="photo of a face to use instead of the drawn one")
+    parser.add_argument("--osc-bundle", action="store_true", help="send one OSC bundle per frame")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULT_CONFIG, ip="127.0.0.1", smoothing=args.smoothing,
+                  depth_mode=args.depth_mode, align_mode=args.align_mode, osc_bundle=args.osc_bundle)
+    receiver = OSCReceiver(config["osc_right_addr"])
+    config["port"] = receiver.port
+    face_image = None
+    if args.face_image:
+        face_image = cv2.imread(args.face_image)
+        if face_image is None:
+            raise SystemExit(f"cannot read {args.face_image}")
+        face_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
+    source = SyntheticSource(args.width, args.height, args.fps, realtime=not args.max_rate, face_image=face_image)
+    model = RealSenseModel(
+        None, 0, args.width, args.height, args.fps, depth_mode=args.depth_mode, align_mode=args.align_mode, source=source,
+        keyframe_interval=args.keyframe_interval, landmark_backend=args.landmark_backend
+    )
+    controller = Controller(model, NullView(), "", build_osc_sender(config), build_smoothing_chain(config))
+
+    # 色画像の配列をキーにして、出力ステージまでどの入力フレームかを引き継ぐ
+    # 送信スレッドでは間引かれた姿勢もあるので、実際に送った姿勢のフレームをタイムスタンプで引く
+    frame_ids = {}
+    stamp_frames = {}
+    sent = deque()
+    counts = {"processed": 0, "detected": 0}
+    process_frames = model.process_frames
+    output_stage = controller.process_output
+    osc_worker = controller.output
+    send = osc_worker.sender.send
+
+    def traced_process_frames(frames):
+        frame_number = frames.get_color_frame().get_frame_number()
+        color_arr, eye_pos, landmarks = process_frames(frames)
+        if color_arr is not None:
+            frame_ids[id(color_arr)] = frame_number
+        return color_arr, eye_pos, landmarks
+
+    def traced_output_stage(frame, eye_pos, landmarks, timestamp=None, arrival=None):
+        frame_number = frame_ids.pop(id(frame), None)
+        counts["processed"] += 1
+        if eye_pos is not None:
+            counts["detected"] += 1
+            stamp_frames[timestamp] = frame_number
+        return output_stage(frame, eye_pos, landmarks, timestamp, arrival)
+
+    def traced_send(eye_pos, timestamp=None):
+        sent.append(stamp_frames.pop(timestamp, None))
+        send(eye_pos, timestamp)
+
+    model.process_frames = traced_process_frames
+    controller.pipeline.output_stage = traced_output_stage
+    osc_worker.sender.send = traced_send
+
+    print(f"{args.width}x{args.height} {'max rate' if args.max_rate else f'@ {args.fps} fps'}"
+          f" depth_mode={args.depth_mode} align_mode={args.align_mode} smoothing={args.smoothing}"
+          f" keyframe_interval={args.keyframe_interval} landmark_backend={args.landmark_backend}")
+    start = time.perf_counter()
+    controller.pipeline.start()
+    while time.perf_counter() - start < args.duration:
+        controller.pipeline.poll()
+        time.sleep(0.05)
+    controller.pipeline.stop()
+    osc_worker.close()
+    elapsed = time.perf_counter() - start
+    time.sleep(0.2)  # 送信済みのパケットを受け取りきる
+    receiver.stop()
+    model.close()
+
+    # ローカルの UDP は順序どおりに届くので、送った順に到着時刻と対応づける
+    latencies = []
+    arrivals = receiver.arrivals
+    for frame_number, arrival in zip(sent, arrivals):
+        t_in = source.input_times.get(frame_number)
+        if t_in is not None:
+            latencies.append(arrival - t_in)
+    results = {
+        "config": {"width": args.width, "height": args.height, "fps": None if args.max_rate else args.fps,
+                   "depth_mode": args.depth_mode, "align_mode": args.align_mode, "smoothing": args.smoothing,
+                   "osc_bundle": args.osc_bundle, "keyframe_interval": args.keyframe_interval,
+                   "landmark_backend": args.landmark_backend},
+        "duration_s": elapsed,
+        "frames_in": source.index,
+        "frames_processed": counts["processed"],
+        "faces_detected": counts["detected"],
+        "packets_received": receiver.packets,
+        "processed_fps": counts["processed"] / elapsed,
+        "output_fps": len(arrivals) / elapsed,
+        "dropped": controller.pipeline.dropped_counts(),
+        "osc": osc_worker.snapshot(),
+        "latency_ms": percentiles(latencies),
+        "keyframe_ratio": model.propagator.keyframe_ratio() if model.propagator is not None else 1.0,
+    }
+    print(f"  in {results['frames_in']} frames, processed {results['frames_processed']}"
+          f" ({results['processed_fps']:.1f} fps), face detected {results['faces_detected']},"
+          f" OSC {len(arrivals)} frames ({results['output_fps']:.1f} fps)")
+    print(f"  dropped between stages: {results['dropped']}")
+    if model.propagator is not None:
+        print(f"  {args.landmark_backend} keyframes {results['keyframe_ratio'] * 100:.0f}% of processed frames")
+    osc = results["osc"]
+    print(f"  OSC worker: sent {osc['osc_sent']}, coalesced {osc['osc_dropped']}, failed {osc['osc_failed']},"
+          f" queue -> sent p50 {osc['osc_latency_p50_ms']:.3f} ms  p99 {osc['osc_latency_p99_ms']:.3f} ms")
+    if results["latency_ms"] is None:
+        print("  no OSC output: the face was not detected, so no latency could be measured")
+    else:
+        lat = results["latency_ms"]
+        print(f"  frame-in -> packet-out latency ms: p50 {lat['p50']:.1f}  p90 {lat['p90']:.1f}"
+              f"  p99 {lat['p99']:.1f}  max {lat['max']:.1f}")
+        if len(sent) != len(arrivals):
+            print(f"  warning: {len(sent)} sends but {len(arrivals)} packets arrived; latencies may be misaligned")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
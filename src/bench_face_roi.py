@@ -0,0 +1,93 @@
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from bench_e2e import render_face
+from face_roi import FaceInput
+from landmark_backends import FaceMeshBackend
+
+# FaceMesh の入力の大きさに対するフレームあたりの推論時間
+# 解像度ごとに、フレーム全体 / 縮小したフレーム全体 / 顔の周りの切り出し (と縮小) を比べる
+# 合成した顔をゆっくり動かしたフレームを順に流し、切り出し・縮小・座標の書き戻しも含めた時間を測る
+# 目のランドマークの位置は、同じフレームを縮小せずに全体で推論した結果との差 (px) を出す
+
+def face_frames(width, height, count, face_scale, face_image):
+    phases = np.linspace(0, 2 * np.pi, count, endpoint=False)
+    return [render_face(width, height, 0.5 + 0.15 * np.sin(p), 0.5 + 0.05 * np.cos(p), face_scale, face_image)[0]
+            for p in phases]
+
+def eye_pixels(faces, width, height):
+    if not faces:
+        return None
+    return faces[0].eyes * (width, height)
+
+def run(frames, mode, input_size, padding):
+    height, width = frames[0].shape[:2]
+    # RealSenseModel と同じ設定
+    backend = FaceMeshBackend(static=mode == "roi")
+    face_input = FaceInput(width, height, mode=mode, input_size=input_size, padding=padding)
+    times, eyes, input_sides = [], [], []
+    for frame in frames:
+        start = time.perf_counter()
+        image, roi = face_input.prepare(frame)
+        faces = backend.process(image)
+        face_input.update(faces, roi)
+        times.append(time.perf_counter() - start)
+        eyes.append(eye_pixels(faces, width, height))
+        input_sides.append(max(image.shape[:2]))
+    backend.close()
+    return np.array(times) * 1000, eyes, input_sides
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure FaceMesh inference time against input resolution and face ROI size.")
+    parser.add_argument("--resolutions", default="640x480,1280x720,1920x1080")
+    parser.add_argument("--input-sizes", default="0,320,192", help="comma separated input sizes (0: no downscaling)")
+    parser.add_argument("--padding", type=float, default=0.5)
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--face-scale", type=float, default=0.6, help="face size relative to the image height")
+    parser.add_argument("--face-image", help="photo of a face to use instead of the drawn one")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    face_image = None
+    if args.face_image:
+        face_image = cv2.imread(args.face_image)
+        if face_image is None:
+            raise SystemExit(f"cannot read {args.face_image}")
+        face_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
+    input_sizes = [int(n) for n in args.input_sizes.split(",")]
+
+    results = []
+    print(f"{'resolution':>10s}  {'input':>10s}  {'mean ms':>8s}  {'p50 ms':>7s}  {'p95 ms':>7s}"
+          f"  {'input px':>8s}  {'found':>6s}  {'eye err px':>10s}")
+    for resolution in args.resolutions.split(","):
+        width, height = (int(v) for v in resolution.split("x"))
+        frames = face_frames(width, height, args.frames, args.face_scale, face_image)
+        reference = None
+        for mode in ("full", "roi"):
+            for input_size in input_sizes:
+                times, eyes, input_sides = run(frames, mode, input_size, args.padding)
+                if reference is None:
+                    reference = eyes
+                errors = [np.abs(eye - ref).max() for eye, ref in zip(eyes, reference)
+                          if eye is not None and ref is not None]
+                row = {
+                    "resolution": resolution, "mode": mode, "input_size": input_size,
+                    "mean_ms": float(times.mean()), "p50_ms": float(np.percentile(times, 50)),
+                    "p95_ms": float(np.percentile(times, 95)), "input_px": float(np.mean(input_sides)),
+                    "found": sum(eye is not None for eye in eyes) / len(eyes),
+                    "eye_error_px": float(np.median(errors)) if errors else None,
+                }
+                results.append(row)
+                name = f"{mode} {input_size or 'native'}"
+                error = f"{row['eye_error_px']:10.2f}" if errors else f"{'-':>10s}"
+                print(f"{resolution:>10s}  {name:>10s}  {row['mean_ms']:8.2f}  {row['p50_ms']:7.2f}  {row['p95_ms']:7.2f}"
+                      f"  {row['input_px']:8.0f}  {row['found'] * 100:5.0f}%  {error}", flush=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
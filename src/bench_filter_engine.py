@@ -0,0 +1,76 @@
+import argparse
+import time
+import numpy as np
+from eye_processor import (MovingAverageProcessor, OneEuroFilterProcesser,
+                           KalmanFilterProcessor, KalmanFilterAccelProcessor)
+from filter_engine import MovingAverageFilter, OneEuroFilter, OutlierGate, KalmanFilter, KalmanAccelFilter
+
+# filter_engine の各フィルタと eye_processor の従来クラスの比較
+# 同じ軌跡を流して出力が一致することを確認し、1 回あたりの処理時間を測る
+
+def make_trajectory(n, seed):
+    rng = np.random.default_rng(seed)
+    dts = rng.uniform(1 / 90, 1 / 25, n)
+    t = np.cumsum(dts)
+    center = np.stack((0.1 * np.sin(t), 0.05 * np.cos(0.7 * t), 0.6 + 0.1 * np.sin(0.3 * t)), axis=-1)
+    eyes = np.stack((center + [-0.032, 0, 0], center + [0.032, 0, 0]), axis=1)
+    eyes += rng.normal(0, 0.003, eyes.shape)
+    # 外れ値と dt の飛び
+    spikes = rng.random(n) < 0.02
+    eyes[spikes] += rng.normal(0, 0.3, (spikes.sum(), 2, 3))
+    dts[rng.random(n) < 0.005] = 0.8
+    return eyes, dts
+
+def run_legacy(processor, eyes, dts):
+    return np.array([processor.process((e[0].tolist(), e[1].tolist()), dt) for e, dt in zip(eyes, dts)])
+
+def run_vector(processor, eyes, dts):
+    return np.array([processor.process(e, dt) for e, dt in zip(eyes, dts)])
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and cross-check filter_engine against eye_processor.")
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--streams", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    eyes, dts = make_trajectory(args.samples, args.seed)
+    pairs = (
+        ("moving average", lambda: MovingAverageProcessor(window=5, threshold=0.15, max_dt=0.5),
+         lambda: MovingAverageFilter(window=5, threshold=0.15, max_dt=0.5)),
+        ("one euro", lambda: OneEuroFilterProcesser(min_cutoff=0.3, beta=0.5, d_cutoff=0.3),
+         lambda: OneEuroFilter(min_cutoff=0.3, beta=0.5, d_cutoff=0.3)),
+        ("kalman", lambda: KalmanFilterProcessor(threshold=0.15, max_dt=0.5),
+         lambda: KalmanFilter(threshold=0.15, max_dt=0.5)),
+        ("kalman accel", lambda: KalmanFilterAccelProcessor(threshold=0.15, max_dt=0.5),
+         lambda: KalmanAccelFilter(threshold=0.15, max_dt=0.5)),
+    )
+    failed = False
+    print(f"{args.samples} samples, per-call time in microseconds")
+    for name, make_legacy, make_vector in pairs:
+        legacy, legacy_time = timed(run_legacy, make_legacy(), eyes, dts)
+        vector, vector_time = timed(run_vector, make_vector(), eyes, dts)
+        batch, batch_time = timed(make_vector().process_batch, eyes, dts)
+        error = max(np.abs(legacy - vector).max(), np.abs(legacy - batch).max())
+        ok = error < 1e-9
+        failed |= not ok
+        print(f"  {name:15s} legacy {legacy_time / args.samples * 1e6:7.2f}  vector {vector_time / args.samples * 1e6:7.2f}"
+              f"  batch {batch_time / args.samples * 1e6:7.2f}  max |diff| {error:.2e} {'OK' if ok else 'MISMATCH'}")
+    # 複数の系列を (N, M, 2, 3) で同時に処理したときの 1 系列・1 サンプルあたりの時間
+    streams = np.stack([make_trajectory(args.samples, args.seed + i)[0] for i in range(args.streams)], axis=1)
+    for name, _, make_vector in pairs + (("outlier gate", None, OutlierGate),):
+        _, stream_time = timed(make_vector().process_batch, streams, dts)
+        print(f"  {name:15s} {args.streams} streams batched {stream_time / args.samples / args.streams * 1e6:7.3f} per stream")
+    gate = OutlierGate()
+    _, gate_time = timed(gate.process_batch, eyes, dts)
+    print(f"  {'outlier gate':15s} vector {gate_time / args.samples * 1e6:7.2f}  rejected {gate.rejected} eye samples")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
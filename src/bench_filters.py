@@ -0,0 +1,230 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+from eye_processor import MovingAverageProcessor, KalmanFilterProcessor, KalmanFilterAccelProcessor, OneEuroFilterProcesser
+from smoothing import SmoothingChain
+
+# 記録済み・合成した眼の位置の時系列をスムージングに通して比較するオフラインベンチマーク
+# 時系列は .npz (t, eye_pos (N, 2, 3), 任意で truth (N, 2, 3)) か
+# "t,rx,ry,rz,lx,ly,lz[,trx,try,trz,tlx,tly,tlz]" 列の CSV
+# 結果はリリース間で diff できるように、キーを固定・値を丸めた JSON で出力する
+
+LAG_SEARCH_MS = 500
+SPIKE_TOLERANCE = 0.05   # スパイク中の出力がこれ以上真値から離れたら通過したとみなす (m)
+SETTLE_TOLERANCE = 0.01  # ギャップの後、誤差がこれ以下に戻るまでを復帰時間とする (m)
+
+def legacy_candidates():
+    return {
+        "legacy/moving_average": lambda: MovingAverageProcessor(window=5, threshold=0.15, max_dt=0.5),
+        "legacy/kalman": lambda: KalmanFilterProcessor(threshold=0.10),
+        "legacy/kalman_accel": lambda: KalmanFilterAccelProcessor(),
+        "legacy/one_euro": lambda: OneEuroFilterProcesser(min_cutoff=0.3, beta=0.5, d_cutoff=0.3),
+    }
+
+def chain_candidates(specs):
+    return {f"chain/{spec}": (lambda spec=spec: SmoothingChain(spec)) for spec in specs}
+
+def synthetic_trajectory(n, seed, fps=30.0, noise=0.003, spike_rate=0.01, dropout_rate=0.01, gap_rate=0.003):
+    # 真値は頭のゆっくりした動きと時々の素早い移動、観測はそれにノイズ・スパイク・デプス欠損・dt の飛びを加えたもの
+    rng = np.random.default_rng(seed)
+    dt = rng.normal(1 / fps, 0.15 / fps, n).clip(0.3 / fps, None)
+    dt[rng.random(n) < 0.05] *= 2  # フレーム落ち
+    gaps = rng.random(n) < gap_rate
+    dt[gaps] = rng.uniform(0.6, 2.0, gaps.sum())
+    dt[0] = 1 / fps
+    t = np.cumsum(dt)
+    center = np.stack((
+        0.08 * np.sin(0.9 * t) + 0.02 * np.sin(3.1 * t),
+        0.04 * np.sin(0.6 * t + 1.0),
+        0.60 + 0.08 * np.sin(0.25 * t),
+    ), axis=-1)
+    # 素早い移動: ランダムな時刻に 5cm 程度ずつずれる段差を 0.15s かけて移動
+    for t0 in rng.uniform(t[0], t[-1], max(1, n // 300)):
+        step = rng.normal(0, 0.05, 3) * (1, 1, 0.5)
+        center += step * np.clip((t - t0) / 0.15, 0, 1)[:, None]
+    truth = np.stack((center + (0.032, 0, 0), center + (-0.032, 0, 0)), axis=1)
+    observed = truth + rng.normal(0, noise, truth.shape) * (1, 1, 2)
+    spikes = rng.random((n, 2)) < spike_rate
+    observed[spikes] += rng.normal(0, 0.25, (spikes.sum(), 3))
+    dropouts = rng.random((n, 2)) < dropout_rate
+    observed[dropouts] = 0.0  # デプスが 0 のときのデプロジェクション結果
+    return {"t": t, "dt": dt, "eye_pos": observed, "truth": truth,
+            "spikes": spikes | dropouts, "gaps": gaps}
+
+def load_trajectory(path):
+    if path.endswith(".npz"):
+        data = np.load(path)
+        t = np.asarray(data["t"], dtype=np.float64)
+        eye_pos = np.asarray(data["eye_pos"], dtype=np.float64).reshape(-1, 2, 3)
+        truth = np.asarray(data["truth"], dtype=np.float64).reshape(-1, 2, 3) if "truth" in data else None
+    else:
+        table = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+        t = table[:, 0]
+        eye_pos = table[:, 1:7].reshape(-1, 2, 3)
+        truth = table[:, 7:13].reshape(-1, 2, 3) if table.shape[1] >= 13 else None
+    dt = np.diff(t, prepend=t[0] - (np.median(np.diff(t)) if len(t) > 1 else 0.0))
+    spikes = np.all(eye_pos == 0, axis=-1)
+    if truth is None:
+        # 真値がない記録では、前後のフレームを使う中央値を参照にする (遅れを持たない)
+        truth = centered_median(eye_pos, 9)
+    return {"t": t, "dt": dt, "eye_pos": eye_pos, "truth": truth, "spikes": spikes, "gaps": dt > 0.5}
+
+def centered_median(x, window):
+    pad = window // 2
+    padded = np.concatenate((np.repeat(x[:1], pad, 0), x, np.repeat(x[-1:], pad, 0)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    return np.median(windows, axis=-1)
+
+def run(processor, eye_pos, dt):
+    out = np.empty_like(eye_pos)
+    latency = np.empty(len(eye_pos))
+    clock = time.perf_counter
+    for i in range(len(eye_pos)):
+        value = (eye_pos[i, 0].tolist(), eye_pos[i, 1].tolist())
+        start = clock()
+        result = processor.process(value, float(dt[i]))
+        latency[i] = clock() - start
+        out[i] = result
+    return out, latency
+
+def valid_mask(data, settle=10):
+    # スパイク・欠損のフレームと、ギャップ直後の settle フレームを品質指標から除く
+    mask = ~data["spikes"].any(axis=1)
+    for i in np.flatnonzero(data["gaps"]):
+        mask[i:i + settle] = False
+    return mask
+
+def rms(x):
+    return float(np.sqrt(np.mean(np.square(x)))) if x.size else 0.0
+
+def estimate_lag(t, out, truth, mask):
+    # out(t) と truth(t - lag) の差が最小になる lag を 1ms 刻みで探す
+    # 外れ値を引きずったフレームに左右されないよう、差の二乗の中央値で比べる
+    best_lag, best_err = 0.0, np.inf
+    ref = truth.reshape(len(t), -1)
+    values = out.reshape(len(t), -1)[mask]
+    for lag_ms in range(0, LAG_SEARCH_MS + 1):
+        shifted_t = t[mask] - lag_ms / 1000
+        inside = shifted_t >= t[0]
+        if inside.sum() < 10:
+            break
+        shifted = np.stack([np.interp(shifted_t[inside], t, ref[:, j]) for j in range(ref.shape[1])], axis=-1)
+        err = np.median(np.square(values[inside] - shifted).sum(axis=-1))
+        if err < best_err:
+            best_lag, best_err = lag_ms, err
+    return float(best_lag)
+
+def recovery_ms(t, out, truth, gaps):
+    # ギャップ後に誤差が SETTLE_TOLERANCE 以下に戻るまでの時間
+    times = []
+    err = np.abs(out - truth).max(axis=(1, 2))
+    for i in np.flatnonzero(gaps):
+        settled = np.flatnonzero(err[i:] <= SETTLE_TOLERANCE)
+        if settled.size:
+            times.append((t[i + settled[0]] - t[i]) * 1000)
+    return float(np.mean(times)) if times else None
+
+def evaluate(out, latency, data):
+    t, truth, observed = data["t"], data["truth"], data["eye_pos"]
+    mask = valid_mask(data)
+    in_err = (observed - truth)[mask]
+    out_err = (out - truth)[mask]
+    # ジッタはフレーム間で変化する誤差の成分 (誤差の差分の RMS)
+    # 差分は系列全体でとり、両方のフレームが有効な組だけを使う (除いたフレームをまたいだ差分を入れない)
+    pairs = mask[1:] & mask[:-1]
+    in_jitter = rms(np.diff(observed - truth, axis=0)[pairs])
+    out_jitter = rms(np.diff(out - truth, axis=0)[pairs])
+    spike_err = np.abs(out - truth).max(axis=-1)[data["spikes"]]
+    metrics = {
+        "error_mm": {"input_rms": rms(in_err) * 1000, "output_rms": rms(out_err) * 1000},
+        "jitter_mm": {"input": in_jitter * 1000, "output": out_jitter * 1000},
+        "jitter_reduction": 1.0 - out_jitter / in_jitter if in_jitter > 0 else 0.0,
+        "lag_ms": estimate_lag(t, out, truth, mask),
+        "outliers": {
+            "count": int(spike_err.size),
+            "passed": int(np.count_nonzero(spike_err > SPIKE_TOLERANCE)),
+            "max_error_mm": float(spike_err.max() * 1000) if spike_err.size else 0.0,
+        },
+        "gap_recovery_ms": recovery_ms(t, out, truth, data["gaps"]),
+    }
+    if latency is not None:
+        metrics["latency_us"] = {
+            "p50": float(np.percentile(latency, 50) * 1e6),
+            "p99": float(np.percentile(latency, 99) * 1e6),
+            "mean": float(latency.mean() * 1e6),
+        }
+        metrics["throughput_hz"] = float(1.0 / latency.mean())
+    return metrics
+
+def rounded(value, digits=4):
+    if isinstance(value, dict):
+        return {k: rounded(v, digits) for k, v in value.items()}
+    if isinstance(value, float):
+        return float(f"{value:.{digits}g}")
+    return value
+
+def compare(report, baseline):
+    # 前回のレポートとの差分を、遅延・ジッタ・遅れについてだけ表示する
+    for name, results in report["datasets"].items():
+        for candidate, metrics in results.items():
+            old = baseline.get("datasets", {}).get(name, {}).get(candidate)
+            if old is None or "latency_us" not in metrics:
+                continue
+            print(f"  {name} {candidate}: p99 {old['latency_us']['p99']:.1f} -> {metrics['latency_us']['p99']:.1f} us,"
+                  f" jitter {old['jitter_mm']['output']:.2f} -> {metrics['jitter_mm']['output']:.2f} mm,"
+                  f" lag {old['lag_ms']:.0f} -> {metrics['lag_ms']:.0f} ms", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay eye trajectories through the smoothing filters and report metrics.")
+    parser.add_argument("inputs", nargs="*", help=".npz or .csv trajectories (default: synthetic only)")
+    parser.add_argument("--samples", type=int, default=3000, help="length of each synthetic trajectory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chain", action="append", default=None,
+                        help='smoothing chain to include, e.g. "outlier,kalman,one_euro" (repeatable)')
+    parser.add_argument("--no-legacy", action="store_true", help="skip the eye_processor classes")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    datasets = {
+        "synthetic/clean": synthetic_trajectory(args.samples, args.seed, spike_rate=0, dropout_rate=0, gap_rate=0),
+        "synthetic/noisy": synthetic_trajectory(args.samples, args.seed + 1),
+        "synthetic/dropouts": synthetic_trajectory(args.samples, args.seed + 2, spike_rate=0.03, dropout_rate=0.05, gap_rate=0.01),
+    }
+    for path in args.inputs:
+        datasets[path] = load_trajectory(path)
+    candidates = {} if args.no_legacy else legacy_candidates()
+    candidates.update(chain_candidates(args.chain or ["one_euro", "kalman", "outlier,kalman,one_euro"]))
+
+    report = {
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()},
+        "seed": args.seed,
+        "datasets": {},
+    }
+    for name, data in datasets.items():
+        print(f"{name}: {len(data['t'])} samples, {data['spikes'].sum()} outlier eye samples, {data['gaps'].sum()} gaps",
+              file=sys.stderr)
+        results = {"raw": rounded(evaluate(data["eye_pos"], None, data))}
+        for candidate, make in candidates.items():
+            out, latency = run(make(), data["eye_pos"], data["dt"])
+            results[candidate] = rounded(evaluate(out, latency, data))
+            m = results[candidate]
+            print(f"  {candidate:36s} p50 {m['latency_us']['p50']:7.1f} us  p99 {m['latency_us']['p99']:7.1f} us"
+                  f"  jitter reduction {m['jitter_reduction'] * 100:6.1f} %  lag {m['lag_ms']:4.0f} ms"
+                  f"  outliers passed {m['outliers']['passed']}/{m['outliers']['count']}", file=sys.stderr)
+        report["datasets"][name] = results
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
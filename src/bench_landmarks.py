@@ -0,0 +1,147 @@
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from bench_face_roi import face_frames
+from landmark_backends import LANDMARK_BACKENDS, create_backend
+
+# ランドマークの backend ごとの推論時間と、目の位置の一致度
+# 同じフレーム (記録ファイル、なければ合成した顔) を backend ごとに頭から順に流し、
+# process の時間と、検出率・信頼度、基準の backend (既定は FaceMesh) との目の位置の差 (px) を出す
+# 差は両方が顔を見つけたフレームだけで、右目・左目のうち大きい方の距離をとる
+
+class RecordedFrames:
+    # 記録ファイルのカラーを RealSenseModel と同じ RGB (と反転) にして返す。全フレームはメモリに載せない
+    def __init__(self, path, flip, count):
+        from recording import ReplaySource
+        self.source = ReplaySource(path, realtime=False)
+        self.flip = flip
+        self.count = min(count, self.source.frame_count) if count else self.source.frame_count
+        self.width, self.height = self.source.width, self.source.height
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        image = np.asarray(self.source.color[i])
+        if self.source.color_format == "yuyv":
+            image = cv2.cvtColor(image, cv2.COLOR_YUV2RGB_YUYV)
+        elif self.source.color_format == "bgr8":
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        else:
+            image = np.ascontiguousarray(image)
+        if self.flip:
+            image = cv2.flip(image, -1)
+        return image
+
+    def close(self):
+        self.source.stop()
+
+def run(name, frames, width, height, warmup):
+    backend = create_backend(name)
+    for i in range(min(warmup, len(frames))):
+        backend.process(frames[i])
+    times, eyes, confidences = [], [], []
+    try:
+        for i in range(len(frames)):
+            image = frames[i]
+            start = time.perf_counter()
+            faces = backend.process(image)
+            times.append(time.perf_counter() - start)
+            if faces:
+                face = max(faces, key=lambda face: face.confidence)
+                eyes.append(face.eyes * (width, height))
+                confidences.append(face.confidence)
+            else:
+                eyes.append(None)
+    finally:
+        backend.close()
+    return np.array(times) * 1000, eyes, confidences
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare landmark backends on the same frames: latency and eye agreement.")
+    parser.add_argument("--replay", help="recording (.rec) to read the frames from (default: synthetic faces)")
+    parser.add_argument("--flip", action="store_true", help="rotate recorded frames by 180 degrees like flip=1")
+    parser.add_argument("--backends", default=",".join(LANDMARK_BACKENDS), help="comma separated backends")
+    parser.add_argument("--reference", default="face_mesh", help="backend the eye positions are compared against")
+    parser.add_argument("--frames", type=int, default=150, help="frames to run (0: whole recording)")
+    parser.add_argument("--warmup", type=int, default=5, help="frames run before timing (not counted)")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--face-scale", type=float, default=0.6, help="face size relative to the image height")
+    parser.add_argument("--face-image", help="photo of a face to use instead of the drawn one")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    names = args.backends.split(",")
+    for name in names + [args.reference]:
+        if name not in LANDMARK_BACKENDS:
+            raise SystemExit(f"unknown backend: {name}")
+    if args.reference in names:
+        # 基準を先に流して、他の backend と比べられるようにする
+        names.remove(args.reference)
+        names.insert(0, args.reference)
+
+    if args.replay:
+        frames = RecordedFrames(args.replay, args.flip, args.frames)
+        width, height = frames.width, frames.height
+        print(f"{args.replay}: {len(frames)} frames {width}x{height}")
+    else:
+        face_image = None
+        if args.face_image:
+            face_image = cv2.imread(args.face_image)
+            if face_image is None:
+                raise SystemExit(f"cannot read {args.face_image}")
+            face_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
+        width, height = args.width, args.height
+        frames = face_frames(width, height, args.frames or 150, args.face_scale, face_image)
+        print(f"synthetic faces: {len(frames)} frames {width}x{height}")
+
+    results = []
+    reference = None
+    print(f"{'backend':>10s}  {'mean ms':>8s}  {'p50 ms':>7s}  {'p95 ms':>7s}  {'found':>6s}  {'conf':>5s}"
+          f"  {'agree':>6s}  {'eye p50 px':>10s}  {'eye p95 px':>10s}")
+    try:
+        for name in names:
+            try:
+                times, eyes, confidences = run(name, frames, width, height, args.warmup)
+            except (ImportError, AttributeError, RuntimeError) as e:
+                print(f"{name:>10s}  unavailable: {e}")
+                continue
+            if name == args.reference:
+                reference = eyes
+            errors = []
+            if reference is not None:
+                errors = [float(np.linalg.norm(eye - ref, axis=1).max()) for eye, ref in zip(eyes, reference)
+                          if eye is not None and ref is not None]
+            found = sum(eye is not None for eye in eyes)
+            reference_found = sum(ref is not None for ref in reference) if reference is not None else 0
+            row = {
+                "backend": name,
+                "mean_ms": float(times.mean()), "p50_ms": float(np.percentile(times, 50)),
+                "p95_ms": float(np.percentile(times, 95)),
+                "found": found / len(eyes),
+                "mean_confidence": float(np.mean(confidences)) if confidences else None,
+                # 基準が見つけたフレームのうち、この backend も見つけた割合
+                "agreement": len(errors) / reference_found if reference_found else None,
+                "eye_error_p50_px": float(np.percentile(errors, 50)) if errors else None,
+                "eye_error_p95_px": float(np.percentile(errors, 95)) if errors else None,
+            }
+            results.append(row)
+            confidence = f"{row['mean_confidence']:5.2f}" if confidences else f"{'-':>5s}"
+            agreement = f"{row['agreement'] * 100:5.0f}%" if row["agreement"] is not None else f"{'-':>6s}"
+            error = (f"{row['eye_error_p50_px']:10.2f}  {row['eye_error_p95_px']:10.2f}" if errors
+                     else f"{'-':>10s}  {'-':>10s}")
+            print(f"{name:>10s}  {row['mean_ms']:8.2f}  {row['p50_ms']:7.2f}  {row['p95_ms']:7.2f}"
+                  f"  {row['found'] * 100:5.0f}%  {confidence}  {agreement}  {error}", flush=True)
+    finally:
+        if args.replay:
+            frames.close()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"reference": args.reference, "frames": len(frames), "results": results}, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
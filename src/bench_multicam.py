@@ -0,0 +1,67 @@
+import argparse
+import functools
+import json
+import threading
+import time
+from settings import DEFAULT_CONFIG, validate_config
+from multi_camera import MultiCameraRunner
+from bench_e2e import SyntheticSource
+
+# カメラの台数に対する処理量の測定
+# 合成カメラ (bench_e2e の SyntheticSource) を台数分のプロセスで最大速度で動かし、カメラごと / 融合後の fps を見る
+# カメラごとの処理がプロセスで並列に動いていれば、コア数までは台数を増やしてもカメラごとの fps は下がらない
+
+def synthetic_source(width, height, fps, realtime, face_image=None):
+    # 子プロセスで呼ばれる (spawn で渡せるようにモジュールの関数にしておく)
+    return SyntheticSource(width, height, fps, realtime=realtime, face_image=face_image)
+
+def run(count, args):
+    config = validate_config(dict(
+        DEFAULT_CONFIG, depth_mode=args.depth_mode, align_mode=args.align_mode, output="shm",
+        shm_name="eyetracker-bench-multicam", cameras=[{"serial": f"synthetic{i}"} for i in range(count)],
+        stats_interval=0.5
+    ))
+    factory = functools.partial(synthetic_source, args.width, args.height, args.fps, not args.max_rate)
+    runner = MultiCameraRunner(config, [factory] * count)
+    timer = threading.Timer(args.duration, runner.stop)
+    timer.start()
+    start = time.perf_counter()
+    runner.run()
+    elapsed = time.perf_counter() - start
+    timer.cancel()
+    # プロセスの起動 (import) に時間がかかるので、fps は各カメラが送ってきた直近の統計と融合後の直近の間隔から求める
+    return {
+        "cameras": count,
+        "camera_fps": [stats.get("fps", 0.0) for stats in runner.camera_stats],
+        "fused_fps": float(runner.fps_timer.get_fps()),
+        "camera_poses": runner.camera_poses,
+        "fused_poses": runner.fused,
+        "elapsed_s": elapsed,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure multi-camera throughput with synthetic cameras.")
+    parser.add_argument("--cameras", default="1,2,3", help="comma separated camera counts")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run (includes process start-up)")
+    parser.add_argument("--max-rate", action="store_true", help="feed frames as fast as they are consumed")
+    parser.add_argument("--depth-mode", default="roi")
+    parser.add_argument("--align-mode", default="project")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    for count in [int(n) for n in args.cameras.split(",")]:
+        result = run(count, args)
+        results.append(result)
+        per_camera = "  ".join(f"{fps:.1f}" for fps in result["camera_fps"])
+        print(f"{count} camera(s): per camera fps {per_camera}   fused {result['fused_fps']:.1f} fps", flush=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
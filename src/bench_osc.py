@@ -0,0 +1,133 @@
+import argparse
+import json
+import socket
+import time
+from pythonosc import udp_client
+from osc_sender import OSCSender
+
+# OSC 送信先の数に対するフレームあたりの送信コストの測定
+# OSCSender の fan-out (フレームごとに 1 回エンコードして 1 つのソケットから全送信先へ送る) と、
+# 送信先ごとに python-osc のクライアントを持ってそれぞれエンコードする場合 (リレーを並べるのと同じ) を比べる
+# 送信先はローカルで bind した UDP ソケットで、測定の区切りごとに受信バッファを空にする
+# --unreachable では送れない送信先を先頭に置いて、残りの送信先に全フレームが届くかと送信先ごとの失敗数を確かめる
+# (ポート 0 への sendto は毎回 EINVAL になるので、環境によらず届かない送信先 (EHOSTUNREACH など) の代わりになる)
+
+EYE_POS = ((0.031, -0.012, 0.552), (-0.032, -0.011, 0.561))
+UNREACHABLE = {"ip": "127.0.0.1", "port": 0}
+
+class Receivers:
+    def __init__(self, count):
+        self.socks = []
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            sock.bind(("127.0.0.1", 0))
+            sock.setblocking(False)
+            self.socks.append(sock)
+        self.ports = [sock.getsockname()[1] for sock in self.socks]
+
+    def drain(self):
+        counts = []
+        for sock in self.socks:
+            count = 0
+            try:
+                while True:
+                    sock.recv(65536)
+                    count += 1
+            except BlockingIOError:
+                pass
+            counts.append(count)
+        return counts
+
+    def close(self):
+        for sock in self.socks:
+            sock.close()
+
+def fanout(ports, bundle):
+    sender = OSCSender("127.0.0.1", ports[0], bundle=bundle,
+                       destinations=[{"ip": "127.0.0.1", "port": port} for port in ports[1:]])
+    return lambda eye_pos: sender.send(eye_pos, 1.7e12)
+
+def per_client(ports):
+    clients = [udp_client.SimpleUDPClient("127.0.0.1", port) for port in ports]
+
+    def send(eye_pos):
+        for client in clients:
+            client.send_message("/eye/right", eye_pos[0])
+            client.send_message("/eye/left", eye_pos[1])
+            client.send_message("/eye/center", [(eye_pos[0][i] + eye_pos[1][i]) / 2 for i in range(3)])
+    return send
+
+def check_unreachable(count, frames, bundle):
+    receivers = Receivers(count)
+    sender = OSCSender(UNREACHABLE["ip"], UNREACHABLE["port"], bundle=bundle,
+                       destinations=[{"ip": "127.0.0.1", "port": port} for port in receivers.ports])
+    for _ in range(frames):
+        sender.send(EYE_POS, 1.7e12)
+    received = receivers.drain()
+    receivers.close()
+    # bundle なら 1 フレーム 1 データグラム、そうでなければ right/left/center の 3 つ
+    expected = frames * (1 if bundle else 3)
+    return received, expected, sender.failures()
+
+def measure(send, receivers, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        receivers.drain()
+        start = time.perf_counter()
+        for _ in range(frames):
+            send(EYE_POS)
+        elapsed = (time.perf_counter() - start) / frames
+        best = elapsed if best is None else min(best, elapsed)
+    receivers.drain()
+    return best * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-frame OSC send cost against the number of destinations.")
+    parser.add_argument("--destinations", default="1,2,4,8,16", help="comma separated destination counts")
+    parser.add_argument("--frames", type=int, default=2000, help="frames per measurement")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--unreachable", action="store_true",
+                        help="check delivery with a failing destination listed first instead of timing")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.unreachable:
+        results = []
+        for count in [int(n) for n in args.destinations.split(",")]:
+            for bundle in (True, False):
+                received, expected, failures = check_unreachable(count, args.frames, bundle)
+                failed = failures[f"{UNREACHABLE['ip']}:{UNREACHABLE['port']}"]
+                results.append({"destinations": count, "bundle": bundle, "received": received,
+                                 "expected": expected, "unreachable_failed": failed})
+                print(f"{count:3d} destinations  {'bundle' if bundle else 'messages':>8s}"
+                      f"  received {min(received)}-{max(received)} / {expected}"
+                      f"  failed sends to {UNREACHABLE['ip']}:{UNREACHABLE['port']}: {failed}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+                f.write("\n")
+        return
+
+    methods = (
+        ("fan-out bundle", lambda ports: fanout(ports, True)),
+        ("fan-out messages", lambda ports: fanout(ports, False)),
+        ("client per destination", per_client),
+    )
+    results = []
+    print(f"{'destinations':>12s}" + "".join(f"  {name:>22s}" for name, _ in methods) + "   (us/frame)")
+    for count in [int(n) for n in args.destinations.split(",")]:
+        receivers = Receivers(count)
+        row = {"destinations": count}
+        for name, factory in methods:
+            row[name] = measure(factory(receivers.ports), receivers, args.frames, args.repeat)
+        receivers.close()
+        results.append(row)
+        print(f"{count:12d}" + "".join(f"  {row[name]:22.1f}" for name, _ in methods))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import time
+import numpy as np
+from PIL import ImageTk
+from view import prepare_preview
+
+# プレビュー表示にかかる CPU 時間の測定
+# 設定ごとに 1 フレームあたりの CPU 時間を測り、その周期で更新したときの CPU 使用率に換算する
+# ディスプレイがない環境では PhotoImage への転送を除いた分だけを測る
+
+def measure(frame, scale, tk_root, reuse, iterations):
+    imgtk = None
+    prepare_preview(frame, scale)  # warm-up
+    start = time.process_time()
+    for _ in range(iterations):
+        im = prepare_preview(frame, scale)
+        if tk_root is not None:
+            if imgtk is None or not reuse:
+                imgtk = ImageTk.PhotoImage(image=im, master=tk_root)
+            else:
+                imgtk.paste(im)
+    return (time.process_time() - start) / iterations
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure CPU cost of the preview at different rates and resolutions.")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--tracking-fps", type=float, default=90)
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    tk_root = None
+    try:
+        import tkinter as tk
+        tk_root = tk.Tk()
+        tk_root.withdraw()
+    except Exception as e:
+        print(f"no display ({e}); PhotoImage conversion is not included")
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+
+    # 変更前: トラッキングの毎フレームで全解像度の PhotoImage を新規に作る
+    per_frame = measure(frame, 1.0, tk_root, False, args.iterations)
+    print(f"{args.width}x{args.height}")
+    print(f"  before: full size, new PhotoImage, {args.tracking_fps:g} Hz  "
+          f"{per_frame * 1e3:6.2f} ms/frame  {per_frame * args.tracking_fps * 100:5.1f} % CPU")
+    for scale in (1.0, 0.5, 0.25):
+        per_frame = measure(frame, scale, tk_root, True, args.iterations)
+        for rate in (30, 15, 5):
+            print(f"  scale {scale:4.2f} @ {rate:2d} Hz  {per_frame * 1e3:6.2f} ms/frame  {per_frame * rate * 100:5.1f} % CPU")
+    if tk_root is not None:
+        tk_root.destroy()
+
+if __name__ == "__main__":
+    main()
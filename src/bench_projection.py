@@ -0,0 +1,107 @@
+import argparse
+import time
+import numpy as np
+import pyrealsense2 as rs
+from geometry import ColorToDepthProjector, deproject_pixels, transform_points, project_points
+from software_camera import SoftwareCamera
+
+# rs.align によるフレーム全体の位置合わせと、目の画素だけをデプス画像へ投影する方式の比較
+# カメラ不要: rs.software_device に合成したデプス画像（背景の平面 + 頭部の球）を流す
+
+def render_depth(intrinsics, head_center, head_radius, background, depth_units):
+    # デプスカメラの各画素の視線と球/平面の交点を求める
+    u, v = np.meshgrid(np.arange(intrinsics.width), np.arange(intrinsics.height))
+    rays = deproject_pixels(intrinsics, np.stack((u.ravel(), v.ravel()), axis=-1), np.ones(u.size))
+    rays /= np.linalg.norm(rays, axis=1, keepdims=True)
+    b = rays @ head_center
+    disc = b * b - (head_center @ head_center - head_radius * head_radius)
+    hit = disc > 0
+    t = np.where(hit, b - np.sqrt(np.where(hit, disc, 0)), background / rays[:, 2])
+    depth = t * rays[:, 2]
+    return (depth / depth_units).astype(np.uint16).reshape(intrinsics.height, intrinsics.width)
+
+def project_eyes(projector, depth_data, depth_frame, color_pixels):
+    # RealSenseModel.lookup_depths の project モードと同じ処理
+    depth_pixels = [projector.project_pixel(depth_data, (int(px), int(py))) for px, py in color_pixels]
+    depths = [
+        depth_frame.get_distance(*pixel) if pixel is not None else 0.0 for pixel in depth_pixels
+    ]
+    found = [pixel if pixel is not None else (0, 0) for pixel in depth_pixels]
+    return depth_pixels, projector.depth_in_color_frame(found, depths)
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1e3
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare rs.align with per-landmark color-to-depth projection.")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    camera = SoftwareCamera(args.width, args.height)
+    depth_scale = camera.depth_units
+    projector = ColorToDepthProjector(
+        camera.color_intrinsics, camera.depth_intrinsics,
+        camera.color_to_depth, camera.depth_to_color, depth_scale
+    )
+    align = rs.align(rs.stream.color)
+    color = np.full((args.height, args.width, 3), 128, dtype=np.uint8)
+
+    align_times, rs_project_times, np_project_times = [], [], []
+    depth_errors, pixel_errors = [], []
+    valid_pairs = 0
+    total_pairs = 0
+    for _ in range(args.frames):
+        head_center = np.array([rng.uniform(-0.15, 0.15), rng.uniform(-0.1, 0.1), rng.uniform(0.4, 1.2)])
+        # 頭部の球は深度カメラ座標系で置く
+        depth = render_depth(camera.depth_intrinsics, head_center, 0.09, 2.0, depth_scale)
+        camera.push(color, depth)
+        frames = camera.wait_for_frames()
+
+        # 目の位置: 頭部中心の左右を少し手前側に置き、カラー画像上の画素を求める
+        eyes = head_center + np.array([[-0.032, -0.01, -0.07], [0.032, -0.01, -0.07]])
+        color_pixels = project_points(camera.color_intrinsics, transform_points(camera.depth_to_color, eyes))
+
+        t0 = time.perf_counter()
+        aligned = align.process(frames)
+        aligned_depth = aligned.get_depth_frame()
+        aligned_values = [
+            aligned_depth.get_distance(int(px), int(py)) for px, py in color_pixels
+        ]
+        t1 = time.perf_counter()
+        depth_frame = frames.get_depth_frame()
+        rs_pixels, rs_values = project_eyes(projector, depth_frame.get_data(), depth_frame, color_pixels)
+        t2 = time.perf_counter()
+        depth_arr = np.asanyarray(depth_frame.get_data())
+        np_pixels, np_values = project_eyes(projector, depth_arr, depth_frame, color_pixels)
+        t3 = time.perf_counter()
+
+        align_times.append(t1 - t0)
+        rs_project_times.append(t2 - t1)
+        np_project_times.append(t3 - t2)
+        for aligned_value, rs_pixel, rs_value, np_pixel in zip(aligned_values, rs_pixels, rs_values, np_pixels):
+            total_pairs += 1
+            if rs_pixel is not None and np_pixel is not None:
+                pixel_errors.append(np.hypot(rs_pixel[0] - np_pixel[0], rs_pixel[1] - np_pixel[1]))
+            if aligned_value > 0 and rs_value > 0:
+                valid_pairs += 1
+                depth_errors.append(abs(aligned_value - rs_value))
+    camera.stop()
+
+    print(f"{args.width}x{args.height}, {args.frames} frames, 2 eyes per frame")
+    for name, samples in (("rs.align + get_distance", align_times),
+                          ("projection (rs frame buffer)", rs_project_times),
+                          ("projection (NumPy array)", np_project_times)):
+        print(f"  {name:40s} mean {np.mean(samples) * 1e3:7.3f} ms  p50 {percentile_ms(samples, 50):7.3f} ms  p99 {percentile_ms(samples, 99):7.3f} ms")
+    print(f"  valid pairs: {valid_pairs}/{total_pairs}")
+    if depth_errors:
+        depth_errors = np.array(depth_errors) * 1e3
+        print(f"  |aligned - projected| depth: median {np.median(depth_errors):.2f} mm  p95 {np.percentile(depth_errors, 95):.2f} mm  max {depth_errors.max():.2f} mm")
+    if pixel_errors:
+        print(f"  depth pixel distance, NumPy vs librealsense search: mean {np.mean(pixel_errors):.2f} px  max {np.max(pixel_errors):.2f} px")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from recording import FrameRecorder, ReplaySource, read_header, record_dtype
+from software_camera import make_intrinsics, make_extrinsics, inverse_extrinsics
+
+# 記録ファイルの再生速度の測定
+# mmap のビューを返す ReplaySource と、フレームごとにファイルから読み込む (コピーする) 場合を比べる
+# 再生側のコストがパイプラインの測定に混ざらないことを確かめるためのもの
+
+def write_synthetic(path, width, height, frames, fps):
+    depth_to_color = make_extrinsics((0.015, 0.0, 0.0))
+    recorder = FrameRecorder(
+        path, width, height, "rgb8", make_intrinsics(width, height, 69), make_intrinsics(width, height, 87),
+        inverse_extrinsics(depth_to_color), depth_to_color, 0.001, fps=fps
+    )
+    rng = np.random.default_rng(0)
+    color = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    depth = rng.integers(300, 1500, (height, width), dtype=np.uint16)
+    for i in range(frames):
+        t = i * 1000.0 / fps
+        recorder.write_arrays(color, depth, t, t, i, i)
+    recorder.close()
+
+def replay_mmap(path, touch):
+    source = ReplaySource(path, realtime=False)
+    count = 0
+    checksum = 0
+    try:
+        while True:
+            frames = source.wait_for_frames(0)
+            depth = frames.get_depth_frame().get_data()
+            if touch:
+                checksum += int(depth[::64, ::64].sum())
+            count += 1
+    except RuntimeError:
+        pass
+    source.stop()
+    return count
+
+def replay_read(path, touch):
+    header, offset = read_header(path)
+    dtype = record_dtype(header)
+    count = 0
+    checksum = 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            record = np.fromfile(f, dtype=dtype, count=1)
+            if len(record) == 0:
+                break
+            depth = record["depth"][0]
+            if touch:
+                checksum += int(depth[::64, ::64].sum())
+            count += 1
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure replay throughput of the recording format.")
+    parser.add_argument("recording", nargs="?", help="existing recording (default: write a synthetic one)")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    path = args.recording
+    temporary = path is None
+    if temporary:
+        fd, path = tempfile.mkstemp(suffix=".rec")
+        os.close(fd)
+        start = time.perf_counter()
+        write_synthetic(path, args.width, args.height, args.frames, 30)
+        elapsed = time.perf_counter() - start
+        print(f"wrote {args.frames} frames {args.width}x{args.height} in {elapsed:.2f} s"
+              f" ({args.frames / elapsed:.0f} fps, {os.path.getsize(path) / 2**20:.0f} MiB)")
+    try:
+        for touch in (False, True):
+            label = "header only" if not touch else "sparse read"
+            for name, func in (("mmap view", replay_mmap), ("read+copy", replay_read)):
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    count = func(path, touch)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                print(f"  {label:11s} {name:9s} {count / best:9.0f} fps  {best / count * 1e6:8.1f} us/frame")
+    finally:
+        if temporary:
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
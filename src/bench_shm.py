@@ -0,0 +1,130 @@
+import argparse
+import json
+import multiprocessing
+import socket
+import time
+from multiprocessing import resource_tracker
+import numpy as np
+from pythonosc.osc_bundle import OscBundle
+from osc_sender import OSCSender
+from shm_sink import SharedPoseSink, SharedPoseReader
+
+# 共有メモリ出力と OSC (UDP) 出力の、書き込んでから別プロセスの受信側が姿勢を得るまでの遅れの比較
+# 受信側は別プロセスで、共有メモリは read_new() をポーリング (空いたら sleep(0) で譲る)、
+# UDP は recv してから python-osc でデコードする。どちらも受信側で値を取り出し終えた時刻で測る
+# 時刻はプロセス間で共通の perf_counter_ns (Linux では CLOCK_MONOTONIC) を使う
+
+SHM_NAME = "eyetracker-bench"
+
+def shm_reader(ready, results, frames, timeout):
+    reader = SharedPoseReader(SHM_NAME)
+    latencies = []
+    read_times = []
+    seen = 0
+    ready.set()
+    deadline = time.perf_counter() + timeout
+    while seen < frames and time.perf_counter() < deadline:
+        start = time.perf_counter_ns()
+        pose = reader.read_new()
+        end = time.perf_counter_ns()
+        if pose is None:
+            time.sleep(0)
+            continue
+        read_times.append(end - start)
+        latencies.append(end - pose.write_time_ns)
+        seen = pose.count
+    reader.close()
+    results.put((latencies, read_times))
+
+def udp_reader(port_queue, ready, results, frames, timeout):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(timeout)
+    port_queue.put(sock.getsockname()[1])
+    arrivals = {}
+    read_times = []
+    ready.set()
+    try:
+        while len(arrivals) < frames:
+            data = sock.recv(65536)
+            start = time.perf_counter_ns()
+            right = [message.params for message in OscBundle(data)][0]
+            end = time.perf_counter_ns()
+            read_times.append(end - start)
+            arrivals[int(right[0])] = end
+    except socket.timeout:
+        pass
+    sock.close()
+    results.put((arrivals, read_times))
+
+def write_poses(send, frames, interval):
+    send_times = []
+    next_time = time.perf_counter()
+    for i in range(frames):
+        next_time += interval
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        send_times.append(time.perf_counter_ns())
+        send(((float(i), 0.01, 0.55), (0.06, 0.01, 0.56)), 1.7e12 + i)
+    return send_times
+
+def run_shm(frames, interval):
+    sink = SharedPoseSink(SHM_NAME)
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=shm_reader, args=(ready, results, frames, frames * interval + 5))
+    process.start()
+    ready.wait()
+    write_poses(sink.send, frames, interval)
+    latencies, read_times = results.get()
+    process.join()
+    # 子プロセスは親と同じ resource_tracker を使うので、読む側が外した登録を戻してから消す
+    resource_tracker.register(sink.shm._name, "shared_memory")
+    sink.close()
+    return np.array(latencies) / 1000, np.array(read_times) / 1000, frames - len(latencies)
+
+def run_udp(frames, interval):
+    port_queue = multiprocessing.Queue()
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=udp_reader,
+                                      args=(port_queue, ready, results, frames, frames * interval + 5))
+    process.start()
+    sender = OSCSender("127.0.0.1", port_queue.get(), bundle=True)
+    ready.wait()
+    send_times = write_poses(sender.send, frames, interval)
+    arrivals, read_times = results.get()
+    process.join()
+    latencies = [arrivals[i] - send_times[i] for i in range(frames) if i in arrivals]
+    return np.array(latencies) / 1000, np.array(read_times) / 1000, frames - len(latencies)
+
+def summary(values):
+    if values.size == 0:
+        return None
+    return {"p50": float(np.percentile(values, 50)), "p99": float(np.percentile(values, 99)),
+            "max": float(values.max()), "mean": float(values.mean())}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare pose delivery latency of shared memory and OSC over UDP.")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200.0, help="poses per second")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{args.frames} poses at {args.rate:.0f} Hz (write -> value decoded in another process)")
+    for name, run in (("shared memory", run_shm), ("osc udp bundle", run_udp)):
+        latencies, read_times, missed = run(args.frames, 1 / args.rate)
+        results[name] = {"latency_us": summary(latencies), "read_us": summary(read_times), "missed": missed}
+        lat, read = results[name]["latency_us"], results[name]["read_us"]
+        print(f"  {name:15s} latency us: p50 {lat['p50']:8.1f}  p99 {lat['p99']:8.1f}  max {lat['max']:8.1f}"
+              f"   read/decode us: p50 {read['p50']:5.1f}   missed {missed}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import time
+import numpy as np
+from settings import DEFAULT_CONFIG, validate_config, build_model
+from viewers import ViewerTracker
+from bench_e2e import SyntheticSource
+
+# 人数に対する FaceMesh 後の処理 (目のデプス参照 + デプロジェクション + 対応付け) のフレームあたりのコスト
+# 1 人ずつ lookup_depths / deprojection を呼ぶ場合と、全員の目をまとめて 1 回で処理する場合
+# (RealSenseModel.process_frames と ViewerTracker の経路) を、合成カメラのデプスフレームで比べる
+# FaceMesh 自体は含まない (顔の位置は画像上にランダムに置く)
+
+def face_pixels(rng, count, width, height):
+    # 顔の中心をランダムに置き、右目・左目を左右に並べる
+    centers = rng.uniform([0.2 * width, 0.3 * height], [0.8 * width, 0.7 * height], size=(count, 2))
+    offset = np.array([0.05 * width, 0.0])
+    return np.stack((centers - offset, centers + offset), axis=1).astype(np.int64)
+
+def per_face(model, depth_frame, pixels):
+    poses = []
+    for right, left in pixels:
+        depths = model.lookup_depths((right, left), depth_frame)
+        poses.append((model.deprojection(float(right[0]), float(right[1]), float(depths[0])),
+                      model.deprojection(float(left[0]), float(left[1]), float(depths[1]))))
+    return poses
+
+def batched(model, depth_frame, pixels, tracker):
+    flat = pixels.reshape(-1, 2)
+    depths = model.lookup_depths(flat, depth_frame)
+    faces = model.deproject_eyes(np.column_stack((flat, depths)).reshape(-1, 2, 3))
+    return tracker.associate(faces)
+
+def measure(fn, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(frames):
+            fn()
+        elapsed = (time.perf_counter() - start) / frames
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-frame depth lookup / deprojection cost against viewer count.")
+    parser.add_argument("--viewers", default="1,2,4,8", help="comma separated viewer counts")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--depth-mode", default="roi")
+    parser.add_argument("--align-mode", default="project")
+    parser.add_argument("--frames", type=int, default=300, help="frames per measurement")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    counts = [int(n) for n in args.viewers.split(",")]
+    config = validate_config(dict(DEFAULT_CONFIG, depth_mode=args.depth_mode, align_mode=args.align_mode,
+                                  max_viewers=max(counts + [2])))
+    model = build_model(config, SyntheticSource(args.width, args.height, realtime=False, frames=1))
+    frames = model.wait_frames()
+    depth_frame = frames.get_depth_frame()
+    model.update_depth_intrinsics(depth_frame)
+    rng = np.random.default_rng(args.seed)
+
+    results = []
+    print(f"{args.width}x{args.height}, depth {args.depth_mode}, align {args.align_mode} (us/frame)")
+    print(f"{'viewers':>8s}  {'per face':>10s}  {'batched':>10s}")
+    try:
+        for count in counts:
+            pixels = face_pixels(rng, count, args.width, args.height)
+            tracker = ViewerTracker(count)
+            row = {
+                "viewers": count,
+                "per_face_us": measure(lambda: per_face(model, depth_frame, pixels), args.frames, args.repeat),
+                "batched_us": measure(lambda: batched(model, depth_frame, pixels, tracker), args.frames, args.repeat),
+            }
+            results.append(row)
+            print(f"{count:8d}  {row['per_face_us']:10.1f}  {row['batched_us']:10.1f}")
+    finally:
+        model.close()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,11 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import pyrealsense2 as rs
 import ipaddress
+from model import DEPTH_MODES, ALIGN_MODES
+from face_roi import FACE_INPUT_MODES
+from landmark_backends import LANDMARK_BACKENDS
+from smoothing import SMOOTHING_PRESETS, format_chain
+from settings import OUTPUTS
 
 def enumerate_devices():
     ctx = rs.context()
@@ -69,6 +74,76 @@ class ConfigWindow:
         )
         self.flip_var = tk.IntVar()
         tk.Checkbutton(self.root, variable=self.flip_var).grid(row=row, column=1, padx=10, pady=10)
+        # Depth processing mode
+        row += 1
+        tk.Label(self.root, text="Depth filter:").grid(
+            row=row, column=0, padx=10, pady=10, sticky="w"
+        )
+        self.depth_mode_var = tk.StringVar(value=DEPTH_MODES[0])
+        ttk.Combobox(
+            self.root, textvariable=self.depth_mode_var, values=DEPTH_MODES, state="readonly", width=20
+        ).grid(row=row, column=1, padx=10, pady=10)
+        # Color-to-depth mapping mode
+        row += 1
+        tk.Label(self.root, text="Depth alignment:").grid(
+            row=row, column=0, padx=10, pady=10, sticky="w"
+        )
+        self.align_mode_var = tk.StringVar(value=ALIGN_MODES[0])
+        ttk.Combobox(
+            self.root, textvariable=self.align_mode_var, values=ALIGN_MODES, state="readonly", width=20
+        ).grid(row=row, column=1, padx=10, pady=10)
+        # 目の位置を求める backend
+        row += 1
+        tk.Label(self.root, text="Landmark backend:").grid(
+            row=row, column=0, padx=10, pady=10, sticky="w"
+        )
+        self.landmark_backend_var = tk.StringVar(value=LANDMARK_BACKENDS[0])
+        ttk.Combobox(
+            self.root, textvariable=self.landmark_backend_var, values=LANDMARK_BACKENDS, state="readonly", width=20
+        ).grid(row=row, column=1, padx=10, pady=10)
+        # backend の入力 (roi: 前フレームの顔の周りだけを切り出す)
+        row += 1
+        tk.Label(self.root, text="Face input:").grid(
+            row=row, column=0, padx=10, pady=10, sticky="w"
+        )
+        self.face_input_var = tk.StringVar(value=FACE_INPUT_MODES[0])
+        ttk.Combobox(
+            self.root, textvariable=self.face_input_var, values=FACE_INPUT_MODES, state="readonly", width=20
+        ).grid(row=row, column=1, padx=10, pady=10)
+        # Smoothing stages (実行中はプレビュー画面からも変更できる)
+        row += 1
+        tk.Label(self.root, text="Smoothing:").grid(
+            row=row, column=0, padx=10, pady=10, sticky="w"
+        )
+        self.smoothing_var = tk.StringVar(value=SMOOTHING_PRESETS[0])
+        ttk.Combobox(
+            self.root, textvariable=self.smoothing_var, values=SMOOTHING_PRESETS, width=28
+        ).grid(row=row, column=1, padx=10, pady=10)
+        # 出力先 (shm: 同じマシンの受信側向けの共有メモリ)
+        row += 1
+        tk.Label(self.root, text="Output:").grid(
+            row=row, column=0, padx=10, pady=10, sticky="w"
+        )
+        self.output_var = tk.StringVar(value=OUTPUTS[0])
+        ttk.Combobox(
+            self.root, textvariable=self.output_var, values=OUTPUTS, state="readonly", width=20
+        ).grid(row=row, column=1, padx=10, pady=10)
+        # 送信時刻までの姿勢の予測 (スムージングに kalman か one_euro の段が必要)
+        row += 1
+        tk.Label(self.root, text="Latency prediction:").grid(
+            row=row, column=0, padx=10, pady=10, sticky="w"
+        )
+        self.predict_var = tk.IntVar(value=0)
+        tk.Checkbutton(self.root, variable=self.predict_var).grid(row=row, column=1, padx=10, pady=10)
+        # 2 人以上なら人ごとに /viewer/{id}/... のアドレスで送る
+        row += 1
+        tk.Label(self.root, text="Max viewers:").grid(
+            row=row, column=0, padx=10, pady=10, sticky="w"
+        )
+        self.max_viewers_var = tk.IntVar(value=1)
+        tk.Spinbox(self.root, from_=1, to=8, textvariable=self.max_viewers_var, width=5, state="readonly").grid(
+            row=row, column=1, padx=10, pady=10, sticky="w"
+        )
         # IP & Port entries
         row += 1
         tk.Label(self.root, text="IP address:").grid(
@@ -109,6 +184,12 @@ class ConfigWindow:
         self.osc_center_var = tk.IntVar(value=1)
         osc_center_cb = tk.Checkbutton(self.root, variable=self.osc_center_var, command=self.toggle_osc_center_entry)
         osc_center_cb.grid(row=row, column=2, padx=5, pady=5)
+        row += 1
+        # right/left/center を 1 フレーム 1 つの bundle で送る (受信側が bundle に対応している場合)
+        self.osc_bundle_var = tk.IntVar(value=0)
+        tk.Checkbutton(self.root, text="Send as one OSC bundle per frame", variable=self.osc_bundle_var).grid(
+            row=row, column=1, padx=10, pady=5, sticky="w"
+        )
 
         # Buttons
         row += 1
@@ -197,6 +278,15 @@ class ConfigWindow:
             return
         self.config["serial"] = self.device_serials[idx]
         self.config["flip"] = self.flip_var.get()
+        self.config["depth_mode"] = self.depth_mode_var.get()
+        self.config["align_mode"] = self.align_mode_var.get()
+        self.config["face_input"] = self.face_input_var.get()
+        self.config["landmark_backend"] = self.landmark_backend_var.get()
+        try:
+            self.config["smoothing"] = format_chain(self.smoothing_var.get())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         
         # Validate IP address
         ip_str = self.ip_entry.get().strip()
@@ -237,6 +327,10 @@ class ConfigWindow:
         self.config["osc_right_enable"] = bool(self.osc_right_var.get())
         self.config["osc_left_enable"] = bool(self.osc_left_var.get())
         self.config["osc_center_enable"] = bool(self.osc_center_var.get())
+        self.config["osc_bundle"] = bool(self.osc_bundle_var.get())
+        self.config["output"] = self.output_var.get()
+        self.config["predict"] = bool(self.predict_var.get())
+        self.config["max_viewers"] = self.max_viewers_var.get()
         self.root.destroy()
 
     def on_exit(self):
@@ -1,53 +1,109 @@
 import time
-from fps_timer import FPSTimer
-from eye_processor import MovingAverageProcessor, KalmanFilterProcessor, KalmanFilterAccelProcessor, OneEuroFilterProcesser
+import numpy as np
+from fps_timer import FrameStats, combine_stats
+from pipeline import TrackingPipeline
+from smoothing import SmoothingChain
+from tracing import tracer
+
+def format_eye_pos(eye_pos):
+    # 左目, 右目の順
+    return (f"({eye_pos[1][0]:.2f}, {eye_pos[1][1]:.2f}, {eye_pos[1][2]:.2f}),"
+            f" ({eye_pos[0][0]:.2f}, {eye_pos[0][1]:.2f}, {eye_pos[0][2]:.2f})")
 
 class Controller:
-    def __init__(self, model, view, info_text, osc_sender):
+    def __init__(self, model, view, info_text, output, smoothing=None, stats_interval=1.0, predictor=None,
+                 viewers=None):
         self.model = model
         self.view = view
         self.info_text = info_text
         self.running = True
-        self.fps_timer = FPSTimer(max_samples=30)
-        self.last_fps_update = time.time()
+        self.fps_timer = FrameStats(max_samples=30)
+        self.last_fps_update = time.monotonic()
+        self.last_stats_update = self.last_fps_update
+        self.stats_interval = stats_interval
         self.current_fps = 0
-        self.osc_sender = osc_sender
-        # self.moving_average_processor = MovingAverageProcessor(window=5, threshold=0.15, max_dt=0.5)
-        # self.kalman_filter_processor = KalmanFilterProcessor(threshold=0.10)
-        # self.kaleman_filter_accel_processor = KalmanFilterAccelProcessor()
-        # self.one_euro_filter_processor = OneEuroFilterProcesser(min_cutoff=0.3, beta=0.5, d_cutoff=0.3) 
+        self.output = output
+        self.pipeline = TrackingPipeline(model, self.process_output)
+        # スムージングの段は表示側から実行中に差し替えられる
+        self.smoothing = smoothing if smoothing is not None else SmoothingChain()
+        self.predictor = predictor
+        # 複数人のときの ViewerTracker (人ごとのスムージングは self.smoothing と同じ段で組み立てる)
+        self.viewers = viewers
+        self.view.set_smoothing_handler(self.set_smoothing, self.smoothing.describe())
 
-    def update_loop(self):
-        if not self.running:
-            return
-        frame, eye_pos = self.model.process_frame()
+    def start(self):
+        self.pipeline.start()
+        self.update_loop()
+
+    # output スレッドで実行される
+    def process_output(self, frame, eye_pos, landmarks, timestamp=None, arrival=None):
         self.fps_timer.update()
-        if frame is not None:
-            t = time.time()
-            if t - self.last_fps_update >= 0.5:
-                self.current_fps = self.fps_timer.get_fps()
-                self.last_fps_update = t
-            info_text = self.info_text
-            fps_text = f"{self.current_fps:.1f} fps"
-            eye_pos_text = "eye_pos:"
-            if eye_pos is not None:
+        t = time.monotonic()
+        if t - self.last_fps_update >= 0.5:
+            self.current_fps = self.fps_timer.get_fps()
+            self.last_fps_update = t
+        if t - self.last_stats_update >= self.stats_interval:
+            self.output.send_stats(combine_stats(self.model.frame_stats, self.fps_timer, self.output))
+            self.last_stats_update = t
+        fps_text = f"{self.current_fps:.1f} fps"
+        if self.smoothing.stages:
+            fps_text += "\n" + (self.viewers or self.smoothing).timing_text()
+        if self.model.propagator is not None:
+            fps_text += f"\nkeyframes {self.model.propagator.keyframe_ratio() * 100:.0f}%"
+        if self.predictor is not None:
+            fps_text += f"\npredict {self.predictor.last_horizon_ms:.0f} ms"
+        if self.viewers is not None:
+            return self.process_viewers(frame, eye_pos, landmarks, timestamp, arrival, fps_text)
+        eye_pos_text = "eye_pos:"
+        if eye_pos is not None:
+            with tracer.span("deprojection"):
                 right_eye = self.model.deprojection(eye_pos[0][0], eye_pos[0][1], eye_pos[0][2])
                 left_eye = self.model.deprojection(eye_pos[1][0], eye_pos[1][1], eye_pos[1][2])
-                eye_pos = (right_eye, left_eye)
-                # map_eye_pos = self.moving_average_processor.process(eye_pos, dt)
-                # kp_eye_pos = self.kalman_filter_processor.process(eye_pos, dt)
-                # eye_pos = self.kalman_filter_processor.process(eye_pos, dt)
-                # eye_pos = self.moving_average_processor.process(eye_pos, dt)
-                # eye_pos = self.kaleman_filter_accel_processor.process(eye_pos, dt)
-                # eye_pos = self.one_euro_filter_processor.process(eye_pos, dt)
-                self.osc_sender.send(eye_pos)
-                eye_pos_text += f"({eye_pos[1][0]:.2f}, {eye_pos[1][1]:.2f}, {eye_pos[1][2]:.2f}), ({eye_pos[0][0]:.2f}, {eye_pos[0][1]:.2f}, {eye_pos[0][2]:.2f})"
-            else:
-                eye_pos_text += "not detected"
-            self.view.update(frame, info_text, fps_text, eye_pos_text)
-        self.view.after(1, self.update_loop)
+            with tracer.span("smoothing"):
+                eye_pos = self.smoothing.process((right_eye, left_eye))
+            if self.predictor is not None:
+                with tracer.span("prediction"):
+                    eye_pos = self.predictor.predict(eye_pos, self.smoothing.motion(), timestamp, arrival)
+            eye_pos_text += format_eye_pos(eye_pos)
+        else:
+            eye_pos_text += "not detected"
+        # 顔を見失ったことも出力先に渡す (共有メモリは flags で伝え、OSC は何も送らない)
+        with tracer.span("output"):
+            self.output.send(eye_pos, timestamp)
+        return frame, landmarks, fps_text, eye_pos_text
+
+    def process_viewers(self, frame, faces, landmarks, timestamp, arrival, fps_text):
+        # faces: 全員分の目の (N, 2, 3) の配列 (誰もいなければ None)。デプロジェクションもまとめて 1 回で行う
+        # 対応付けで ID を決めてから、その ID ごとのデプスの履歴で座標を求める
+        with tracer.span("deprojection"):
+            matches, faces = self.model.locate_viewers(faces if faces is not None else np.empty((0, 2, 3)), self.viewers)
+        with tracer.span("smoothing"):
+            poses = self.viewers.smooth(matches, faces, self.predictor, timestamp, arrival)
+        eye_pos_text = "\n".join(f"viewer {viewer}: {format_eye_pos(eye_pos)}" for viewer, eye_pos in poses)
+        with tracer.span("output"):
+            self.output.send_viewers(poses, timestamp)
+        return frame, landmarks, fps_text, eye_pos_text or "eye_pos:not detected"
+
+    def set_smoothing(self, spec):
+        self.smoothing.set_stages(spec)
+        if self.viewers is not None:
+            self.viewers.set_smoothing(spec)
+        return self.smoothing.describe()
+
+    # Tk スレッドでは完成した結果の表示だけを行う
+    def update_loop(self):
+        if not self.running:
+            return
+        result = self.pipeline.poll()
+        if result is not None:
+            frame, landmarks, fps_text, eye_pos_text = result
+            with tracer.span("view_update"):
+                self.view.update(frame, self.info_text, fps_text, eye_pos_text, landmarks)
+        self.view.after(self.view.preview_interval_ms, self.update_loop)
 
     def stop(self):
         self.running = False
+        self.pipeline.stop()
+        self.output.close()
         self.model.close()
         self.view.destroy()
@@ -0,0 +1,133 @@
+import numpy as np
+
+# RealSense の spatial / temporal / hole filling フィルタを目の周辺の小さな窓だけに適用する NumPy 実装
+# 窓は前フレームの位置から追跡し、移動量に合わせて temporal の履歴をずらして使う
+# 値はメートル単位で扱い、0 を無効画素とする（delta もメートル）
+HOLES_FILL_FROM_LEFT = 0
+HOLES_FILL_FAREST = 1
+HOLES_FILL_NEAREST = 2
+
+class RoiDepthFilter:
+    def __init__(self, radius=6, spatial_alpha=0.35, spatial_delta=0.02, spatial_iterations=2,
+                 temporal_alpha=0.1, temporal_delta=0.03, holes_fill=HOLES_FILL_FAREST):
+        self.radius = radius
+        self.size = 2 * radius + 1
+        self.spatial_alpha = spatial_alpha
+        self.spatial_delta = spatial_delta
+        self.spatial_iterations = spatial_iterations
+        self.temporal_alpha = temporal_alpha
+        self.temporal_delta = temporal_delta
+        self.holes_fill = holes_fill
+        offsets = np.arange(self.size)
+        self.rows = offsets[None, :, None]
+        self.cols = offsets[None, None, :]
+        # temporal の履歴はキー (同じ人の同じ目なら毎フレーム同じ値) ごとに前フレームの (窓の原点, 窓) を持つ
+        self.history = {}
+        # keys を後で渡すときの、spatial まで済ませた今フレームの窓
+        self.pending = None
+        self.patches = None
+
+    def reset(self):
+        self.history = {}
+        self.pending = None
+
+    def process(self, depth_arr, pixels, depth_scale, keys=None):
+        # depth_arr: 生の z16 バッファ (H, W)、pixels: デプス画像上の (x, y) のリスト
+        # keys: 各画素の履歴のキー。None なら temporal を掛けずに返し、キーが決まってから apply_history で掛ける
+        # (複数人では、誰の目かはこのデプスで座標を求めて対応付けるまでわからない)
+        origins = np.asarray(pixels, dtype=np.int64).reshape(-1, 2) - self.radius
+        patches = self._crop(depth_arr, origins).astype(np.float32)
+        patches *= depth_scale
+        self._spatial(patches)
+        self.pending = (origins, patches)
+        if keys is not None:
+            return self.apply_history(keys)
+        patches = patches.copy()
+        self._fill_holes(patches)
+        self.patches = patches
+        return patches[:, self.radius, self.radius]
+
+    def apply_history(self, keys, rows=None):
+        # process で保持した窓のうち rows 番目 (None なら全部) に、keys の履歴で temporal を掛けて中心の値を返す
+        # 履歴は今回のキーのものだけに置き換える
+        origins, patches = self.pending
+        if rows is not None:
+            origins, patches = origins[rows], patches[rows]
+        patches = self._temporal(patches, origins, keys)
+        self.history = {key: (origin, patch) for key, origin, patch in zip(keys, origins, patches.copy())}
+        self._fill_holes(patches)
+        self.patches = patches
+        return patches[:, self.radius, self.radius]
+
+    def _crop(self, depth_arr, origins):
+        # 全部の窓の画素をまとめて添字で読み出し、画像の外は 0 (無効) にする
+        height, width = depth_arr.shape
+        ys = origins[:, 1, None, None] + self.rows
+        xs = origins[:, 0, None, None] + self.cols
+        inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+        out = depth_arr[np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1)]
+        out[~inside] = 0
+        return out
+
+    def _spatial(self, patches):
+        # エッジ保存型の再帰フィルタ: 左右・上下の往復パスを iterations 回
+        # 無効画素 (0) との差は delta を必ず超えるので、差分の判定だけで除外される
+        gain = 1 - self.spatial_alpha
+        delta = self.spatial_delta
+        size = self.size
+        diff = np.empty((patches.shape[0], size), dtype=patches.dtype)
+        for _ in range(self.spatial_iterations):
+            for axis in (2, 1):
+                lines = np.moveaxis(patches, axis, 0)
+                for indices, step in ((range(1, size), 1), (range(size - 2, -1, -1), -1)):
+                    for i in indices:
+                        cur = lines[i]
+                        np.subtract(lines[i - step], cur, out=diff)
+                        diff[np.abs(diff) >= delta] = 0
+                        diff *= gain
+                        cur += diff
+
+    def _temporal(self, patches, origins, keys):
+        known = [i for i, key in enumerate(keys) if key in self.history]
+        if not known:
+            return patches
+        prev = np.zeros_like(patches)
+        prev_origins = np.array([self.history[keys[i]][0] for i in known])
+        prev_patches = np.stack([self.history[keys[i]][1] for i in known])
+        prev[known] = self._shift_history(prev_patches, origins[known] - prev_origins)
+        valid_cur = patches > 0
+        valid_prev = prev > 0
+        alpha = self.temporal_alpha
+        blend = valid_cur & valid_prev & (np.abs(patches - prev) < self.temporal_delta)
+        out = np.where(blend, alpha * patches + (1 - alpha) * prev, patches)
+        # 今回欠損していて前回有効なら前回の値を保持
+        return np.where(~valid_cur & valid_prev, prev, out)
+
+    def _shift_history(self, history, shifts):
+        # 前フレームの窓を今フレームの原点に合わせてずらす (はみ出た部分は 0)
+        size = self.size
+        ys = shifts[:, 1, None, None] + self.rows
+        xs = shifts[:, 0, None, None] + self.cols
+        inside = (ys >= 0) & (ys < size) & (xs >= 0) & (xs < size)
+        index = np.arange(len(history))[:, None, None]
+        shifted = history[index, np.clip(ys, 0, size - 1), np.clip(xs, 0, size - 1)]
+        shifted[~inside] = 0
+        return shifted
+
+    def _fill_holes(self, patches):
+        for _ in range(self.radius):
+            holes = patches == 0
+            if not holes.any():
+                break
+            padded = np.pad(patches, ((0, 0), (1, 1), (1, 1)))
+            left = padded[:, 1:-1, :-2]
+            if self.holes_fill == HOLES_FILL_FROM_LEFT:
+                fill = left
+            else:
+                neighbours = np.stack((left, padded[:, 1:-1, 2:], padded[:, :-2, 1:-1], padded[:, 2:, 1:-1]))
+                if self.holes_fill == HOLES_FILL_FAREST:
+                    fill = neighbours.max(axis=0)
+                else:
+                    nearest = np.where(neighbours > 0, neighbours, np.inf).min(axis=0)
+                    fill = np.where(np.isinf(nearest), 0, nearest)
+            patches[holes] = fill[holes]
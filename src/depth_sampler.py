@@ -0,0 +1,45 @@
+import numpy as np
+
+# デプス画像の NxN 近傍を全点まとめて読み出し、0 (欠損) を除いた値から距離を推定する
+# "median": 中央値, "trimmed_mean": 上下 trim の割合を除いた平均, "center": 中心画素のみ
+ESTIMATORS = ("median", "trimmed_mean", "center")
+
+class DepthSampler:
+    def __init__(self, window=5, estimator="median", trim=0.2):
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"Unknown depth estimator: {estimator}")
+        if window < 1 or window % 2 == 0:
+            raise ValueError("Depth window must be a positive odd number")
+        self.window = window
+        self.estimator = estimator
+        self.trim = trim
+        radius = window // 2
+        offsets = np.arange(-radius, radius + 1)
+        dy, dx = np.meshgrid(offsets, offsets, indexing="ij")
+        self.dx = dx.reshape(-1)
+        self.dy = dy.reshape(-1)
+
+    def sample(self, depth_arr, pixels, depth_scale):
+        # depth_arr: get_data() のゼロコピーのビュー (H, W)、pixels: (N, 2) の (x, y)
+        pixels = np.asarray(pixels, dtype=np.int64).reshape(-1, 2)
+        height, width = depth_arr.shape
+        if self.estimator == "center":
+            return depth_arr[pixels[:, 1], pixels[:, 0]] * depth_scale
+        xs = np.clip(pixels[:, :1] + self.dx, 0, width - 1)
+        ys = np.clip(pixels[:, 1:] + self.dy, 0, height - 1)
+        values = depth_arr[ys, xs].astype(np.float64)
+        values[values == 0] = np.nan
+        # NaN は末尾に並ぶので、有効な値は各行の先頭 counts 個
+        values.sort(axis=1)
+        counts = np.count_nonzero(~np.isnan(values), axis=1)
+        rows = np.arange(len(values))
+        if self.estimator == "median":
+            lo = np.maximum(counts - 1, 0) // 2
+            hi = counts // 2
+            depths = (values[rows, lo] + values[rows, hi]) / 2
+        else:
+            cut = (counts * self.trim).astype(np.int64)
+            cumsum = np.concatenate((np.zeros((len(values), 1)), np.nancumsum(values, axis=1)), axis=1)
+            kept = counts - 2 * cut
+            depths = (cumsum[rows, counts - cut] - cumsum[rows, cut]) / np.maximum(kept, 1)
+        return np.where(counts > 0, depths, 0.0) * depth_scale
@@ -1,6 +1,5 @@
 import math
 import numpy as np
-from filterpy.kalman import KalmanFilter
 
 class MovingAverageProcessor():
     def __init__(self, window=5, threshold=0.15, max_dt=0.5):
@@ -45,6 +44,8 @@ class KalmanFilterProcessor():
         self.initialized = False
 
     def _init_filter(self):
+        # filterpy は scipy ごと読み込むので起動時には import しない
+        from filterpy.kalman import KalmanFilter
         kf = KalmanFilter(dim_x=6, dim_z=3)
         kf.F = np.array([
             [1, 0, 0, self.dt, 0,       0],
@@ -124,6 +125,7 @@ class KalmanFilterAccelProcessor():
         self.initialized = False
 
     def _init_filter(self):
+        from filterpy.kalman import KalmanFilter
         dim_x = 9
         kf = KalmanFilter(dim_x=dim_x, dim_z=3)
         dt = self.dt
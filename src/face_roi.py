@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+# ランドマークの backend (FaceMesh など) に渡す画像の準備
+# "full": フレーム全体, "roi": 前フレームの顔の周りを正方形に切り出す (顔を見失ったら次のフレームは全体から探す)
+# どちらのモードでも input_size を指定すると、長辺がその大きさになるように縮小してから渡す
+# ランドマークは切り出した画像に対する正規化座標で返ってくるので、フレーム全体に対する座標に直してから返す
+FACE_INPUT_MODES = ("full", "roi")
+
+class FaceInput:
+    def __init__(self, width, height, mode="full", input_size=0, padding=0.5, redetect_interval=30, max_faces=1):
+        if mode not in FACE_INPUT_MODES:
+            raise ValueError(f"Unknown face input mode: {mode}")
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.input_size = input_size
+        # 顔の外周の範囲に、大きさのこの割合ずつ上下左右に余白をつける (動きで顔が ROI からはみ出さないように)
+        self.padding = padding
+        # 見つけた顔が max_faces より少なければ、このフレーム数ごとに全体を見て新しく来た人を探す (0 なら探さない)
+        self.redetect_interval = redetect_interval
+        self.max_faces = max_faces
+        self.roi = None  # 次のフレームで切り出す範囲 (x0, y0, x1, y1)、フレーム全体の画素
+        self.faces = 0
+        self.roi_frames = 0
+
+    def reset(self):
+        self.roi = None
+
+    def prepare(self, image):
+        # backend に渡す画像と、切り出した範囲 (全体なら None) を返す
+        roi = self.roi if self.mode == "roi" else None
+        if roi is not None and self.faces < self.max_faces and self.redetect_interval:
+            self.roi_frames += 1
+            if self.roi_frames >= self.redetect_interval:
+                self.roi_frames = 0
+                roi = None
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            image = image[y0:y1, x0:x1]
+        height, width = image.shape[:2]
+        if self.input_size and max(width, height) > self.input_size:
+            scale = self.input_size / max(width, height)
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        elif roi is not None:
+            # 切り出しただけのビューは行がとびとびなので、backend に渡す前に詰める
+            image = np.ascontiguousarray(image)
+        return image, roi
+
+    def update(self, faces, roi):
+        # faces: backend の返した FaceLandmarks のリスト (prepare で返した roi の画像に対する座標)
+        # ランドマークをフレーム全体の正規化座標に書き換え、次のフレームの ROI を決める
+        faces = faces or []
+        self.faces = len(faces)
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            scale = ((x1 - x0) / self.width, (y1 - y0) / self.height)
+            offset = (x0 / self.width, y0 / self.height)
+            for face in faces:
+                face.remap(scale, offset)
+        if self.mode != "roi":
+            return
+        if not faces:
+            self.roi = None
+            return
+        # 全員の顔の範囲を囲む範囲
+        bounds = np.array([face.bounds for face in faces]) * (self.width, self.height, self.width, self.height)
+        (left, top), (right, bottom) = bounds[:, :2].min(axis=0), bounds[:, 2:].max(axis=0)
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        half = max(right - left, bottom - top) * (0.5 + self.padding)
+        x0, y0 = max(int(cx - half), 0), max(int(cy - half), 0)
+        x1, y1 = min(int(cx + half) + 1, self.width), min(int(cy + half) + 1, self.height)
+        self.roi = (x0, y0, x1, y1) if x1 - x0 > 1 and y1 - y0 > 1 else None
@@ -0,0 +1,300 @@
+import math
+import numpy as np
+
+# 両目 x 3軸 = (2, 3) の配列を状態として持ち、全チャンネルを一度に更新するフィルタ群
+# process() は1フレーム分、process_batch() はオフライン用に (N, 2, 3) の軌跡をまとめて処理する
+# 入力の先頭に次元を足した (..., 2, 3) も受け付けるので、複数の系列を同時に処理することもできる
+# 状態は最初の入力の形で確保し、以降は out= を使ってその場で更新する
+
+def as_eye_array(eye_pos):
+    x = np.asarray(eye_pos, dtype=np.float64)
+    if x.shape[-2:] != (2, 3):
+        raise ValueError(f"Expected (..., 2, 3) eye positions, got {x.shape}")
+    return x
+
+class VectorFilter:
+    def __init__(self):
+        self.shape = None
+
+    def _allocate(self, shape):
+        self.shape = shape
+
+    def reset(self):
+        # 状態を初期化する。状態を持たないフィルタは何もしない
+        pass
+
+    def step(self, x, dt):
+        # 1 フレーム分の更新。x は _allocate 済みの形 (self.shape) の配列で、フィルタ後の新しい配列を返す
+        # 各フィルタはこれを上書きする (基底クラスは入力をそのまま通す)
+        return x
+
+    def motion(self):
+        # 推定している速度と加速度 ((..., 2, 3) の配列、持たないものは None)。推定がなければ None
+        return None
+
+    def process(self, eye_pos, dt):
+        x = as_eye_array(eye_pos)
+        if x.shape != self.shape:
+            self._allocate(x.shape)
+        return self.step(x, dt)
+
+    def process_batch(self, trajectory, dts):
+        # trajectory: (N, ..., 2, 3)、dts: (N,)
+        trajectory = as_eye_array(trajectory)
+        out = np.empty_like(trajectory)
+        if trajectory.shape[1:] != self.shape:
+            self._allocate(trajectory.shape[1:])
+        step = self.step
+        for i, dt in enumerate(np.asarray(dts, dtype=np.float64).tolist()):
+            out[i] = step(trajectory[i], dt)
+        return out
+
+class MovingAverageFilter(VectorFilter):
+    # MovingAverageProcessor と同じ出力: 現在の平均から threshold を超えてずれた座標は平均で置き換えてから加える
+    # 履歴はリングバッファに持ち、平均は差分更新する合計から求める
+    def __init__(self, window=5, threshold=0.15, max_dt=0.5):
+        super().__init__()
+        self.window = window
+        self.threshold = threshold
+        self.max_dt = max_dt
+
+    def _allocate(self, shape):
+        super()._allocate(shape)
+        self.buffer = np.zeros((self.window,) + shape)
+        self.sum = np.zeros(shape)
+        self.avg = np.zeros(shape)
+        self.diff = np.zeros(shape)
+        self.mask = np.zeros(shape, dtype=bool)
+        self.x = np.zeros(shape)
+        self.reset()
+
+    def reset(self):
+        if self.shape is not None:
+            self.sum[...] = 0.0
+        self.count = 0
+        self.index = 0
+
+    def step(self, x, dt):
+        if dt > self.max_dt:
+            self.reset()
+        if self.count:
+            np.copyto(self.x, x)
+            x = self.x
+            np.subtract(x, self.avg, out=self.diff)
+            np.abs(self.diff, out=self.diff)
+            np.greater(self.diff, self.threshold, out=self.mask)
+            np.copyto(x, self.avg, where=self.mask)
+        slot = self.buffer[self.index]
+        if self.count == self.window:
+            np.subtract(self.sum, slot, out=self.sum)
+        else:
+            self.count += 1
+        np.copyto(slot, x)
+        np.add(self.sum, x, out=self.sum)
+        self.index = (self.index + 1) % self.window
+        np.multiply(self.sum, 1.0 / self.count, out=self.avg)
+        return self.avg.copy()
+
+class OneEuroFilter(VectorFilter):
+    # OneEuroFilterProcesser と同じ式を全チャンネル同時に計算する
+    # alpha = 1 / (1 + tau / dt) は c = 2π·cutoff·dt を使って c / (1 + c) と書ける
+    def __init__(self, min_cutoff=1.0, beta=0.0, d_cutoff=1.0):
+        super().__init__()
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+
+    def _allocate(self, shape):
+        super()._allocate(shape)
+        self.x_prev = np.zeros(shape)
+        self.dx_prev = np.zeros(shape)
+        self.velocity = np.zeros(shape)
+        self.work = np.zeros(shape)
+        self.gain = np.zeros(shape)
+        self.reset()
+
+    def reset(self):
+        self.t = 0.0
+        self.t_prev = None
+        if self.shape is not None:
+            self.dx_prev[...] = 0.0
+            self.velocity[...] = 0.0
+
+    def motion(self):
+        # dx_prev は (入力 - 前回の出力) / dt なので、速度ではなく出力の遅れに比例して大きくなる
+        # 予測には出力の差分 (x_hat - x_hat_prev) / dt を d_cutoff で平滑化した velocity を返す
+        if self.shape is None or self.t_prev is None:
+            return None
+        return self.velocity.copy(), None
+
+    def step(self, x, dt):
+        self.t += dt
+        if self.t_prev is None:
+            self.t_prev = self.t
+            np.copyto(self.x_prev, x)
+            return self.x_prev.copy()
+        dt = self.t - self.t_prev
+        if dt <= 0:
+            return self.x_prev.copy()
+        self.t_prev = self.t
+        two_pi_dt = 2 * math.pi * dt
+        c_d = two_pi_dt * self.d_cutoff
+        alpha_d = c_d / (1.0 + c_d)
+        work, gain, dx_prev, x_prev = self.work, self.gain, self.dx_prev, self.x_prev
+        # dx_hat = alpha_d * (x - x_prev) / dt + (1 - alpha_d) * dx_prev
+        np.subtract(x, x_prev, out=work)
+        np.multiply(work, alpha_d / dt, out=work)
+        np.multiply(dx_prev, 1 - alpha_d, out=dx_prev)
+        np.add(dx_prev, work, out=dx_prev)
+        # c = 2π·dt·(min_cutoff + beta·|dx_hat|), alpha_x = c / (1 + c)
+        np.abs(dx_prev, out=gain)
+        np.multiply(gain, two_pi_dt * self.beta, out=gain)
+        np.add(gain, two_pi_dt * self.min_cutoff, out=gain)
+        np.add(gain, 1.0, out=work)
+        np.divide(gain, work, out=gain)
+        # x_hat = x_prev + alpha_x * (x - x_prev)
+        np.subtract(x, x_prev, out=work)
+        np.multiply(work, gain, out=work)
+        np.add(x_prev, work, out=x_prev)
+        # velocity = alpha_d * (x_hat - x_hat_prev) / dt + (1 - alpha_d) * velocity (work が x_hat - x_hat_prev)
+        velocity = self.velocity
+        np.multiply(work, alpha_d / dt, out=work)
+        np.multiply(velocity, 1 - alpha_d, out=velocity)
+        np.add(velocity, work, out=velocity)
+        return x_prev.copy()
+
+class OutlierGate(VectorFilter):
+    # 目ごとに、前回採用した位置から threshold を超えて跳んだ値や z <= 0 (デプス欠損) を棄却して前回値を保持する
+    # max_hold フレーム連続で跳んだ値が続いたら、新しい位置を採用し直す
+    def __init__(self, threshold=0.15, max_hold=5, max_dt=0.5):
+        super().__init__()
+        self.threshold = threshold
+        self.max_hold = max_hold
+        self.max_dt = max_dt
+        self.rejected = 0
+
+    def _allocate(self, shape):
+        super()._allocate(shape)
+        self.last = np.zeros(shape)
+        self.held = np.zeros(shape[:-1], dtype=np.int64)
+        self.initialized = np.zeros(shape[:-1], dtype=bool)
+        self.reset()
+
+    def reset(self):
+        if self.shape is not None:
+            self.initialized[...] = False
+            self.held[...] = 0
+
+    def step(self, x, dt):
+        if dt > self.max_dt:
+            self.reset()
+        missing = x[..., 2] <= 0
+        jump = np.abs(x - self.last).max(axis=-1) > self.threshold
+        reject = self.initialized & (missing | (jump & (self.held < self.max_hold)))
+        accept = ~reject & ~missing
+        np.copyto(self.last, x, where=accept[..., None])
+        self.initialized |= accept
+        self.held = np.where(reject, self.held + 1, 0)
+        self.rejected += int(np.count_nonzero(reject))
+        return np.where(self.initialized[..., None], self.last, x)
+
+class KalmanFilter(VectorFilter):
+    # KalmanFilterProcessor (filterpy) と同じ推定を返す等速度モデル
+    # F, H, Q, R, P0 はどれも軸ごとに独立なので、6x6 の行列は 1 軸あたり order x order のブロックに分かれる
+    # 両目 x 3軸の 6 チャンネルを (..., 2, 3, order) の状態、(..., 2, 3, order, order) の共分散として一度に更新する
+    # 観測は位置の 1 成分だけなので S はスカラーになり、逆行列は割り算で済む
+    order = 2
+
+    def __init__(self, threshold=0.15, max_dt=0.5, process_noise=0.0001,
+                 measurement_noise=(0.002, 0.002, 0.004), initial_covariance=10.0):
+        super().__init__()
+        self.threshold = threshold
+        self.max_dt = max_dt
+        self.initial_covariance = initial_covariance
+        self.Q = np.eye(self.order) * process_noise
+        self.R = np.broadcast_to(np.asarray(measurement_noise, dtype=np.float64), (3,)).copy()
+        self.F = np.eye(self.order)
+        self.FT = self.F.T
+        self.dt = None
+
+    def _allocate(self, shape):
+        super()._allocate(shape)
+        k = self.order
+        self.x = np.zeros(shape + (k,))
+        self.P = np.zeros(shape + (k, k))
+        self.tmp = np.zeros(shape + (k, k))
+        self.row = np.zeros(shape + (1, k))
+        self.K = np.zeros(shape + (k, 1))
+        self.S = np.zeros(shape)
+        self.y = np.zeros(shape)
+        self.z = np.zeros(shape)
+        self.diff = np.zeros(shape)
+        self.mask = np.zeros(shape, dtype=bool)
+        self.P[...] = np.eye(self.order) * self.initial_covariance
+        self.reset()
+
+    def reset(self):
+        # filterpy 版の max_dt と同じく、次の入力で状態を取り直すだけで共分散は引き継ぐ
+        # (P を初期値に戻すと、直後の外れ値で速度が大きく振れて発散しやすい)
+        self.initialized = False
+
+    def update_dt(self, dt):
+        # 対角から j 個右の要素が dt^j / j!
+        if dt == self.dt:
+            return
+        self.dt = dt
+        term = 1.0
+        for j in range(1, self.order):
+            term *= dt / j
+            for i in range(self.order - j):
+                self.F[i, i + j] = term
+
+    def motion(self):
+        if self.shape is None or not self.initialized:
+            return None
+        acceleration = self.x[..., 2].copy() if self.order > 2 else None
+        return self.x[..., 1].copy(), acceleration
+
+    def _restart(self, x):
+        # 状態だけを観測位置・速度 0 に戻す
+        self.x[...] = 0.0
+        self.x[..., 0] = x
+        self.initialized = True
+        return np.array(x, dtype=np.float64)
+
+    def step(self, x, dt):
+        if dt > self.max_dt or not self.initialized:
+            return self._restart(x)
+        self.update_dt(dt)
+        state, P, tmp = self.x, self.P, self.tmp
+        # predict: x = F x, P = F P F^T + Q
+        np.matmul(state[..., None, :], self.FT, out=self.row)
+        state[...] = self.row[..., 0, :]
+        np.matmul(self.F, P, out=tmp)
+        np.matmul(tmp, self.FT, out=P)
+        np.add(P, self.Q, out=P)
+        # 予測位置から threshold を超えた座標は予測値で置き換える
+        pred = state[..., 0]
+        np.subtract(x, pred, out=self.diff)
+        np.abs(self.diff, out=self.diff)
+        np.greater(self.diff, self.threshold, out=self.mask)
+        np.copyto(self.z, x)
+        np.copyto(self.z, pred, where=self.mask)
+        # update: K = P[:, 0] / (P[0, 0] + R), x += K y, P -= K P[0, :]
+        np.subtract(self.z, pred, out=self.y)
+        np.add(P[..., 0, 0], self.R, out=self.S)
+        np.divide(P[..., :, 0:1], self.S[..., None, None], out=self.K)
+        np.copyto(self.row, P[..., 0:1, :])
+        np.multiply(self.K, self.row, out=tmp)
+        np.subtract(P, tmp, out=P)
+        np.multiply(self.K[..., 0], self.y[..., None], out=self.row[..., 0, :])
+        np.add(state, self.row[..., 0, :], out=state)
+        return state[..., 0].copy()
+
+class KalmanAccelFilter(KalmanFilter):
+    # KalmanFilterAccelProcessor と同じ等加速度モデル (位置・速度・加速度)
+    order = 3
+
+    def __init__(self, threshold=0.15, max_dt=0.5, process_noise=0.001,
+                 measurement_noise=0.05, initial_covariance=10.0):
+        super().__init__(threshold, max_dt, process_noise, measurement_noise, initial_covariance)
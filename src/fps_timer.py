@@ -1,20 +1,88 @@
 import time
+import numpy as np
 
-class FPSTimer:
-    def __init__(self, max_samples=30):
-        self.times = []
+# フレーム間隔の統計
+# 直近 max_samples 回の間隔を単調時計で測ってリングバッファに持ち、fps・間隔の分位点・ジッタを出す
+# RealSense のフレーム番号を渡すと、番号の飛び (カメラ側で落ちたフレーム) と重複も数える
+class FrameStats:
+    def __init__(self, max_samples=120):
         self.max_samples = max_samples
+        self.intervals = np.zeros(max_samples)
+        self.index = 0
+        self.count = 0
         self.last_time = None
+        self.last_frame_number = None
+        self.frames = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.restarts = 0
+        self.face_found = 0
+        self.face_lost = 0
 
-    def update(self):
-        now = time.time()
+    def update(self, frame_number=None, now=None):
+        now = time.perf_counter() if now is None else now
         if self.last_time is not None:
-            dt = now - self.last_time
-            self.times.append(dt)
-            if len(self.times) > self.max_samples:
-                self.times.pop(0)
+            self.intervals[self.index] = now - self.last_time
+            self.index = (self.index + 1) % self.max_samples
+            self.count = min(self.count + 1, self.max_samples)
         self.last_time = now
+        self.frames += 1
+        if frame_number is not None:
+            if self.last_frame_number is not None:
+                gap = frame_number - self.last_frame_number
+                if gap > 1:
+                    self.dropped += gap - 1
+                elif gap == 0:
+                    self.duplicated += 1
+                elif gap < 0:
+                    self.restarts += 1  # デバイスの再起動などで番号が戻った
+            self.last_frame_number = frame_number
+
+    def count_face(self, found):
+        if found:
+            self.face_found += 1
+        else:
+            self.face_lost += 1
 
     def get_fps(self):
-        total = sum(self.times)
-        return len(self.times) / total if total > 0 else 0
+        if self.count == 0:
+            return 0
+        total = self.intervals[:self.count].sum()
+        return self.count / total if total > 0 else 0
+
+    def snapshot(self):
+        intervals = self.intervals[:self.count] * 1000
+        if self.count == self.max_samples:
+            # 一周した後は index が最も古い間隔なので、古い順に並べてから連続する間隔の差をとる
+            intervals = np.roll(intervals, -self.index)
+        if intervals.size:
+            p50, p95, p99 = np.percentile(intervals, (50, 95, 99))
+            # ジッタは連続する間隔の差の絶対値の平均
+            jitter = float(np.abs(np.diff(intervals)).mean()) if intervals.size > 1 else 0.0
+        else:
+            p50 = p95 = p99 = jitter = 0.0
+        faces = self.face_found + self.face_lost
+        return {
+            "fps": float(self.get_fps()),
+            "interval_p50_ms": float(p50),
+            "interval_p95_ms": float(p95),
+            "interval_p99_ms": float(p99),
+            "jitter_ms": jitter,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "duplicated": self.duplicated,
+            "restarts": self.restarts,
+            "face_lost": self.face_lost,
+            "face_lost_ratio": self.face_lost / faces if faces else 0.0,
+        }
+
+def combine_stats(camera_stats, output_stats, output=None):
+    # カメラ側の統計に、出力の fps と出力先 (OSC の送信スレッドなど) の遅れ・欠落を加えたもの
+    stats = camera_stats.snapshot()
+    stats["output_fps"] = float(output_stats.get_fps())
+    if output is not None:
+        stats.update(output.snapshot())
+    return stats
+
+# 以前の名前 (平均 fps だけを使う箇所向け)
+FPSTimer = FrameStats
@@ -0,0 +1,124 @@
+import numpy as np
+import pyrealsense2 as rs
+
+# rsutil.h の rs2_project_point_to_pixel / rs2_deproject_pixel_to_point / rs2_transform_point_to_point と
+# rs2_project_color_pixel_to_depth_pixel を複数点まとめて処理できるようにした NumPy 版
+
+def _coeffs(intrinsics):
+    return [float(c) for c in intrinsics.coeffs]
+
+def deproject_pixels(intrinsics, pixels, depths):
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+    depths = np.asarray(depths, dtype=np.float64).reshape(-1)
+    x = (pixels[:, 0] - intrinsics.ppx) / intrinsics.fx
+    y = (pixels[:, 1] - intrinsics.ppy) / intrinsics.fy
+    model = intrinsics.model
+    if model in (rs.distortion.inverse_brown_conrady, rs.distortion.brown_conrady):
+        k1, k2, p1, p2, k3 = _coeffs(intrinsics)
+        if any((k1, k2, p1, p2, k3)):
+            xo, yo = x, y
+            for _ in range(10):
+                r2 = x * x + y * y
+                icdist = 1.0 / (1.0 + ((k3 * r2 + k2) * r2 + k1) * r2)
+                xq = x / icdist if model == rs.distortion.inverse_brown_conrady else x
+                yq = y / icdist if model == rs.distortion.inverse_brown_conrady else y
+                delta_x = 2 * p1 * xq * yq + p2 * (r2 + 2 * xq * xq)
+                delta_y = 2 * p2 * xq * yq + p1 * (r2 + 2 * yq * yq)
+                x = (xo - delta_x) * icdist
+                y = (yo - delta_y) * icdist
+    elif model != rs.distortion.none:
+        # 他の歪みモデルは librealsense の実装に任せる
+        return np.array([
+            rs.rs2_deproject_pixel_to_point(intrinsics, [float(px), float(py)], float(d))
+            for (px, py), d in zip(pixels, depths)
+        ]).reshape(-1, 3)
+    return np.stack((x * depths, y * depths, depths), axis=-1)
+
+def project_points(intrinsics, points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    x = points[:, 0] / points[:, 2]
+    y = points[:, 1] / points[:, 2]
+    model = intrinsics.model
+    if model in (rs.distortion.modified_brown_conrady, rs.distortion.inverse_brown_conrady, rs.distortion.brown_conrady):
+        k1, k2, p1, p2, k3 = _coeffs(intrinsics)
+        if any((k1, k2, p1, p2, k3)):
+            r2 = x * x + y * y
+            f = 1 + k1 * r2 + k2 * r2 * r2 + k3 * r2 * r2 * r2
+            if model == rs.distortion.brown_conrady:
+                xf, yf = x * f, y * f
+            else:
+                x, y = x * f, y * f
+                xf, yf = x, y
+            dx = xf + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+            dy = yf + 2 * p2 * x * y + p1 * (r2 + 2 * y * y)
+            x, y = dx, dy
+    elif model != rs.distortion.none:
+        return np.array([
+            rs.rs2_project_point_to_pixel(intrinsics, [float(v) for v in p]) for p in points
+        ]).reshape(-1, 2)
+    return np.stack((x * intrinsics.fx + intrinsics.ppx, y * intrinsics.fy + intrinsics.ppy), axis=-1)
+
+def transform_points(extrinsics, points):
+    # rotation は列優先の 3x3
+    rotation = np.asarray(extrinsics.rotation, dtype=np.float64).reshape(3, 3)
+    translation = np.asarray(extrinsics.translation, dtype=np.float64)
+    return np.asarray(points, dtype=np.float64).reshape(-1, 3) @ rotation + translation
+
+class ColorToDepthProjector:
+    # カラー画像上の画素を、フレーム全体を align せずにデプス画像上の画素へ対応付ける
+    def __init__(self, color_intrinsics, depth_intrinsics, color_to_depth, depth_to_color,
+                 depth_scale, depth_min=0.1, depth_max=3.0):
+        self.color_intrinsics = color_intrinsics
+        self.depth_intrinsics = depth_intrinsics
+        self.color_to_depth = color_to_depth
+        self.depth_to_color = depth_to_color
+        self.depth_scale = depth_scale
+        self.depth_min = depth_min
+        self.depth_max = depth_max
+
+    def _line_end(self, color_pixel, depth):
+        point = deproject_pixels(self.color_intrinsics, color_pixel, depth)
+        pixel = project_points(self.depth_intrinsics, transform_points(self.color_to_depth, point))[0]
+        # adjust_2D_point_to_boundary
+        pixel[0] = min(max(pixel[0], 0), self.depth_intrinsics.width - 1)
+        pixel[1] = min(max(pixel[1], 0), self.depth_intrinsics.height - 1)
+        return pixel
+
+    def project_pixel(self, depth_data, color_pixel):
+        if isinstance(depth_data, np.ndarray):
+            return self._search_line(depth_data, color_pixel)
+        # rs フレームのバッファ (get_data()) は librealsense の実装で探索する
+        x, y = rs.rs2_project_color_pixel_to_depth_pixel(
+            depth_data, self.depth_scale, self.depth_min, self.depth_max,
+            self.depth_intrinsics, self.color_intrinsics, self.color_to_depth, self.depth_to_color,
+            [float(color_pixel[0]), float(color_pixel[1])]
+        )
+        if x < 0 or y < 0:
+            return None
+        return (int(x), int(y))
+
+    def _search_line(self, depth_arr, color_pixel):
+        # 探索線上の全画素を一度に逆投影・再投影し、元の画素に最も近いものを選ぶ
+        color_pixel = np.asarray(color_pixel, dtype=np.float64)
+        start = self._line_end(color_pixel, self.depth_min)
+        end = self._line_end(color_pixel, self.depth_max)
+        steps = int(np.ceil(np.abs(end - start).max())) + 1
+        line = start + np.linspace(0.0, 1.0, steps)[:, None] * (end - start)
+        cols = line[:, 0].astype(np.int64)
+        rows = line[:, 1].astype(np.int64)
+        depths = depth_arr[rows, cols] * self.depth_scale
+        valid = depths > 0
+        if not valid.any():
+            return None
+        cols, rows, depths = cols[valid], rows[valid], depths[valid]
+        candidates = np.stack((cols, rows), axis=-1)
+        points = transform_points(self.depth_to_color, deproject_pixels(self.depth_intrinsics, candidates, depths))
+        projected = project_points(self.color_intrinsics, points)
+        best = np.argmin(((projected - color_pixel) ** 2).sum(axis=1))
+        return (int(cols[best]), int(rows[best]))
+
+    def depth_in_color_frame(self, depth_pixels, depths):
+        # デプスカメラ座標での距離をカラーカメラ座標系の z に変換
+        depths = np.asarray(depths, dtype=np.float64)
+        points = deproject_pixels(self.depth_intrinsics, depth_pixels, depths)
+        return np.where(depths > 0, transform_points(self.depth_to_color, points)[:, 2], 0.0)
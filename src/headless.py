@@ -0,0 +1,258 @@
+import argparse
+import os
+import signal
+import sys
+import time
+import numpy as np
+import pyrealsense2 as rs
+from fps_timer import FrameStats, combine_stats
+from tracing import tracer
+from multi_camera import MultiCameraRunner
+from model import DEPTH_MODES, ALIGN_MODES
+from depth_sampler import ESTIMATORS
+from face_roi import FACE_INPUT_MODES
+from landmark_backends import LANDMARK_BACKENDS
+from settings import (DEFAULT_CONFIG, OUTPUTS, parse_profile, load_config_file, validate_config, build_model,
+                      build_output, build_smoothing_chain, build_predictor, build_viewer_tracker)
+
+STATUS_INTERVAL = 10.0
+CONFIG_POLL_INTERVAL = 1.0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the eye tracker without a GUI.")
+    parser.add_argument("--config", help="JSON file with the same keys as the configuration window")
+    parser.add_argument("--serial", help="RealSense serial number (default: first device found)")
+    parser.add_argument("--flip", dest="flip", action="store_const", const=1, help="flip the image")
+    parser.add_argument("--no-flip", dest="flip", action="store_const", const=0)
+    parser.add_argument("--profile", help='stream profile, e.g. "640x480@30"')
+    parser.add_argument("--depth-mode", choices=DEPTH_MODES, help="depth post-processing mode")
+    parser.add_argument("--align-mode", choices=ALIGN_MODES, help="how eye pixels are mapped into the depth image")
+    parser.add_argument("--depth-window", type=int, help="size of the NxN depth sampling window (odd)")
+    parser.add_argument("--depth-estimator", choices=ESTIMATORS, help="statistic used over the depth window")
+    parser.add_argument("--hole-filling", dest="hole_filling", action="store_const", const=True,
+                        help="run the full-frame hole filling filter")
+    parser.add_argument("--landmark-backend", choices=LANDMARK_BACKENDS,
+                        help="eye landmark detector: MediaPipe FaceMesh or OpenCV Haar cascades")
+    parser.add_argument("--landmark-min-confidence", type=float,
+                        help="ignore faces whose landmark confidence is below this value (0..1)")
+    parser.add_argument("--face-input", choices=FACE_INPUT_MODES,
+                        help="run the landmark backend on the full frame or on a padded crop around the last face")
+    parser.add_argument("--face-input-size", type=int,
+                        help="downscale the landmark backend input so its longer side is at most this many pixels (0: off)")
+    parser.add_argument("--face-roi-padding", type=float, help="margin around the face crop, as a fraction of face size")
+    parser.add_argument("--keyframe-interval", type=int,
+                        help="run the landmark backend every N frames and track the irises with optical flow in between")
+    parser.add_argument("--keyframe-max-drift", type=float,
+                        help="forward-backward flow error (px) that forces a landmark keyframe")
+    parser.add_argument("--smoothing", help='smoothing stages applied in order, e.g. "outlier,kalman,one_euro" or "none"')
+    parser.add_argument("--camera", dest="cameras", action="append", metavar="SERIAL|FILE.rec",
+                        help="use several cameras (repeatable) and fuse their poses; per-camera transforms go in --config")
+    parser.add_argument("--max-viewers", type=int,
+                        help="track up to N people with stable IDs; poses go to per-viewer OSC addresses")
+    parser.add_argument("--osc-viewer-prefix", help='address prefix per viewer, e.g. "/viewer/{id}"')
+    parser.add_argument("--record", help="record raw color/depth frames to this file")
+    parser.add_argument("--replay", help="replay a recording instead of opening a camera")
+    parser.add_argument("--replay-fast", dest="replay_realtime", action="store_const", const=False,
+                        help="replay as fast as frames are consumed instead of at the recorded pace")
+    parser.add_argument("--replay-loop", dest="replay_loop", action="store_const", const=True,
+                        help="restart the recording when it ends")
+    parser.add_argument("--predict", dest="predict", action="store_const", const=True,
+                        help="extrapolate the smoothed pose to the send time using the filter's velocity estimate")
+    parser.add_argument("--predict-target-ms", type=float, help="predict this much further ahead (display latency)")
+    parser.add_argument("--predict-max-ms", type=float, help="upper limit of the prediction horizon")
+    parser.add_argument("--predict-max-distance", type=float, help="upper limit of the predicted displacement (m)")
+    parser.add_argument("--capture-latency-ms", type=float,
+                        help="exposure + transfer time added when frame timestamps are not wall-clock")
+    parser.add_argument("--trace", help="record per-stage timings and write a Chrome trace JSON here on exit")
+    parser.add_argument("--ip", help="OSC destination IP address")
+    parser.add_argument("--port", type=int, help="OSC destination port")
+    for side in ("right", "left", "center"):
+        parser.add_argument(f"--osc-{side}-addr", help=f"OSC address for the {side} position")
+        parser.add_argument(f"--osc-{side}-enable", dest=f"osc_{side}_enable", action="store_const", const=True)
+        parser.add_argument(f"--osc-{side}-disable", dest=f"osc_{side}_enable", action="store_const", const=False)
+    parser.add_argument("--output", choices=OUTPUTS, help="send poses over OSC, to shared memory, or both")
+    parser.add_argument("--shm-name", help="shared memory block name for --output shm/both")
+    parser.add_argument("--osc-to", dest="osc_destinations", action="append", metavar="HOST:PORT[=ADDRS]",
+                        help='additional OSC destination (repeatable), optionally limited to some addresses,'
+                             ' e.g. "239.0.0.1:9000" or "192.168.1.20:9001=center,stats"')
+    parser.add_argument("--osc-bundle", dest="osc_bundle", action="store_const", const=True,
+                        help="send right/left/center as one OSC bundle per frame, timetagged with the frame time")
+    parser.add_argument("--osc-stats-addr", help="OSC address for frame timing statistics")
+    parser.add_argument("--osc-stats-enable", dest="osc_stats_enable", action="store_const", const=True,
+                        help="periodically send frame timing / drop statistics over OSC")
+    parser.add_argument("--stats-interval", type=float, help="seconds between statistics messages")
+    return parser.parse_args(argv)
+
+def first_device_serial():
+    for device in rs.context().query_devices():
+        return device.get_info(rs.camera_info.serial_number)
+    return None
+
+def make_config(args):
+    # 優先順位: デフォルト < 設定ファイル < コマンドライン引数
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        config.update(load_config_file(args.config))
+    if args.profile:
+        config["width"], config["height"], config["fps"] = parse_profile(args.profile)
+    for key in DEFAULT_CONFIG:
+        value = getattr(args, key, None)
+        if value is not None:
+            config[key] = value
+    if not config["serial"] and not config["replay"] and not config["cameras"]:
+        config["serial"] = first_device_serial()
+        if config["serial"] is None:
+            raise RuntimeError("No RealSense devices found")
+    return validate_config(config)
+
+class HeadlessRunner:
+    def __init__(self, config, config_path=None, smoothing_override=False):
+        self.config = config
+        self.running = False
+        self.model = build_model(config)
+        self.output = build_output(config)
+        self.smoothing = build_smoothing_chain(config)
+        self.predictor = build_predictor(config)
+        self.viewers = build_viewer_tracker(config)
+        self.fps_timer = FrameStats(max_samples=30)
+        # 設定ファイルの smoothing だけは実行中の書き換えを反映する (コマンドラインで指定したときは固定)
+        self.config_path = config_path if not smoothing_override else None
+        self.config_mtime = self._config_mtime()
+
+    def _config_mtime(self):
+        try:
+            return os.stat(self.config_path).st_mtime if self.config_path else None
+        except OSError:
+            return None
+
+    def reload_smoothing(self):
+        mtime = self._config_mtime()
+        if mtime is None or mtime == self.config_mtime:
+            return
+        self.config_mtime = mtime
+        try:
+            smoothing = load_config_file(self.config_path).get("smoothing", DEFAULT_CONFIG["smoothing"])
+            self.smoothing.set_stages(smoothing)
+            if self.viewers is not None:
+                self.viewers.set_smoothing(smoothing)
+        except Exception as e:
+            print("error reloading smoothing:", e, flush=True)
+            return
+        print(f"smoothing: {self.smoothing.describe()}", flush=True)
+
+    def stop(self, signum=None, frame=None):
+        self.running = False
+
+    def run(self):
+        self.running = True
+        last_status = time.monotonic()
+        last_poll = last_stats = last_status
+        try:
+            while self.running:
+                frames = self.model.wait_frames()
+                if frames is None:
+                    if self.model.finished:
+                        break
+                    continue
+                arrival = time.perf_counter()
+                timestamp = frames.get_timestamp()
+                frame, eye_pos, _ = self.model.process_frames(frames)
+                if frame is None:
+                    continue
+                self.fps_timer.update()
+                if self.viewers is not None:
+                    # 複数人: 全員分の目をまとめてデプロジェクションしてから、人ごとに対応付け・スムージングする
+                    with tracer.span("deprojection"):
+                        eyes = eye_pos if eye_pos is not None else np.empty((0, 2, 3))
+                        matches, faces = self.model.locate_viewers(eyes, self.viewers)
+                    with tracer.span("smoothing"):
+                        poses = self.viewers.smooth(matches, faces, self.predictor, timestamp, arrival)
+                    with tracer.span("output"):
+                        self.output.send_viewers(poses, timestamp)
+                else:
+                    if eye_pos is not None:
+                        with tracer.span("deprojection"):
+                            right_eye = self.model.deprojection(eye_pos[0][0], eye_pos[0][1], eye_pos[0][2])
+                            left_eye = self.model.deprojection(eye_pos[1][0], eye_pos[1][1], eye_pos[1][2])
+                        with tracer.span("smoothing"):
+                            eye_pos = self.smoothing.process((right_eye, left_eye))
+                        if self.predictor is not None:
+                            with tracer.span("prediction"):
+                                eye_pos = self.predictor.predict(eye_pos, self.smoothing.motion(), timestamp, arrival)
+                    with tracer.span("output"):
+                        self.output.send(eye_pos, timestamp)
+                t = time.monotonic()
+                if t - last_stats >= self.config["stats_interval"]:
+                    self.output.send_stats(combine_stats(self.model.frame_stats, self.fps_timer, self.output))
+                    last_stats = t
+                if t - last_poll >= CONFIG_POLL_INTERVAL:
+                    self.reload_smoothing()
+                    last_poll = t
+                if t - last_status >= STATUS_INTERVAL:
+                    stats = self.model.frame_stats.snapshot()
+                    status = (f"{self.fps_timer.get_fps():.1f} fps  camera {stats['fps']:.1f} fps"
+                              f" p99 {stats['interval_p99_ms']:.1f} ms  dropped {stats['dropped']}"
+                              f"  face lost {stats['face_lost_ratio'] * 100:.0f}%")
+                    output = self.output.snapshot()
+                    if "osc_sent" in output:
+                        status += (f"  osc p99 {output['osc_latency_p99_ms']:.2f} ms"
+                                   f" dropped {output['osc_dropped']} failed {output['osc_failed']}")
+                        unreachable = [f"{d} {n}" for d, n in output["osc_destination_failed"].items() if n]
+                        if unreachable:
+                            status += f" ({', '.join(unreachable)})"
+                    if self.model.propagator is not None:
+                        status += f"  keyframes {self.model.propagator.keyframe_ratio() * 100:.0f}%"
+                    if self.viewers is not None:
+                        status += f"  viewers {len(self.viewers.active())}"
+                    if self.predictor is not None:
+                        status += f"  predict {self.predictor.last_horizon_ms:.0f} ms"
+                    if self.smoothing.stages and self.viewers is None:
+                        status += f"  smoothing {self.smoothing.timing_text()}"
+                        self.smoothing.reset_timing()
+                    print(status, flush=True)
+                    if tracer.enabled:
+                        print(tracer.summary_text(), flush=True)
+                    last_status = t
+        finally:
+            self.output.close()
+            self.model.close()
+            if tracer.enabled:
+                tracer.export_chrome_trace(self.config["trace"])
+
+def describe_output(config):
+    osc = ", ".join([f"{config['ip']}:{config['port']}"] + [str(d) for d in config["osc_destinations"]])
+    if config["output"] == "osc":
+        return osc
+    shm = f"shared memory '{config['shm_name']}'"
+    return shm if config["output"] == "shm" else f"{osc} + {shm}"
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        config = make_config(args)
+        if config["trace"]:
+            tracer.enable()
+        if config["cameras"]:
+            runner = MultiCameraRunner(config)
+        else:
+            runner = HeadlessRunner(config, args.config, smoothing_override=args.smoothing is not None)
+    except Exception as e:
+        print("error:", e)
+        sys.exit(1)
+    signal.signal(signal.SIGINT, runner.stop)
+    signal.signal(signal.SIGTERM, runner.stop)
+    if config["cameras"]:
+        source = runner.describe()
+    else:
+        source = f"replay {config['replay']}" if config["replay"] else f"S/N:{config['serial']}"
+        source += f" {runner.model.width}x{runner.model.height} @ {runner.model.fps}fps"
+        if config["max_viewers"] > 1:
+            source += f", up to {config['max_viewers']} viewers"
+    print(
+        f"Headless tracking {source} -> {describe_output(config)}, smoothing: {runner.smoothing.describe()}",
+        flush=True
+    )
+    runner.run()
+
+if __name__ == "__main__":
+    main()
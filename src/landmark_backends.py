@@ -0,0 +1,210 @@
+import os
+import cv2
+import numpy as np
+
+# 画像から目 (虹彩の中心) の位置を求める部分の差し替え口
+# backend は process(image) で、渡した RGB 画像に対する正規化座標の FaceLandmarks のリストを返す
+#   "face_mesh": MediaPipe FaceMesh (478 点のメッシュ + 虹彩)
+#   "haar": OpenCV の Haar カスケード (OpenCV に同梱のモデルファイル) で顔と目の範囲を探し、
+#           その中の最も暗い部分を瞳とみなす。メッシュはないが、FaceMesh より軽い
+# static=True は渡す画像の原点や倍率がフレームごとに変わるとき (FaceInput の "roi") に使う
+LANDMARK_BACKENDS = ("face_mesh", "haar")
+
+# FaceMesh の番号: 虹彩の中心 (右目, 左目) と、追跡に使う目尻・目頭・鼻筋
+IRIS_POINTS = [468, 473]
+ANCHOR_POINTS = [33, 133, 362, 263, 168, 6]
+
+class FaceLandmarks:
+    # 1 人分の結果。座標は画像に対する正規化座標 (0..1)
+    #   eyes: (2, 2) 右目・左目の虹彩の中心、confidence: 0..1
+    #   anchors: (K, 2) オプティカルフローで追跡する動きにくい点
+    #   points: (N, 3) のメッシュ (FaceMesh の番号, 表示用。持っていなければ None)
+    #   bounds: (x0, y0, x1, y1) 顔の範囲 (ROI の切り出し用)
+    def __init__(self, eyes, confidence=1.0, anchors=None, points=None, bounds=None):
+        self.eyes = np.asarray(eyes, dtype=np.float64).reshape(2, 2)
+        self.confidence = float(confidence)
+        self.anchors = np.zeros((0, 2)) if anchors is None else np.asarray(anchors, dtype=np.float64).reshape(-1, 2)
+        self.points = points
+        if bounds is None:
+            corners = np.concatenate((self.eyes, self.anchors))
+            bounds = np.concatenate((corners.min(axis=0), corners.max(axis=0)))
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+
+    def remap(self, scale, offset):
+        # 切り出した画像に対する座標を、元の画像に対する座標に書き換える (offset + 座標 * scale)
+        scale = np.asarray(scale, dtype=np.float64)
+        offset = np.asarray(offset, dtype=np.float64)
+        self.eyes = self.eyes * scale + offset
+        self.anchors = self.anchors * scale + offset
+        self.bounds = self.bounds * np.tile(scale, 2) + np.tile(offset, 2)
+        if self.points is not None:
+            self.points = self.points.copy()
+            self.points[:, :2] = self.points[:, :2] * scale + offset
+            self.points[:, 2] *= scale[0]
+
+class FaceMeshBackend:
+    name = "face_mesh"
+
+    def __init__(self, max_faces=1, static=False):
+        import mediapipe
+        face_mesh = mediapipe.solutions.face_mesh
+        # static_image_mode=False だと前フレームのランドマークの位置から次を追跡するので、
+        # 切り出す範囲が変わる入力では追跡先がずれる。その場合は毎フレーム顔検出からやり直す
+        self.face_mesh = face_mesh.FaceMesh(
+            static_image_mode=static,
+            max_num_faces=max_faces,
+            refine_landmarks=True,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.9,
+        )
+        self.oval = sorted({i for connection in face_mesh.FACEMESH_FACE_OVAL for i in connection})
+
+    def process(self, image):
+        faces = []
+        for face in self.face_mesh.process(image).multi_face_landmarks or []:
+            points = np.array([(p.x, p.y, p.z) for p in face.landmark], dtype=np.float64)
+            oval = points[self.oval, :2]
+            # FaceMesh は min_tracking_confidence を下回った顔を返さないので、返ってきた顔の信頼度は 1 とする
+            faces.append(FaceLandmarks(
+                points[IRIS_POINTS, :2], 1.0, points[ANCHOR_POINTS, :2], points,
+                np.concatenate((oval.min(axis=0), oval.max(axis=0)))
+            ))
+        return faces
+
+    def close(self):
+        self.face_mesh.close()
+
+class HaarEyeBackend:
+    name = "haar"
+
+    def __init__(self, max_faces=1, cascade_dir=None, detect_size=320, min_face=0.1, track_size=96,
+                 redetect_interval=30):
+        cascade_dir = cascade_dir or cv2.data.haarcascades
+        self.face_cascade = self._load(cascade_dir, "haarcascade_frontalface_default.xml")
+        self.eye_cascade = self._load(cascade_dir, "haarcascade_eye.xml")
+        self.max_faces = max_faces
+        # 顔を探すときは長辺 detect_size に縮小した画像全体で探す。min_face は短辺に対する顔の最小の大きさ
+        self.detect_size = detect_size
+        self.min_face = min_face
+        # 前フレームで見つけた顔は、その周りだけを顔の幅が track_size になるように縮小し、近い大きさだけで探す
+        # (全体を探すより 1 桁速い)。見つけた顔が max_faces より少なければ redetect_interval フレームごとに全体も探す
+        self.track_size = track_size
+        self.redetect_interval = redetect_interval
+        self.tracked = []  # 前フレームの顔 (x, y, w, h)、画像の画素
+        self.frames_since_detect = 0
+
+    def _load(self, cascade_dir, name):
+        path = os.path.join(cascade_dir, name)
+        cascade = cv2.CascadeClassifier(path)
+        if cascade.empty():
+            raise RuntimeError(f"Cannot load Haar cascade: {path}")
+        return cascade
+
+    def reset(self):
+        self.tracked = []
+
+    def process(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        height, width = gray.shape
+        self.frames_since_detect += 1
+        redetect = len(self.tracked) < self.max_faces and self.frames_since_detect >= self.redetect_interval
+        detections = []
+        if self.tracked and not redetect:
+            for box in self.tracked:
+                detections += self._track(gray, box)
+        if not detections or len(detections) < len(self.tracked):
+            # 見失った顔があれば全体から探し直す
+            detections = self._detect(gray)
+            self.frames_since_detect = 0
+        detections = sorted(detections, key=lambda d: -d[4])[:self.max_faces]
+        self.tracked = [d[:4] for d in detections]
+        faces = []
+        for x, y, w, h, weight in detections:
+            face = self._eyes(gray, x, y, w, h, weight)
+            if face is not None:
+                face.remap((1 / width, 1 / height), (0.0, 0.0))
+                faces.append(face)
+        return faces
+
+    def _detect(self, gray):
+        scale = min(1.0, self.detect_size / max(gray.shape))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+        min_size = max(24, int(min(small.shape) * self.min_face))
+        return self._cascade(small, scale, (0, 0), min_size, max(small.shape))
+
+    def _track(self, gray, box):
+        x, y, w, h = box
+        pad = w // 2
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        crop = gray[y0:y + h + pad, x0:x + w + pad]
+        scale = min(1.0, self.track_size / w)
+        if scale < 1:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        size = w * scale
+        found = self._cascade(crop, scale, (x0, y0), max(24, int(size * 0.8)), int(size * 1.25) + 1)
+        return sorted(found, key=lambda d: -d[4])[:1]
+
+    def _cascade(self, image, scale, offset, min_size, max_size):
+        # 縮小した画像で検出し、元の画像の (x, y, w, h, 重み) にして返す
+        boxes, _, weights = self.face_cascade.detectMultiScale3(
+            cv2.equalizeHist(image), scaleFactor=1.1, minNeighbors=4, minSize=(min_size, min_size),
+            maxSize=(max_size, max_size), outputRejectLevels=True
+        )
+        found = []
+        for box, weight in zip(boxes, np.ravel(weights)):
+            x, y, w, h = (np.asarray(box, dtype=np.float64) / scale).astype(np.int64).tolist()
+            found.append((x + offset[0], y + offset[1], w, h, float(weight)))
+        return found
+
+    def _eyes(self, gray, x, y, w, h, weight):
+        # 目は顔の上半分から探し、見つからなければ顔の大きさから決まる標準的な位置を使う
+        upper = gray[y + h // 5:y + h // 2, x:x + w]
+        min_eye = max(8, w // 8)
+        eyes = self.eye_cascade.detectMultiScale(upper, scaleFactor=1.1, minNeighbors=3, minSize=(min_eye, min_eye))
+        boxes = []
+        for side in (0, 1):
+            # 画像の左側が右目 (鏡像でないカメラ)
+            candidates = [(ex, ey, ew, eh) for ex, ey, ew, eh in eyes if (ex + ew / 2 < w / 2) == (side == 0)]
+            if candidates:
+                ex, ey, ew, eh = max(candidates, key=lambda box: box[2] * box[3])
+                boxes.append((x + ex, y + h // 5 + ey, ew, eh, True))
+            else:
+                ew = w // 4
+                boxes.append((x + w * (0.3 if side == 0 else 0.7) - ew / 2, y + h * 0.38 - ew / 2, ew, ew, False))
+        eyes_found = sum(box[4] for box in boxes)
+        if eyes_found == 0:
+            return None
+        centers, anchors = [], []
+        for ex, ey, ew, eh, _ in boxes:
+            ex, ey, ew, eh = int(ex), int(ey), int(ew), int(eh)
+            cx, cy = self._pupil(gray[ey:ey + eh, ex:ex + ew])
+            centers.append((ex + cx, ey + cy))
+            # 目の範囲の左右の端 (目尻・目頭のあたり) を追跡用の点にする
+            anchors += [(ex + ew * 0.15, ey + cy), (ex + ew * 0.85, ey + cy)]
+        # カスケードの重みが 5 で 1 になるように正規化し、片目が見つからなければ半分にする
+        confidence = min(1.0, max(weight, 0.0) / 5.0) * eyes_found / 2
+        return FaceLandmarks(centers, confidence, anchors, bounds=(x, y, x + w, y + h))
+
+    def _pupil(self, eye):
+        # ぼかしてから暗い方の数 % の画素の重心を瞳の中心とする (まつ毛や影の 1 点に引っ張られないように)
+        if eye.size == 0:
+            return 0.0, 0.0
+        blurred = cv2.GaussianBlur(eye, (0, 0), max(1.0, eye.shape[1] / 20))
+        # 眉が入りやすい上の端は使わない
+        margin = eye.shape[0] // 5
+        region = blurred[margin:]
+        dark = region <= np.percentile(region, 5)
+        ys, xs = np.nonzero(dark)
+        return float(xs.mean()) + 0.5, float(ys.mean()) + margin + 0.5
+
+    def close(self):
+        pass
+
+def create_backend(name, max_faces=1, static=False):
+    if name == "face_mesh":
+        return FaceMeshBackend(max_faces, static)
+    if name == "haar":
+        # Haar の前フレームの顔は探す範囲の目安にするだけで毎フレーム検出し直し、外れたら全体を探すので、
+        # 入力の範囲が変わってもそのまま使える (全体を毎回探すと ROI でも数倍遅くなる)
+        return HaarEyeBackend(max_faces)
+    raise ValueError(f"Unknown landmark backend: {name}")
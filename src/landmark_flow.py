@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+from landmark_backends import FaceLandmarks
+
+# ランドマークの backend をキーフレームだけで動かし、間のフレームは虹彩と周りの点をオプティカルフロー (ピラミッド LK) で追跡する
+# 追跡する点: 目 (虹彩の中心) と、backend の返した動きにくい点 (FaceMesh なら目尻・目頭・鼻筋)
+# 次のときは追跡をやめて、そのフレームで backend を動かす
+#   - キーフレームから interval フレーム経った
+#   - 前向き・後ろ向きに追跡して戻ってきた位置のずれが max_drift (px) を超えた点がある (ドリフト)
+#   - 追跡の残差 (窓内の平均の輝度差) が max_residual を超えた / 追跡に失敗した点がある (信頼度の低下)
+EYE_POINTS = 2
+
+class LandmarkPropagator:
+    def __init__(self, width, height, interval=3, max_drift=1.0, max_residual=20.0, win_size=21, max_level=3):
+        self.width = width
+        self.height = height
+        self.interval = interval
+        self.max_drift = max_drift
+        self.max_residual = max_residual
+        self.win_size = (win_size, win_size)
+        self.max_level = max_level
+        self.criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+        # 追跡は点の周りだけの画像で行う。ピラミッドの最上段で窓が収まる分だけ余白をつける
+        self.margin = (win_size // 2 + 1) * 2 ** max_level
+        self.scale = np.array([width, height], dtype=np.float32)
+        self.image = None        # キーフレームにするかもしれない今のフレーム
+        self.prev_gray = None    # 前のフレームの追跡範囲のグレースケール
+        self.rect = None         # その範囲 (x0, y0, x1, y1)
+        self.points = None       # 前のフレームでの追跡点 (顔の数, 点の数, 2) の画素
+        self.base = None         # キーフレームの backend の結果 (FaceLandmarks のリスト)
+        self.since_keyframe = 0
+        self.keyframes = 0
+        self.propagated = 0
+
+    def reset(self):
+        self.points = None
+
+    def track(self, image):
+        # image: backend に渡すのと同じ RGB のフレーム全体
+        # 前のフレームから追跡できればランドマーク (FaceLandmarks のリスト)、キーフレームにすべきなら None を返す
+        self.image = image
+        if self.points is None or self.since_keyframe + 1 >= self.interval:
+            return None
+        x0, y0, x1, y1 = self.rect
+        gray = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_RGB2GRAY)
+        offset = np.array([x0, y0], dtype=np.float32)
+        prev = (self.points - offset).reshape(-1, 1, 2)
+        # 全員の点をまとめて 1 回で追跡し、戻して元の位置に帰ってくるかを見る
+        points, status, residual = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, prev, None, winSize=self.win_size, maxLevel=self.max_level, criteria=self.criteria
+        )
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(
+            gray, self.prev_gray, points, None, winSize=self.win_size, maxLevel=self.max_level, criteria=self.criteria
+        )
+        drift = np.abs(back - prev).reshape(-1, 2).max(axis=1)
+        if (not status.all() or not back_status.all() or drift.max() > self.max_drift
+                or residual.max() > self.max_residual):
+            return None
+        self.points = points.reshape(self.points.shape) + offset
+        self.since_keyframe += 1
+        self.propagated += 1
+        self._store()
+        return self._faces()
+
+    def keyframe(self, faces):
+        # backend の結果 (フレーム全体に対する正規化座標) を、track に渡したフレームからの追跡の起点にする
+        self.since_keyframe = 0
+        self.keyframes += 1
+        if not faces:
+            self.points = None
+            self.base = None
+            return
+        self.base = faces
+        points = np.array([np.concatenate((face.eyes, face.anchors)) for face in faces])
+        self.points = (points * self.scale).astype(np.float32)
+        self._store()
+
+    def _store(self):
+        # 次のフレームの追跡に使う範囲を今の点から決めて、その部分だけグレースケールにしておく
+        points = self.points.reshape(-1, 2)
+        x0, y0 = np.maximum(points.min(axis=0).astype(np.int64) - self.margin, 0)
+        x1, y1 = np.minimum(points.max(axis=0).astype(np.int64) + self.margin + 1, (self.width, self.height))
+        self.rect = (int(x0), int(y0), int(x1), int(y1))
+        self.prev_gray = cv2.cvtColor(self.image[y0:y1, x0:x1], cv2.COLOR_RGB2GRAY)
+        self.image = None
+
+    def _faces(self):
+        # 顔全体は動きにくい点の移動量の中央値だけ平行移動し、追跡した点はその位置にする
+        points = self.points / self.scale
+        faces = []
+        for base, face_points in zip(self.base, points):
+            eyes, anchors = face_points[:EYE_POINTS], face_points[EYE_POINTS:]
+            shift = np.median(anchors - base.anchors, axis=0) if len(anchors) else np.mean(eyes - base.eyes, axis=0)
+            mesh = None
+            if base.points is not None:
+                mesh = base.points.copy()
+                mesh[:, :2] += shift
+            faces.append(FaceLandmarks(eyes, base.confidence, anchors, mesh, base.bounds + np.tile(shift, 2)))
+        return faces
+
+    def keyframe_ratio(self):
+        total = self.keyframes + self.propagated
+        return self.keyframes / total if total else 0.0
@@ -1,15 +1,17 @@
 import pyrealsense2 as rs
 from config import ConfigWindow
-from model import RealSenseModel
+from settings import (DEFAULT_CONFIG, build_model, build_output, build_smoothing_chain, build_predictor,
+                      build_viewer_tracker)
 from view import RealSenseView
 from controller import Controller
-from osc_sender import OSCSender
+from tracing import tracer
 import sys
 
 def main():
     try:
         config = ConfigWindow().show()
         selected_serial = config["serial"]
+        config = dict(DEFAULT_CONFIG, **config)
         flip_image = config["flip"]
         ip_addr = config["ip"]
         port = config["port"]
@@ -17,7 +19,9 @@ def main():
         height = config["height"]
         fps = config["fps"]
 
-        model = RealSenseModel(selected_serial, flip_image, width, height, fps)
+        if config["trace"]:
+            tracer.enable()
+        model = build_model(config)
         device = model.profile.get_device()
         device_name = device.get_info(rs.camera_info.name)
         try:
@@ -26,24 +30,25 @@ def main():
             device_usb = " --"
         info_text = f"{width}x{height} @ {fps}fps, {ip_addr} / {port}, USB{device_usb}"
 
-        view = RealSenseView(f"Eyetracker {device_name} (S/N:{selected_serial})", info_text)
-        osc_sender = OSCSender(
-            ip_addr, port,
-            right_addr=config.get("osc_right_addr", "/eye/right"),
-            left_addr=config.get("osc_left_addr", "/eye/left"),
-            center_addr=config.get("osc_center_addr", "/eye/center"),
-            right_enable=config.get("osc_right_enable", True),
-            left_enable=config.get("osc_left_enable", True),
-            center_enable=config.get("osc_center_enable", True)
+        view = RealSenseView(
+            f"Eyetracker {device_name} (S/N:{selected_serial})", info_text,
+            preview_fps=config["preview_fps"], preview_scale=config["preview_scale"]
+        )
+        output = build_output(config)
+        controller = Controller(
+            model, view, info_text, output, build_smoothing_chain(config), config["stats_interval"], build_predictor(config),
+            build_viewer_tracker(config)
         )
-        controller = Controller(model, view, info_text, osc_sender)
 
         def on_close():
             controller.stop()
+            if tracer.enabled:
+                print(tracer.summary_text())
+                tracer.export_chrome_trace(config["trace"])
             print("Window closed")
 
         view.protocol("WM_DELETE_WINDOW", on_close)
-        controller.update_loop()
+        controller.start()
         view.mainloop()
     except Exception as e:
         print("error:", e)
@@ -1,181 +1,316 @@
 import cv2
 import numpy as np
-import mediapipe
 import pyrealsense2 as rs
+from depth_roi import RoiDepthFilter
+from depth_sampler import DepthSampler
+from face_roi import FaceInput
+from landmark_backends import create_backend
+from landmark_flow import LandmarkPropagator
+from geometry import ColorToDepthProjector, deproject_pixels
+from tracing import tracer
+from fps_timer import FrameStats
 
-EYE_LANDMARKS = [468, 473]
+# "full": フレーム全体に RealSense のフィルタを適用, "roi": 目の周辺だけを NumPy で処理
+DEPTH_MODES = ("full", "roi")
+# "align": rs.align でデプス全体をカラー視点へ変換, "project": 目の画素だけをデプス画像へ投影
+ALIGN_MODES = ("align", "project")
 
 class RealSenseModel:
-    def __init__(self, serial, flip, width, height, fps):
+    def __init__(self, serial, flip, width, height, fps, depth_mode="full", align_mode="align",
+                 depth_window=5, depth_estimator="median", hole_filling=False, source=None, max_viewers=1,
+                 face_input="full", face_input_size=0, face_roi_padding=0.5, face_redetect_interval=30,
+                 keyframe_interval=1, keyframe_max_drift=1.0, landmark_backend="face_mesh",
+                 landmark_min_confidence=0.0):
+        if depth_mode not in DEPTH_MODES:
+            raise ValueError(f"Unknown depth mode: {depth_mode}")
+        if align_mode not in ALIGN_MODES:
+            raise ValueError(f"Unknown align mode: {align_mode}")
         self.width = width
         self.height = height
         self.flip = flip
+        self.depth_mode = depth_mode
+        self.align_mode = align_mode
+        self.hole_filling = hole_filling
+        # 2 人以上なら process_frames は全員分の目を (N, 2, 3) の配列で返す
+        self.max_viewers = max_viewers
 
+        self.source = source
+        self.recorder = None
+        # カメラから届いたフレームの間隔・欠落と、顔を見失ったフレーム数
+        self.frame_stats = FrameStats()
+        if source is None:
+            self._start_pipeline(serial, width, height, fps)
+        else:
+            # 記録の再生: rs.pipeline の代わりに source からフレームとストリームの情報を受け取る
+            self.profile = None
+            self.pipeline = source
+            self.is_stereo = source.is_stereo
+            self.depth_scale = source.depth_scale
+            self.color_format = source.color_format
+            self.intrinsics = source.color_intrinsics
+            self.depth_intrinsics = source.depth_intrinsics
+            self.color_to_depth = source.color_to_depth
+            self.depth_to_color = source.depth_to_color
+        self.fps = fps
+        self.align = rs.align(rs.stream.color)
+        self.projector = ColorToDepthProjector(
+            self.intrinsics, self.depth_intrinsics, self.color_to_depth, self.depth_to_color, self.depth_scale
+        )
+
+        # 目の位置を求める backend (FaceMesh / Haar カスケード)。信頼度が landmark_min_confidence 未満の顔は使わない
+        # "roi" では渡す画像の範囲がフレームごとに変わるので、backend にはフレーム間の追跡をさせない
+        self.backend = create_backend(landmark_backend, max_viewers, static=face_input == "roi")
+        self.landmark_min_confidence = landmark_min_confidence
+        # backend に渡す画像 (顔の周りの切り出し / 縮小)
+        self.face_input = FaceInput(
+            width, height, mode=face_input, input_size=face_input_size, padding=face_roi_padding,
+            redetect_interval=face_redetect_interval, max_faces=max_viewers
+        )
+        # keyframe_interval > 1 なら backend はキーフレームだけで動かし、間は虹彩の点をオプティカルフローで追跡する
+        self.propagator = None
+        if keyframe_interval > 1:
+            self.propagator = LandmarkPropagator(width, height, interval=keyframe_interval, max_drift=keyframe_max_drift)
+
+        # ---------------- フィルタ構築 ----------------
+        self.dec = rs.decimation_filter()
+        self.dec.set_option(rs.option.filter_magnitude, 2)
+
+        self.d2disp = rs.disparity_transform(True) if self.is_stereo else None
+        self.disp2d = rs.disparity_transform(False) if self.is_stereo else None
+
+        self.spat = rs.spatial_filter()
+        self.spat.set_option(rs.option.filter_smooth_alpha, 0.35)
+        self.spat.set_option(rs.option.filter_smooth_delta, 20)
+
+        self.temp = rs.temporal_filter()
+        self.temp.set_option(rs.option.filter_smooth_alpha, 0.1)
+        self.temp.set_option(rs.option.filter_smooth_delta, 40)
+
+        self.hole = rs.hole_filling_filter()
+        self.hole.set_option(rs.option.holes_fill, 1)
+
+        self.roi_filter = RoiDepthFilter()
+        # 複数人で temporal を後から ID ごとに掛けるときの、今フレームの (デプス画像の画素, 投影できた目)
+        self.pending_depth = None
+        # 近傍の統計で欠損を避けるので、全体の穴埋めフィルタは既定では使わない
+        self.depth_sampler = DepthSampler(depth_window, depth_estimator)
+
+        # カラーを RGB にするかどうか
+        self.color_to_rgb = self.color_format != "rgb8"
+
+
+    def _start_pipeline(self, serial, width, height, fps):
         self.pipeline = rs.pipeline()
         self.config = rs.config()
         self.config.enable_device(serial)
 
         # カラーフォーマットの設定
-        COLOR_FORMATS = (rs.format.rgb8, rs.format.bgr8, rs.format.yuyv)
-        color_format = None
-        for fmt in COLOR_FORMATS:
+        COLOR_FORMATS = (("rgb8", rs.format.rgb8), ("bgr8", rs.format.bgr8), ("yuyv", rs.format.yuyv))
+        self.color_format = None
+        for name, fmt in COLOR_FORMATS:
             try:
                 self.config.enable_stream(rs.stream.color, width, height, fmt, fps)
-                color_format = fmt
+                self.color_format = name
                 break
             except RuntimeError:
                 continue
-        if color_format is None:
+        if self.color_format is None:
             raise RuntimeError("Color stream not available at requested resolution.")
         
         # デプスフォーマットの設定
         self.config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
 
         self.profile = self.pipeline.start(self.config)
-        self.align = rs.align(rs.stream.color)
 
         # デバイス種別判定（Stereo なら D400）
         dev = self.profile.get_device()
         product_line = dev.get_info(rs.camera_info.product_line)
         self.is_stereo = product_line.upper() == "D400"
+        self.depth_scale = dev.first_depth_sensor().get_depth_scale()
 
         self.intrinsics = (
             self.profile.get_stream(rs.stream.color)
             .as_video_stream_profile()
             .get_intrinsics()
         )
+        depth_stream = self.profile.get_stream(rs.stream.depth).as_video_stream_profile()
+        color_stream = self.profile.get_stream(rs.stream.color)
+        self.depth_intrinsics = depth_stream.get_intrinsics()
+        self.color_to_depth = color_stream.get_extrinsics_to(depth_stream)
+        self.depth_to_color = depth_stream.get_extrinsics_to(color_stream)
 
-        mp_face_mesh = mediapipe.solutions.face_mesh
-        self.face_mesh = mp_face_mesh.FaceMesh(
-            static_image_mode=False,
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.9,
+    def start_recording(self, path):
+        # wait_frames() で受け取った生のフレームを、アライメントやフィルタの前に記録する
+        from recording import FrameRecorder
+        self.recorder = FrameRecorder(
+            path, self.width, self.height, self.color_format, self.intrinsics, self.depth_intrinsics,
+            self.color_to_depth, self.depth_to_color, self.depth_scale, fps=self.fps, is_stereo=self.is_stereo
         )
-        self.mp_drawing = mediapipe.solutions.drawing_utils
-        self.mp_drawing_styles = mediapipe.solutions.drawing_styles
-
-        # ---------------- フィルタ構築 ----------------
-        self.dec = rs.decimation_filter()
-        self.dec.set_option(rs.option.filter_magnitude, 2)
-
-        self.d2disp = rs.disparity_transform(True) if self.is_stereo else None
-        self.disp2d = rs.disparity_transform(False) if self.is_stereo else None
-
-        self.spat = rs.spatial_filter()
-        self.spat.set_option(rs.option.filter_smooth_alpha, 0.35)
-        self.spat.set_option(rs.option.filter_smooth_delta, 20)
-
-        self.temp = rs.temporal_filter()
-        self.temp.set_option(rs.option.filter_smooth_alpha, 0.1)
-        self.temp.set_option(rs.option.filter_smooth_delta, 40)
-
-        self.hole = rs.hole_filling_filter()
-        self.hole.set_option(rs.option.holes_fill, 1)
-
-        # カラーを RGB にするかどうか
-        self.color_to_rgb = color_format != rs.format.rgb8
 
+    @property
+    def finished(self):
+        # 記録の再生が最後まで進んだかどうか (実機では常に False)
+        return getattr(self.source, "finished", False)
 
     def process_frame(self):
+        frames = self.wait_frames()
+        if frames is None:
+            return None, None, None
+        return self.process_frames(frames)
+
+    def wait_frames(self):
+        wait_start = tracer.now()
         try:
             frames = self.pipeline.wait_for_frames()
         except RuntimeError:
-            return None, None  # device disconnected?
-        
-        aligned_frames = self.align.process(frames)
-        depth_frame = aligned_frames.get_depth_frame()
-        color_frame = aligned_frames.get_color_frame()
+            return None  # device disconnected?
+        tracer.begin_frame(frames, wait_start)
+        self.frame_stats.update(frames.get_frame_number())
+        if self.recorder is not None:
+            with tracer.span("record"):
+                self.recorder.write(frames)
+        return frames
+
+    def process_frames(self, frames):
+        if self.align_mode == "align":
+            with tracer.span("align"):
+                frames = self.align.process(frames)
+        depth_frame = frames.get_depth_frame()
+        color_frame = frames.get_color_frame()
         if not depth_frame or not color_frame:
-            return None, None
+            return None, None, None
         
         # フィルターを適用
-        depth_frame = self.dec.process(depth_frame)
-        if self.is_stereo:
-            depth_frame = self.d2disp.process(depth_frame)
-        depth_frame = self.spat.process(depth_frame)
-        depth_frame = self.temp.process(depth_frame)
-        if self.is_stereo:
-            depth_frame = self.disp2d.process(depth_frame)
-        depth_frame = self.hole.process(depth_frame)
-        depth_frame = depth_frame.as_depth_frame()
+        if self.depth_mode == "full":
+            with tracer.span("decimation"):
+                depth_frame = self.dec.process(depth_frame)
+            if self.is_stereo:
+                with tracer.span("to_disparity"):
+                    depth_frame = self.d2disp.process(depth_frame)
+            with tracer.span("spatial"):
+                depth_frame = self.spat.process(depth_frame)
+            with tracer.span("temporal"):
+                depth_frame = self.temp.process(depth_frame)
+            if self.is_stereo:
+                with tracer.span("to_depth"):
+                    depth_frame = self.disp2d.process(depth_frame)
+            if self.hole_filling:
+                with tracer.span("hole_filling"):
+                    depth_frame = self.hole.process(depth_frame)
+            depth_frame = depth_frame.as_depth_frame()
+        if self.align_mode == "project":
+            self.update_depth_intrinsics(depth_frame)
         color_arr = np.asanyarray(color_frame.get_data())
-        if self.color_to_rgb:
-            if color_frame.get_profile().format == rs.format.yuyv:
-                color_arr = cv2.cvtColor(color_arr, cv2.COLOR_YUV2RGB_YUYV)
-            else:
-                color_arr = cv2.cvtColor(color_arr, cv2.COLOR_BGR2RGB)
+        with tracer.span("color_convert"):
+            if self.color_to_rgb:
+                if color_frame.get_profile().format == rs.format.yuyv:
+                    color_arr = cv2.cvtColor(color_arr, cv2.COLOR_YUV2RGB_YUYV)
+                else:
+                    color_arr = cv2.cvtColor(color_arr, cv2.COLOR_BGR2RGB)
 
-        if self.flip:
-            color_arr = cv2.flip(color_arr, -1)
-        results = self.face_mesh.process(color_arr)
+            if self.flip:
+                color_arr = cv2.flip(color_arr, -1)
+        faces = None
+        if self.propagator is not None:
+            with tracer.span("optical_flow"):
+                faces = self.propagator.track(color_arr)
+        if faces is None:
+            with tracer.span("face_input"):
+                face_image, roi = self.face_input.prepare(color_arr)
+            with tracer.span("landmarks"):
+                faces = self.backend.process(face_image)
+            if self.landmark_min_confidence > 0:
+                faces = [face for face in faces if face.confidence >= self.landmark_min_confidence]
+            with tracer.span("face_input"):
+                self.face_input.update(faces, roi)
+            if self.propagator is not None:
+                self.propagator.keyframe(faces)
+        else:
+            # 追跡した顔の位置でも次の ROI を決める
+            self.face_input.update(faces, None)
+        self.frame_stats.count_face(bool(faces))
         eye_pos = None
-        if results.multi_face_landmarks:
-            for face_landmarks in results.multi_face_landmarks:
-                self.mp_drawing.draw_landmarks(
-                    image=color_arr,
-                    landmark_list=face_landmarks,
-                    connections=mediapipe.solutions.face_mesh.FACEMESH_TESSELATION,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=self.mp_drawing_styles.get_default_face_mesh_tesselation_style()
-                )
-                self.mp_drawing.draw_landmarks(
-                    image=color_arr,
-                    landmark_list=face_landmarks,
-                    connections=mediapipe.solutions.face_mesh.FACEMESH_CONTOURS,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=self.mp_drawing_styles.get_default_face_mesh_contours_style()
-                )
-                self.mp_drawing.draw_landmarks(
-                    image=color_arr,
-                    landmark_list=face_landmarks,
-                    connections=mediapipe.solutions.face_mesh.FACEMESH_IRISES,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=self.mp_drawing_styles.get_default_face_mesh_iris_connections_style()
-                )
-
-                eye_right_point = face_landmarks.landmark[EYE_LANDMARKS[0]]
-                eye_right_pixel = self.keypoint_to_pixel(eye_right_point)
-                # eye_right_normalized = self.transform_pixel_to_normalized(eye_right_pixel[0], eye_right_pixel[1])
-                eye_right_depth = self.get_depth_at_pixel(eye_right_pixel[0], eye_right_pixel[1], depth_frame)
-                # eye_right_pos = self.deprojection(eye_right_pixel[0], eye_right_pixel[1], eye_right_depth)
-                
-                eye_left_point = face_landmarks.landmark[EYE_LANDMARKS[1]]
-                eye_left_pixel = self.keypoint_to_pixel(eye_left_point)
-                # eye_left_normalized = self.transform_pixel_to_normalized(eye_left_pixel[0], eye_left_pixel[1])
-                eye_left_depth = self.get_depth_at_pixel(eye_left_pixel[0], eye_left_pixel[1], depth_frame)
-                # eye_left_pos = self.deprojection(eye_left_pixel[0], eye_left_pixel[1], eye_left_depth)
-
-                # left hand coordinate system
-                # eye_right_pos = (eye_right_pos[0], -eye_right_pos[1], eye_right_pos[2])
-                # eye_left_pos = (eye_left_pos[0], -eye_left_pos[1], eye_left_pos[2])
-                eye_right_pos = (eye_right_pixel[0], eye_right_pixel[1], eye_right_depth)
-                eye_left_pos = (eye_left_pixel[0], eye_left_pixel[1], eye_left_depth)
-
-                eye_pos = (eye_right_pos, eye_left_pos)
-
-        return color_arr, eye_pos
-
-    def keypoint_to_pixel(self, keypoint):
-        width, height = self.width, self.height
-        x = np.clip(int(keypoint.x * width), 0, width - 1)
-        y = np.clip(int(keypoint.y * height), 0, height - 1)
-        return (x, y)
+        if faces:
+            # 全員の目の画素を並べて、デプスは 1 回の呼び出しでまとめて引く (人数が増えても NumPy の呼び出し回数は同じ)
+            pixels = self.normalized_to_pixels(np.array([face.eyes for face in faces]))
+            with tracer.span("depth_lookup"):
+                # 複数人では誰の目かがまだわからないので、roi の temporal は locate_viewers で ID が決まってから掛ける
+                depths = self.lookup_depths(pixels, depth_frame, defer_history=self.max_viewers > 1)
+            eyes = np.column_stack((pixels, depths)).reshape(-1, 2, 3)
+            if self.max_viewers == 1:
+                # (右目, 左目) の (x, y, depth)
+                right, left = eyes[0].tolist()
+                eye_pos = (tuple(right), tuple(left))
+            else:
+                eye_pos = eyes
+        else:
+            # 顔を見失ったら ROI の追跡をやり直す
+            self.roi_filter.reset()
+            self.pending_depth = None
+
+        # ランドマークは描画せずにそのまま返す（描画は表示する側で必要なときだけ行う）
+        return color_arr, eye_pos, faces
+
+    def normalized_to_pixels(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        pixels = (points * [self.width, self.height]).astype(np.int64)
+        return np.clip(pixels, 0, [self.width - 1, self.height - 1])
     
-    def get_depth_at_pixel(self, x, y, depth_frame):
+    def update_depth_intrinsics(self, depth_frame):
+        # デシメーション後はデプス画像の解像度が変わるので、そのフレームの内部パラメータを使う
+        intrinsics = self.projector.depth_intrinsics
+        if (depth_frame.get_width(), depth_frame.get_height()) != (intrinsics.width, intrinsics.height):
+            self.projector.depth_intrinsics = depth_frame.profile.as_video_stream_profile().get_intrinsics()
+
+    def lookup_depths(self, pixels, depth_frame, defer_history=False):
+        # roi の temporal の履歴は目の番号をキーにする (1 人なら右目・左目の順は変わらない)
+        # defer_history=True なら temporal を掛けずに返し、locate_viewers で人の ID をキーにして掛け直す
+        # get_data() のバッファをコピーせずに NumPy から参照する
+        depth_arr = np.asanyarray(depth_frame.get_data())
+        depth_height, depth_width = depth_arr.shape
+        depth_pixels = self.to_depth_pixels(pixels, depth_width, depth_height)
+        valid = np.ones(len(depth_pixels), dtype=bool)
+        if self.align_mode == "project":
+            # 投影できなかった目は対応する画素がわからないので、解像度の比で求めた画素も使わずに無効 (0) にする
+            depth_data = depth_frame.get_data()
+            for i, color_pixel in enumerate(self.unflip_pixels(pixels)):
+                depth_pixel = self.projector.project_pixel(depth_data, color_pixel)
+                if depth_pixel is None:
+                    valid[i] = False
+                else:
+                    depth_pixels[i] = depth_pixel
+        depths = np.zeros(len(depth_pixels))
+        self.pending_depth = None
+        if valid.any():
+            if self.depth_mode == "roi":
+                keys = None if defer_history else np.flatnonzero(valid).tolist()
+                depths[valid] = self.roi_filter.process(depth_arr, depth_pixels[valid], self.depth_scale, keys)
+                if defer_history:
+                    self.pending_depth = (depth_pixels, valid)
+            else:
+                depths[valid] = self.depth_sampler.sample(depth_arr, depth_pixels[valid], self.depth_scale)
+        if self.align_mode == "project":
+            # デプスカメラ基準の距離をカラーカメラ基準の z に直す
+            depths = self.projector.depth_in_color_frame(depth_pixels, depths)
+        return depths
+
+    def unflip_pixels(self, pixels):
+        pixels = np.asarray(pixels, dtype=np.int64).reshape(-1, 2)
         if self.flip:
-            x = np.clip(self.width - 1 - x, 0, self.width - 1)
-            y = np.clip(self.height - 1 - y, 0, self.height - 1)
+            pixels = np.array([self.width - 1, self.height - 1]) - pixels
+            pixels = np.clip(pixels, 0, [self.width - 1, self.height - 1])
+        return pixels
 
-        # --- 解像度スケールを算出 ---
-        scale_x = depth_frame.get_width()  / self.width
-        scale_y = depth_frame.get_height() / self.height
+    def to_depth_pixels(self, pixels, depth_width, depth_height):
+        pixels = self.unflip_pixels(pixels)
 
-        dx = int(np.clip(x * scale_x, 0, depth_frame.get_width()  - 1))
-        dy = int(np.clip(y * scale_y, 0, depth_frame.get_height() - 1))
+        # --- 解像度スケールを算出 ---
+        scale = np.array([depth_width / self.width, depth_height / self.height])
+        return np.clip((pixels * scale).astype(np.int64), 0, [depth_width - 1, depth_height - 1])
 
-        return depth_frame.get_distance(dx, dy)
+    def get_depth_at_pixel(self, x, y, depth_frame):
+        dx, dy = self.to_depth_pixels((x, y), depth_frame.get_width(), depth_frame.get_height())[0]
+        return depth_frame.get_distance(int(dx), int(dy))
     
     def transform_pixel_to_normalized(self, x, y):
         intrinsics = self.intrinsics
@@ -187,8 +322,47 @@ class RealSenseModel:
         x,y,z = rs.rs2_deproject_pixel_to_point(self.intrinsics, [x, y], depth)
         return (x, -y, z)
 
+    def locate_viewers(self, eyes, tracker):
+        # eyes: process_frames の全員分の (N, 2, 3) の (x, y, depth)。ワールド座標にして tracker で ID を付け、
+        # roi モードでは temporal を (ID, 目) ごとの履歴で掛けたデプスで座標を求め直す
+        # (ViewerTracker.associate の結果, (N, 2, 3) のワールド座標) を返す
+        eyes = np.asarray(eyes, dtype=np.float64).reshape(-1, 2, 3)
+        faces = self.deproject_eyes(eyes)
+        matches = tracker.associate(faces)
+        if self.pending_depth is None:
+            return matches, faces
+        depth_pixels, valid = self.pending_depth
+        self.pending_depth = None
+        # 投影できた目だけが roi フィルタに渡っているので、その中での順番 (行) に直す
+        rows = np.cumsum(valid) - 1
+        keys, eye_indices = [], []
+        for viewer, index in matches:
+            for side in (0, 1):
+                if valid[2 * index + side]:
+                    keys.append((viewer.id, side))
+                    eye_indices.append(2 * index + side)
+        eye_indices = np.array(eye_indices, dtype=np.int64)
+        depths = self.roi_filter.apply_history(keys, rows[eye_indices])
+        if not len(eye_indices):
+            return matches, faces
+        if self.align_mode == "project":
+            depths = self.projector.depth_in_color_frame(depth_pixels[eye_indices], depths)
+        eyes = eyes.copy()
+        eyes.reshape(-1, 3)[eye_indices, 2] = depths
+        return matches, self.deproject_eyes(eyes)
+
+    def deproject_eyes(self, eyes):
+        # (..., 3) の (x, y, depth) をまとめてデプロジェクションする (deprojection と同じく y を反転)
+        eyes = np.asarray(eyes, dtype=np.float64)
+        points = deproject_pixels(self.intrinsics, eyes[..., :2], eyes[..., 2]).reshape(eyes.shape)
+        points[..., 1] *= -1
+        return points
+
     def close(self):
         self.pipeline.stop()
         print("Pipeline stopped")
-        self.face_mesh.close()
-        print("Face mesh closed")
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        self.backend.close()
+        print("Landmark backend closed")
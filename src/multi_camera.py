@@ -0,0 +1,237 @@
+import multiprocessing
+import queue
+import signal
+import time
+import traceback
+import numpy as np
+from settings import build_model, build_output, build_smoothing_chain, build_predictor
+from fps_timer import FrameStats
+
+# 複数のカメラで広い範囲を見るためのモード
+# カメラごとに capture + FaceMesh + デプロジェクションを別プロセスで動かし (GIL を取り合わずにコアごとに並列に動く)、
+# 各カメラの外部パラメータでワールド座標に直した眼の位置をメインプロセスで融合してから、1 つの出力に送る
+#
+# 設定の "cameras" は次の dict のリスト。書いていないキーは全体の設定を使う
+#   {"serial": "...", "transform": {"rotation": 3x3, "translation": [x, y, z]}, "flip": 1, ...}
+#   {"replay": "cam0.rec", "transform": ...}  (記録の再生)
+# transform はカメラ座標 (単眼のときに送っている座標) からワールド座標への変換 p_world = R p_camera + t
+
+# カメラごとに上書きできる設定
+CAMERA_KEYS = ("serial", "replay", "replay_realtime", "replay_loop", "record", "flip", "width", "height", "fps",
+               "depth_mode", "align_mode", "depth_window", "depth_estimator", "hole_filling", "face_input",
+               "face_input_size", "face_roi_padding", "keyframe_interval", "keyframe_max_drift", "landmark_backend",
+               "landmark_min_confidence", "transform")
+
+STATUS_INTERVAL = 10.0
+
+def camera_transform(camera):
+    transform = camera.get("transform") or {}
+    rotation = np.asarray(transform.get("rotation", np.eye(3)), dtype=np.float64).reshape(3, 3)
+    translation = np.asarray(transform.get("translation", (0.0, 0.0, 0.0)), dtype=np.float64).reshape(3)
+    if not np.allclose(rotation @ rotation.T, np.eye(3), atol=1e-3):
+        raise ValueError("Camera rotation must be orthonormal")
+    return rotation, translation
+
+def camera_config(config, camera):
+    if isinstance(camera, str):
+        # コマンドラインの --camera: シリアル番号か記録ファイル
+        camera = {"replay": camera} if camera.endswith(".rec") else {"serial": camera}
+    unknown = set(camera) - set(CAMERA_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown camera keys: {', '.join(sorted(unknown))}")
+    if not camera.get("serial") and not camera.get("replay"):
+        raise ValueError("Each camera needs a serial or a replay file")
+    merged = dict(config, serial=None, replay=None, record=None, cameras=[])
+    merged.update(camera)
+    camera_transform(merged)
+    return merged
+
+def camera_worker(index, config, results, stop, source_factory=None):
+    # 子プロセス: 1 台分の処理をして、("pose", index, 届いた時刻, (ワールド座標 (2, 3), 信頼度 (2,)) or None) を送る
+    # 時刻はプロセス間で共通の perf_counter を使う
+    # Ctrl+C はメインプロセスが受けて stop で止める (子プロセスが途中で KeyboardInterrupt にならないように)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        rotation, translation = camera_transform(config)
+        model = build_model(config, source_factory() if source_factory is not None else None)
+    except Exception as e:
+        traceback.print_exc()
+        results.put(("stopped", index, repr(e)))
+        return
+    last_stats = time.monotonic()
+    try:
+        while not stop.is_set():
+            frames = model.wait_frames()
+            if frames is None:
+                if model.finished:
+                    break
+                continue
+            arrival = time.perf_counter()
+            frame, eye_pos, _ = model.process_frames(frames)
+            if frame is None:
+                continue
+            sample = None
+            if eye_pos is not None:
+                points = np.array([model.deprojection(*eye_pos[0]), model.deprojection(*eye_pos[1])])
+                # デプスの誤差は距離の 2 乗で増えるので、近くから見ているカメラほど重くする (デプスが取れなければ 0)
+                depth = points[:, 2]
+                confidence = np.where(depth > 0, 1.0 / np.maximum(depth, 0.1) ** 2, 0.0)
+                sample = ((points @ rotation.T + translation).tolist(), confidence.tolist())
+            results.put(("pose", index, arrival, sample))
+            t = time.monotonic()
+            if t - last_stats >= config["stats_interval"]:
+                results.put(("stats", index, model.frame_stats.snapshot()))
+                last_stats = t
+    except Exception:
+        traceback.print_exc()
+    finally:
+        model.close()
+        results.put(("stopped", index, None))
+
+class PoseFusion:
+    # カメラごとの最新の眼の位置を、信頼度と新しさで重み付けして平均する
+    # max_age 秒より古い位置は使わず、新しさの重みは 1 - age / max_age (カメラごとに撮影時刻がずれるため)
+    def __init__(self, count, max_age=0.1):
+        self.max_age = max_age
+        self.samples = [None] * count
+        self.last_used = 0
+
+    def update(self, index, t, sample):
+        # 顔を見失ったカメラ (sample=None) はそれまでの位置も使わない
+        if sample is None:
+            self.samples[index] = None
+        else:
+            world, confidence = sample
+            self.samples[index] = (t, np.asarray(world, dtype=np.float64), np.asarray(confidence, dtype=np.float64))
+
+    def fuse(self, now):
+        total = np.zeros((2, 3))
+        weight = np.zeros(2)
+        self.last_used = 0
+        for sample in self.samples:
+            if sample is None:
+                continue
+            t, world, confidence = sample
+            age = now - t
+            if age > self.max_age:
+                continue
+            w = confidence * (1.0 - max(age, 0.0) / self.max_age)
+            total += world * w[:, None]
+            weight += w
+            self.last_used += 1
+        if not (weight > 0).all():
+            return None
+        return (total / weight[:, None]).tolist()
+
+def merge_camera_stats(snapshots):
+    # カメラごとの FrameStats.snapshot() を出力の統計メッセージ用に 1 つにまとめる (数は合計、間隔は最悪のカメラ)
+    stats = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if key.startswith("interval_") or key == "jitter_ms":
+                stats[key] = max(stats.get(key, 0.0), value)
+            elif key != "face_lost_ratio":
+                stats[key] = stats.get(key, 0) + value
+    if "frames" in stats:
+        stats["face_lost_ratio"] = stats["face_lost"] / stats["frames"] if stats["frames"] else 0.0
+    return stats
+
+class MultiCameraRunner:
+    # HeadlessRunner と同じ run / stop を持つ。source_factories を渡すと (テスト用)、カメラごとにそれで合成カメラなどを作る
+    def __init__(self, config, source_factories=None):
+        self.config = config
+        self.cameras = [camera_config(config, camera) for camera in config["cameras"]]
+        self.running = False
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        self.stop_event = self.context.Event()
+        factories = source_factories or [None] * len(self.cameras)
+        self.processes = [
+            self.context.Process(target=camera_worker, args=(i, camera, self.results, self.stop_event, factories[i]),
+                                 name=f"eyetracker-camera{i}", daemon=True)
+            for i, camera in enumerate(self.cameras)
+        ]
+        self.fusion = PoseFusion(len(self.cameras), config["fusion_max_age_ms"] / 1000)
+        self.output = build_output(config)
+        self.smoothing = build_smoothing_chain(config)
+        self.predictor = build_predictor(config)
+        self.fps_timer = FrameStats(max_samples=30)
+        self.camera_stats = [{} for _ in self.cameras]
+        self.camera_poses = [0] * len(self.cameras)
+        self.fused = 0
+
+    def describe(self):
+        return ", ".join(f"cam{i} {camera['serial'] or camera['replay']}" for i, camera in enumerate(self.cameras))
+
+    def stop(self, signum=None, frame=None):
+        self.running = False
+
+    def run(self):
+        self.running = True
+        alive = len(self.processes)
+        for process in self.processes:
+            process.start()
+        last_status = last_stats = time.monotonic()
+        try:
+            while self.running and alive:
+                try:
+                    message = self.results.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                kind, index = message[0], message[1]
+                if kind == "pose":
+                    _, _, arrival, sample = message
+                    self.camera_poses[index] += 1
+                    self.fusion.update(index, arrival, sample)
+                    self.output_pose(arrival)
+                elif kind == "stats":
+                    self.camera_stats[index] = message[2]
+                elif kind == "stopped":
+                    alive -= 1
+                    print(f"camera {index} stopped" + (f": {message[2]}" if message[2] else ""), flush=True)
+                t = time.monotonic()
+                if t - last_stats >= self.config["stats_interval"]:
+                    stats = merge_camera_stats(self.camera_stats)
+                    stats["output_fps"] = float(self.fps_timer.get_fps())
+                    stats.update(self.output.snapshot())
+                    self.output.send_stats(stats)
+                    last_stats = t
+                if t - last_status >= STATUS_INTERVAL:
+                    print(self.status_text(), flush=True)
+                    last_status = t
+        finally:
+            self.close()
+
+    def output_pose(self, arrival):
+        # どれかのカメラから位置が届くたびに融合して送る
+        eye_pos = self.fusion.fuse(time.perf_counter())
+        if eye_pos is not None:
+            self.fps_timer.update()
+            self.fused += 1
+            eye_pos = self.smoothing.process(eye_pos)
+            if self.predictor is not None:
+                eye_pos = self.predictor.predict(eye_pos, self.smoothing.motion(), arrival=arrival)
+        self.output.send(eye_pos)
+
+    def status_text(self):
+        status = f"{self.fps_timer.get_fps():.1f} fps fused"
+        for i, stats in enumerate(self.camera_stats):
+            if stats:
+                status += (f"  cam{i} {stats['fps']:.1f} fps dropped {stats['dropped']}"
+                           f" face lost {stats['face_lost_ratio'] * 100:.0f}%")
+        return status
+
+    def close(self):
+        self.stop_event.set()
+        # 子プロセスはキューに送りかけたデータを書き終えるまで終了しないので、待つ間もキューを空にしておく
+        deadline = time.monotonic() + 5.0
+        while any(process.is_alive() for process in self.processes) and time.monotonic() < deadline:
+            try:
+                self.results.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self.output.close()
@@ -1,8 +1,96 @@
-from pythonosc import udp_client
+import ipaddress
+import socket
+import struct
+import threading
+import time
+from collections import deque
+import numpy as np
+from pythonosc.osc_message_builder import build_msg
+from pipeline import LatestQueue
+from tracing import tracer
+
+# OSC の timetag は 1900 年起点の NTP 形式 (上位 32bit が秒, 下位 32bit が秒の小数部)
+NTP_EPOCH_OFFSET = 2208988800
+TIMETAG_IMMEDIATE = 1
+# これより小さいタイムスタンプは UNIX 時刻ではない (ハードウェアクロック = デバイス起動からの ms) とみなす
+UNIX_TIME_MIN_MS = 1e12
+
+BUNDLE_HEADER = b"#bundle\0"
+TIMETAG = struct.Struct(">Q")
+SIZE = struct.Struct(">i")
+FLOAT3 = struct.Struct(">3f")
+
+def osc_string(s):
+    # OSC の文字列は NUL 終端して 4 バイト境界まで NUL で埋める
+    data = s.encode("ascii") + b"\0"
+    return data + b"\0" * (-len(data) % 4)
+
+FLOAT3_TAGS = osc_string(",fff")
+SIDES = ("right", "left", "center")
+# Windows の socket には sendmsg がないので、そのときは送る部分を連結してから送る
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+def osc_timetag(timestamp_ms):
+    # RealSense のフレームのタイムスタンプ (ms) を timetag にする
+    # システム時刻 / グローバル時刻のドメインなら UNIX 時刻なのでそのまま変換し、そうでなければ「即時」にする
+    if timestamp_ms is None or timestamp_ms < UNIX_TIME_MIN_MS:
+        return TIMETAG_IMMEDIATE
+    return int((timestamp_ms / 1000 + NTP_EPOCH_OFFSET) * 2**32)
+
+def parse_destination(text):
+    # "host:port" または "host:port=right,center" (送るアドレスを限定する)
+    target, _, sides = text.partition("=")
+    host, _, port = target.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid OSC destination: {text}")
+    destination = {"ip": host.strip("[]"), "port": int(port)}
+    if sides:
+        names = [side.strip() for side in sides.split(",")]
+        for name in names:
+            if name not in SIDES + ("stats",):
+                raise ValueError(f"Unknown OSC address in destination: {name}")
+        for name in SIDES + ("stats",):
+            destination[f"{name}_enable"] = name in names
+    return destination
+
+class OSCDestination:
+    # 送信先 1 つ分。アドレスごとの有効/無効は送信先ごとに変えられる (指定がなければ OSCSender の設定に従う)
+    def __init__(self, ip, port, address, enables, stats_enable):
+        self.ip = ip
+        self.port = port
+        self.address = address
+        self.enables = enables
+        self.stats_enable = stats_enable
+        # この送信先への送信に失敗した回数。続けて失敗している間は failing を立てて、表示は最初の 1 回だけにする
+        self.failed = 0
+        self.failing = False
+
+    def failure(self, e):
+        self.failed += 1
+        if not self.failing:
+            print(f"Error sending OSC to {self}:", repr(e))
+            self.failing = True
+
+    def __repr__(self):
+        return f"{self.ip}:{self.port}"
+
+class PosePacket:
+    # 1 人分の right/left/center を並べたバッファと、送信先ごとに送る部分
+    def __init__(self, packet, value_offsets, targets):
+        self.packet = packet
+        self.value_offsets = value_offsets  # right, left, center の値の位置 (どの送信先でも無効なら None)
+        self.targets = targets              # (OSCDestination, bundle のときの部分, bundle でないときのメッセージ)
 
 class OSCSender:
+    # 統計メッセージの引数の順番
+    STATS_FIELDS = ("fps", "output_fps", "interval_p50_ms", "interval_p95_ms", "interval_p99_ms", "jitter_ms",
+                    "frames", "dropped", "duplicated", "face_lost", "face_lost_ratio",
+                    "osc_latency_p50_ms", "osc_latency_p99_ms", "osc_dropped", "osc_failed")
+
     def __init__(self, ip, port, right_addr="/eye/right", left_addr="/eye/left", center_addr="/eye/center",
-                 right_enable=True, left_enable=True, center_enable=True):
+                 right_enable=True, left_enable=True, center_enable=True,
+                 stats_addr="/eyetracker/stats", stats_enable=False, bundle=False, destinations=(), multicast_ttl=1,
+                 viewers=1, viewer_prefix="/viewer/{id}", viewers_addr="/eyetracker/viewers"):
         self.ip = ip
         self.port = port
         self.right_addr = right_addr
@@ -11,18 +99,254 @@ class OSCSender:
         self.right_enable = right_enable
         self.left_enable = left_enable
         self.center_enable = center_enable
+        self.stats_addr = stats_addr
+        self.stats_enable = stats_enable
+        # True なら right/left/center を 1 つの bundle (1 データグラム) にまとめて送る
+        self.bundle = bundle
+        # 複数人のときは人ごとに viewer_prefix (ID を埋め込む) を付けたアドレスで送り、
+        # 毎フレーム viewers_addr に見えている人の ID の一覧を送る
+        self.viewers = viewers
+        self.viewers_addr = viewers_addr
+        # ip/port が主な送信先で、destinations (dict のリスト) は同じ内容を送る追加の送信先
+        # 全送信先に 1 つのソケットから送る (マルチキャスト / ブロードキャストのアドレスも使える)
+        self.sock = None
+        self.destinations = []
         try:
-            self.client = udp_client.SimpleUDPClient(self.ip, self.port)
+            for d in [{"ip": ip, "port": port}] + list(destinations):
+                self._add_destination(d, multicast_ttl)
         except Exception as e:
             print("Error creating OSC client:", e)
-            self.client = None
-
-    def send(self, eye_pos):
-        if self.client is not None:
-            if eye_pos is not None:
-                if self.right_enable:
-                    self.client.send_message(self.right_addr, eye_pos[0])
-                if self.left_enable:
-                    self.client.send_message(self.left_addr, eye_pos[1])
-                if self.center_enable:
-                    self.client.send_message(self.center_addr, [(eye_pos[0][i] + eye_pos[1][i]) / 2 for i in range(3)])
\ No newline at end of file
+            self.destinations = []
+        if viewers == 1:
+            self.packets = [self._build_packet("")]
+        else:
+            self.packets = [self._build_packet(viewer_prefix.format(id=i)) for i in range(viewers)]
+        self.viewer_targets = [d for d in self.destinations if any(d.enables)]
+
+    def _add_destination(self, d, multicast_ttl):
+        family, _, _, _, address = socket.getaddrinfo(d["ip"], d["port"], type=socket.SOCK_DGRAM)[0]
+        if self.sock is None:
+            self.sock = socket.socket(family, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+            if family == socket.AF_INET:
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        elif self.sock.family != family:
+            raise ValueError(f"OSC destinations mix IPv4 and IPv6: {d['ip']}")
+        if ipaddress.ip_address(address[0]).is_multicast:
+            if family == socket.AF_INET:
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+            else:
+                self.sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS, multicast_ttl)
+        enables = tuple(d.get(f"{side}_enable", getattr(self, f"{side}_enable")) for side in SIDES)
+        self.destinations.append(
+            OSCDestination(d["ip"], d["port"], address, enables, d.get("stats_enable", self.stats_enable))
+        )
+
+    def _build_packet(self, prefix):
+        # どこかの送信先で有効なアドレスのメッセージを bundle の形で 1 つのバッファに並べておき、
+        # 毎フレームは値と timetag だけを書き込む (エンコードはフレームごとに 1 回だけ)
+        # 各送信先にはこのバッファの部分 (memoryview) を送る。bundle でないときは各メッセージを個別のデータグラムにする
+        header_size = len(BUNDLE_HEADER) + TIMETAG.size
+        parts = [BUNDLE_HEADER, TIMETAG.pack(TIMETAG_IMMEDIATE)]
+        offset = header_size
+        value_offsets = []
+        elements = []  # bundle の要素 (サイズ + メッセージ) の範囲
+        for i, addr in enumerate((self.right_addr, self.left_addr, self.center_addr)):
+            if not any(d.enables[i] for d in self.destinations):
+                value_offsets.append(None)
+                elements.append(None)
+                continue
+            head = osc_string(prefix + addr) + FLOAT3_TAGS
+            size = len(head) + FLOAT3.size
+            parts.append(SIZE.pack(size) + head + b"\0" * FLOAT3.size)
+            value_offsets.append(offset + SIZE.size + len(head))
+            elements.append((offset, offset + SIZE.size + size))
+            offset += SIZE.size + size
+        packet = bytearray(b"".join(parts))
+        view = memoryview(packet)
+        targets = []
+        for d in self.destinations:
+            ranges = [element for element, enable in zip(elements, d.enables) if enable]
+            if not ranges:
+                continue
+            datagrams = [view[start + SIZE.size:end] for start, end in ranges]
+            # 隣り合う要素はまとめて、ヘッダと合わせた部分の数をできるだけ減らす
+            merged = [(0, header_size)]
+            for start, end in ranges:
+                if merged[-1][1] == start:
+                    merged[-1] = (merged[-1][0], end)
+                else:
+                    merged.append((start, end))
+            targets.append((d, [view[start:end] for start, end in merged], datagrams))
+        return PosePacket(packet, value_offsets, targets)
+
+    def send(self, eye_pos, timestamp=None, viewer=0):
+        pose_packet = self.packets[viewer]
+        if eye_pos is None or not pose_packet.targets:
+            return
+        right, left = eye_pos
+        right_offset, left_offset, center_offset = pose_packet.value_offsets
+        packet = pose_packet.packet
+        if right_offset is not None:
+            FLOAT3.pack_into(packet, right_offset, right[0], right[1], right[2])
+        if left_offset is not None:
+            FLOAT3.pack_into(packet, left_offset, left[0], left[1], left[2])
+        if center_offset is not None:
+            FLOAT3.pack_into(packet, center_offset,
+                             (right[0] + left[0]) * 0.5, (right[1] + left[1]) * 0.5, (right[2] + left[2]) * 0.5)
+        sock = self.sock
+        # 送信先ごとに失敗を受け止める。届かない送信先 (EHOSTUNREACH など) や送信バッファが一杯の送信先があっても、
+        # 残りの送信先には送る
+        if self.bundle:
+            TIMETAG.pack_into(packet, len(BUNDLE_HEADER), osc_timetag(timestamp))
+            for d, parts, _ in pose_packet.targets:
+                try:
+                    if len(parts) == 1:
+                        sock.sendto(parts[0], d.address)
+                    elif HAS_SENDMSG:
+                        sock.sendmsg(parts, (), 0, d.address)
+                    else:
+                        sock.sendto(b"".join(parts), d.address)
+                except OSError as e:
+                    d.failure(e)
+                else:
+                    d.failing = False
+        else:
+            for d, _, datagrams in pose_packet.targets:
+                try:
+                    for datagram in datagrams:
+                        sock.sendto(datagram, d.address)
+                except OSError as e:
+                    d.failure(e)
+                else:
+                    d.failing = False
+
+    def send_viewers(self, viewers, timestamp=None):
+        # viewers: (ID, 眼の位置) のリスト。人ごとのアドレスで送ってから、見えている人の ID の一覧を送る
+        for viewer, eye_pos in viewers:
+            self.send(eye_pos, timestamp, viewer)
+        if self.viewer_targets:
+            dgram = build_msg(self.viewers_addr, [viewer for viewer, _ in viewers]).dgram
+            self._send_all(dgram, self.viewer_targets)
+
+    def send_stats(self, stats):
+        targets = [d for d in self.destinations if d.stats_enable]
+        if targets:
+            dgram = build_msg(self.stats_addr, [stats.get(key, 0) for key in self.STATS_FIELDS]).dgram
+            self._send_all(dgram, targets)
+
+    def _send_all(self, dgram, destinations):
+        for d in destinations:
+            try:
+                self.sock.sendto(dgram, d.address)
+            except OSError as e:
+                d.failure(e)
+            else:
+                d.failing = False
+
+    def failures(self):
+        # 送信先 ("host:port") ごとの失敗した回数
+        return {repr(d): d.failed for d in self.destinations}
+
+class OSCWorker:
+    # 送信を専用スレッドで行う OSCSender のラッパー (send / send_stats は同じ呼び方)
+    # 追跡側は LatestQueue に最新の姿勢を置くだけで戻り、送信が詰まったら古い姿勢は捨てて最新のものだけを送る
+    # 送信の遅れ (キューに置いてから送り終わるまで) と、捨てた数・失敗した数を snapshot() で返す
+    # 送信先ごとの失敗は OSCSender が数えて他の送信先への送信を続けるので、failed はそれ以外で送れなかった姿勢の数
+    def __init__(self, sender, latency_samples=256):
+        self.sender = sender
+        self.queue = LatestQueue()
+        self.pending_stats = None
+        self.latencies = deque(maxlen=latency_samples)
+        self.sent = 0
+        self.failed = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._send_loop, name="eyetracker-osc", daemon=True)
+        self.thread.start()
+        return self
+
+    def send(self, eye_pos, timestamp=None):
+        if eye_pos is not None:
+            self.queue.put((self.sender.send, eye_pos, timestamp, time.perf_counter(), tracer.current()))
+
+    def send_viewers(self, viewers, timestamp=None):
+        # 誰も見えていないことも ID の一覧で伝えるので、空でも送る
+        self.queue.put((self.sender.send_viewers, viewers, timestamp, time.perf_counter(), tracer.current()))
+
+    def send_stats(self, stats):
+        self.pending_stats = stats
+
+    def _send_loop(self):
+        failing = False
+        while self.running:
+            item = self.queue.get(0.1)
+            try:
+                if item is not None:
+                    # 呼び出し側の "output" はキューに置くまでなので、ソケットへの送信はこのスレッドで計る
+                    send, pose, timestamp, queued, trace = item
+                    tracer.activate(trace)
+                    with tracer.span("osc_send"):
+                        send(pose, timestamp)
+                    self.latencies.append(time.perf_counter() - queued)
+                    self.sent += 1
+                    failing = False
+                stats, self.pending_stats = self.pending_stats, None
+                if stats is not None:
+                    self.sender.send_stats(stats)
+            except Exception as e:
+                # 受信側がいない (ICMP unreachable) ときなどは続けて失敗するので、最初の 1 回だけ表示する
+                # 姿勢の形が想定と違う (ValueError など) ときもスレッドを止めずに数えて次の姿勢を送る
+                self.failed += 1
+                if not failing:
+                    print("Error sending OSC:", repr(e))
+                failing = True
+
+    def snapshot(self):
+        latencies = np.array(self.latencies) * 1000
+        p50, p99 = np.percentile(latencies, (50, 99)) if latencies.size else (0.0, 0.0)
+        return {
+            "osc_sent": self.sent,
+            "osc_dropped": self.queue.dropped,
+            "osc_failed": self.failed,
+            "osc_destination_failed": self.sender.failures(),
+            "osc_latency_p50_ms": float(p50),
+            "osc_latency_p99_ms": float(p99),
+        }
+
+    def close(self):
+        self.running = False
+        self.queue.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+class OutputGroup:
+    # 同じ send / send_stats / snapshot / close を持つ複数の出力 (OSCWorker と共有メモリなど) にまとめて渡す
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def send(self, eye_pos, timestamp=None):
+        for output in self.outputs:
+            output.send(eye_pos, timestamp)
+
+    def send_viewers(self, viewers, timestamp=None):
+        for output in self.outputs:
+            output.send_viewers(viewers, timestamp)
+
+    def send_stats(self, stats):
+        for output in self.outputs:
+            output.send_stats(stats)
+
+    def snapshot(self):
+        stats = {}
+        for output in self.outputs:
+            stats.update(output.snapshot())
+        return stats
+
+    def close(self):
+        for output in self.outputs:
+            output.close()
@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+import mediapipe
+
+# backend のランドマークを表示用の画像に描く (メッシュのない backend は目の位置だけを描く)
+# 表示するフレームにだけ、レイヤーごとに線分をまとめて cv2.polylines で描画する
+OVERLAY_LAYERS = ("tesselation", "contours", "irises")
+
+LAYER_STYLES = {
+    "tesselation": ((192, 192, 192), 1),
+    "contours": ((255, 255, 255), 1),
+    "irises": ((48, 255, 48), 1),
+}
+
+def _connection_array(connections):
+    return np.array(sorted(connections), dtype=np.int64)
+
+class OverlayRenderer:
+    def __init__(self, tesselation=True, contours=True, irises=True):
+        self.enabled = {"tesselation": tesselation, "contours": contours, "irises": irises}
+        face_mesh = mediapipe.solutions.face_mesh
+        self.connections = {
+            "tesselation": _connection_array(face_mesh.FACEMESH_TESSELATION),
+            "contours": _connection_array(face_mesh.FACEMESH_CONTOURS),
+            "irises": _connection_array(face_mesh.FACEMESH_IRISES),
+        }
+
+    def set_layer(self, name, enabled):
+        if name not in self.enabled:
+            raise ValueError(f"Unknown overlay layer: {name}")
+        self.enabled[name] = bool(enabled)
+
+    def draw(self, image, faces):
+        # image は表示専用のバッファなので直接書き込む
+        # faces: backend の返した FaceLandmarks のリスト
+        if not faces or not any(self.enabled.values()):
+            return image
+        height, width = image.shape[:2]
+        for face in faces:
+            if face.points is None:
+                if self.enabled["irises"]:
+                    color, thickness = LAYER_STYLES["irises"]
+                    radius = max(2, int((face.bounds[2] - face.bounds[0]) * width / 30))
+                    for x, y in (face.eyes * (width, height)).astype(np.int32).tolist():
+                        cv2.circle(image, (x, y), radius, color, thickness)
+                continue
+            points = (face.points[:, :2] * (width, height)).astype(np.int32)
+            for name in OVERLAY_LAYERS:
+                if not self.enabled[name]:
+                    continue
+                connections = self.connections[name]
+                if connections.max() >= len(points):
+                    continue  # refine_landmarks=False のときは虹彩の点がない
+                color, thickness = LAYER_STYLES[name]
+                cv2.polylines(image, points[connections], False, color, thickness)
+        return image
@@ -0,0 +1,139 @@
+import threading
+import time
+import traceback
+from tracing import tracer
+
+
+class LatestQueue:
+    # 容量1の「最新優先」キュー: 未消費のアイテムは新しいもので上書きされる
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self._item = item
+            self._has_item = True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._has_item and not self._closed:
+                self._cond.wait(timeout)
+            return self._take()
+
+    def get_nowait(self):
+        with self._cond:
+            return self._take()
+
+    def _take(self):
+        if not self._has_item:
+            return None
+        item = self._item
+        self._item = None
+        self._has_item = False
+        return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class TrackingPipeline:
+    # capture -> inference -> output の3スレッド構成
+    # 各ステージ間は LatestQueue でつなぎ、処理が追いつかないフレームは捨てる
+    def __init__(self, model, output_stage, poll_timeout=0.1):
+        self.model = model
+        self.output_stage = output_stage
+        self.poll_timeout = poll_timeout
+        self.frame_queue = LatestQueue()
+        self.pose_queue = LatestQueue()
+        self.result_queue = LatestQueue()
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        stages = (
+            ("capture", self._capture_loop),
+            ("inference", self._inference_loop),
+            ("output", self._output_loop),
+        )
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=f"eyetracker-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        for queue in (self.frame_queue, self.pose_queue, self.result_queue):
+            queue.close()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+        self.threads = []
+
+    def poll(self):
+        # Tk スレッドからは完成した結果だけを受け取る
+        # 結果のフレームのトレースをこのスレッドで有効にするので、表示の更新もそのフレームの段階として記録される
+        item = self.result_queue.get_nowait()
+        if item is None:
+            return None
+        result, trace = item
+        tracer.activate(trace)
+        return result
+
+    def dropped_counts(self):
+        return {
+            "capture": self.frame_queue.dropped,
+            "inference": self.pose_queue.dropped,
+            "output": self.result_queue.dropped,
+        }
+
+    def _capture_loop(self):
+        while self.running:
+            try:
+                frames = self.model.wait_frames()
+            except Exception:
+                traceback.print_exc()
+                continue
+            if frames is None and self.model.finished:
+                break  # 記録の再生が最後まで進んだ
+            if frames is not None:
+                # 届いた時刻は送信時の遅れの見積もり (姿勢の予測) に使う
+                self.frame_queue.put((frames, time.perf_counter(), tracer.current()))
+
+    def _inference_loop(self):
+        while self.running:
+            item = self.frame_queue.get(self.poll_timeout)
+            if item is None:
+                continue
+            frames, arrival, trace = item
+            tracer.activate(trace)
+            try:
+                timestamp = frames.get_timestamp()
+                frame, eye_pos, landmarks = self.model.process_frames(frames)
+            except Exception:
+                traceback.print_exc()
+                continue
+            if frame is not None:
+                self.pose_queue.put((frame, eye_pos, landmarks, timestamp, arrival, trace))
+
+    def _output_loop(self):
+        while self.running:
+            item = self.pose_queue.get(self.poll_timeout)
+            if item is None:
+                continue
+            frame, eye_pos, landmarks, timestamp, arrival, trace = item
+            tracer.activate(trace)
+            try:
+                result = self.output_stage(frame, eye_pos, landmarks, timestamp, arrival)
+            except Exception:
+                traceback.print_exc()
+                continue
+            self.result_queue.put((result, trace))
@@ -0,0 +1,43 @@
+import time
+import numpy as np
+from osc_sender import UNIX_TIME_MIN_MS
+
+# 送信時の遅れを補う姿勢の予測
+# 送る時点の姿勢は、露光・USB 転送・フィルタ・FaceMesh などの分だけ古いので、スムージングの段が推定した
+# 速度 (と加速度) で送信時刻、または target_ms だけ先の表示時刻まで外挿する
+# 外挿する時間 = フレームを撮影してからの経過時間 + target_ms (max_ms まで)
+#   撮影からの経過時間は、フレームのタイムスタンプが UNIX 時刻 (system / global time のドメイン) ならそこから測り、
+#   そうでなければ wait_for_frames が返ってからの経過時間に capture_latency_ms (露光 + 転送の見積もり) を足す
+# 外挿による移動量は 1 目あたり max_distance (m) までに抑える
+class PosePredictor:
+    def __init__(self, target_ms=0.0, max_ms=100.0, max_distance=0.05, capture_latency_ms=0.0):
+        self.target_ms = target_ms
+        self.max_ms = max_ms
+        self.max_distance = max_distance
+        self.capture_latency_ms = capture_latency_ms
+        self.last_horizon_ms = 0.0
+
+    def horizon_ms(self, timestamp=None, arrival=None):
+        if timestamp is not None and timestamp >= UNIX_TIME_MIN_MS:
+            age = time.time() * 1000 - timestamp
+        elif arrival is not None:
+            age = (time.perf_counter() - arrival) * 1000 + self.capture_latency_ms
+        else:
+            age = self.capture_latency_ms
+        return min(max(age, 0.0) + self.target_ms, self.max_ms)
+
+    def predict(self, eye_pos, motion, timestamp=None, arrival=None):
+        # motion: SmoothingChain.motion() の (速度, 加速度)。推定がなければ (初期化直後など) そのまま返す
+        if motion is None:
+            self.last_horizon_ms = 0.0
+            return eye_pos
+        velocity, acceleration = motion
+        horizon_ms = self.horizon_ms(timestamp, arrival)
+        h = horizon_ms / 1000
+        delta = velocity * h
+        if acceleration is not None:
+            delta += acceleration * (0.5 * h * h)
+        distance = np.sqrt((delta * delta).sum(axis=-1, keepdims=True))
+        np.multiply(delta, np.minimum(1.0, self.max_distance / np.maximum(distance, 1e-12)), out=delta)
+        self.last_horizon_ms = horizon_ms
+        return (np.asarray(eye_pos, dtype=np.float64) + delta).tolist()
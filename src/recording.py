@@ -0,0 +1,285 @@
+import json
+import os
+import queue
+import threading
+import time
+import numpy as np
+import pyrealsense2 as rs
+from software_camera import SoftwareCamera, make_extrinsics
+
+# カメラなしでプロファイルや回帰確認ができるように、カラー / 生の z16 デプス / タイムスタンプを記録して再生する
+#
+# ファイル形式 (リトルエンディアン):
+#   先頭: MAGIC, ヘッダ JSON の長さ (uint32), ヘッダ JSON (解像度・フォーマット・内部/外部パラメータ・depth scale)
+#   以降: PAGE_SIZE 境界から固定長レコードが並ぶ。1 レコード = 1 フレームで、
+#         タイムスタンプ・フレーム番号のあとにカラーとデプスの画素がそのまま入る (各レコードもページ境界に揃える)
+# フレーム数はファイルサイズから求めるので、記録が途中で止まっても完了したチャンクまでは再生できる
+MAGIC = b"EYEREC1\n"
+PAGE_SIZE = 4096
+COLOR_CHANNELS = {"rgb8": 3, "bgr8": 3, "yuyv": 2}
+COLOR_FORMATS = {"rgb8": rs.format.rgb8, "bgr8": rs.format.bgr8, "yuyv": rs.format.yuyv}
+
+def _round_up(value, multiple):
+    return (value + multiple - 1) // multiple * multiple
+
+def intrinsics_to_dict(intrinsics):
+    return {
+        "width": intrinsics.width, "height": intrinsics.height,
+        "ppx": intrinsics.ppx, "ppy": intrinsics.ppy, "fx": intrinsics.fx, "fy": intrinsics.fy,
+        "model": int(intrinsics.model), "coeffs": list(intrinsics.coeffs),
+    }
+
+def dict_to_intrinsics(d):
+    intrinsics = rs.intrinsics()
+    intrinsics.width = d["width"]
+    intrinsics.height = d["height"]
+    intrinsics.ppx = d["ppx"]
+    intrinsics.ppy = d["ppy"]
+    intrinsics.fx = d["fx"]
+    intrinsics.fy = d["fy"]
+    intrinsics.model = rs.distortion(d["model"])
+    intrinsics.coeffs = d["coeffs"]
+    return intrinsics
+
+def extrinsics_to_dict(extrinsics):
+    return {"rotation": list(extrinsics.rotation), "translation": list(extrinsics.translation)}
+
+def dict_to_extrinsics(d):
+    return make_extrinsics(d["translation"], d["rotation"])
+
+def record_dtype(header):
+    width, height = header["width"], header["height"]
+    color_shape = (height, width, COLOR_CHANNELS[header["color_format"]])
+    color_offset = 64
+    depth_offset = _round_up(color_offset + int(np.prod(color_shape)), 64)
+    itemsize = _round_up(depth_offset + width * height * 2, PAGE_SIZE)
+    return np.dtype({
+        "names": ["color_timestamp", "depth_timestamp", "color_frame_number", "depth_frame_number", "color", "depth"],
+        "formats": ["<f8", "<f8", "<i8", "<i8", ("u1", color_shape), ("<u2", (height, width))],
+        "offsets": [0, 8, 16, 24, color_offset, depth_offset],
+        "itemsize": itemsize,
+    })
+
+class FrameRecorder:
+    # 書き込みは専用スレッドで行い、キャプチャスレッドはチャンクのバッファへのコピーだけをする
+    # 空きチャンクがなくなったら (ディスクが追いつかないときは) フレームを捨てずに待つ
+    def __init__(self, path, width, height, color_format, color_intrinsics, depth_intrinsics,
+                 color_to_depth, depth_to_color, depth_scale, fps=30, is_stereo=True, chunk_frames=8, chunks=3):
+        if color_format not in COLOR_CHANNELS:
+            raise ValueError(f"Unsupported color format for recording: {color_format}")
+        self.header = {
+            "width": width, "height": height, "fps": fps, "color_format": color_format,
+            "depth_scale": depth_scale, "is_stereo": bool(is_stereo),
+            "color_intrinsics": intrinsics_to_dict(color_intrinsics),
+            "depth_intrinsics": intrinsics_to_dict(depth_intrinsics),
+            "color_to_depth": extrinsics_to_dict(color_to_depth),
+            "depth_to_color": extrinsics_to_dict(depth_to_color),
+        }
+        self.dtype = record_dtype(self.header)
+        self.file = open(path, "wb")
+        header = json.dumps(self.header).encode("utf-8")
+        prefix = MAGIC + len(header).to_bytes(4, "little") + header
+        self.file.write(prefix + b"\0" * (_round_up(len(prefix), PAGE_SIZE) - len(prefix)))
+        self.frame_count = 0
+        self.free = queue.Queue()
+        for _ in range(chunks):
+            self.free.put(np.zeros(chunk_frames, dtype=self.dtype))
+        self.full = queue.Queue()
+        self.chunk = None
+        self.index = 0
+        self.writer = threading.Thread(target=self._write_loop, name="eyetracker-recorder", daemon=True)
+        self.writer.start()
+
+    def write(self, frames):
+        color_frame = frames.get_color_frame()
+        depth_frame = frames.get_depth_frame()
+        if not color_frame or not depth_frame:
+            return
+        self.write_arrays(
+            np.asanyarray(color_frame.get_data()), np.asanyarray(depth_frame.get_data()),
+            color_frame.get_timestamp(), depth_frame.get_timestamp(),
+            color_frame.get_frame_number(), depth_frame.get_frame_number()
+        )
+
+    def write_arrays(self, color, depth, color_timestamp, depth_timestamp, color_frame_number=0, depth_frame_number=0):
+        if self.chunk is None:
+            self.chunk = self.free.get()
+            self.index = 0
+        record = self.chunk[self.index:self.index + 1]
+        record["color_timestamp"] = color_timestamp
+        record["depth_timestamp"] = depth_timestamp
+        record["color_frame_number"] = color_frame_number
+        record["depth_frame_number"] = depth_frame_number
+        record["color"][0] = color
+        record["depth"][0] = depth
+        self.index += 1
+        self.frame_count += 1
+        if self.index == len(self.chunk):
+            self._flush()
+
+    def _flush(self):
+        if self.chunk is not None and self.index:
+            self.full.put((self.chunk, self.index))
+        self.chunk = None
+
+    def _write_loop(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                return
+            chunk, count = item
+            try:
+                self.file.write(chunk[:count].view(np.uint8).data)
+            except Exception as e:
+                print("Error writing recording:", e)
+            self.free.put(chunk)
+
+    def close(self):
+        self._flush()
+        self.full.put(None)
+        self.writer.join()
+        self.file.close()
+        print(f"Recorded {self.frame_count} frames")
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a recording: {path}")
+        length = int.from_bytes(f.read(4), "little")
+        header = json.loads(f.read(length).decode("utf-8"))
+    offset = _round_up(len(MAGIC) + 4 + length, PAGE_SIZE)
+    return header, offset
+
+class ReplayProfile:
+    def __init__(self, format):
+        self.format = format
+
+class ReplayFrame:
+    # 再生時の rs.video_frame の代わり。get_data() は mmap したファイルへの NumPy ビューをそのまま返す
+    def __init__(self, data, timestamp, frame_number, profile, depth_scale=None):
+        self.data = data
+        self.timestamp = timestamp
+        self.frame_number = frame_number
+        self.profile = profile
+        self.depth_scale = depth_scale
+
+    def get_data(self):
+        return self.data
+
+    def get_width(self):
+        return self.data.shape[1]
+
+    def get_height(self):
+        return self.data.shape[0]
+
+    def get_timestamp(self):
+        return self.timestamp
+
+    def get_frame_number(self):
+        return self.frame_number
+
+    def get_profile(self):
+        return self.profile
+
+    def as_depth_frame(self):
+        return self
+
+    def get_distance(self, x, y):
+        return float(self.data[y, x]) * self.depth_scale
+
+class ReplayFrameset:
+    def __init__(self, color_frame, depth_frame):
+        self.color_frame = color_frame
+        self.depth_frame = depth_frame
+
+    def get_color_frame(self):
+        return self.color_frame
+
+    def get_depth_frame(self):
+        return self.depth_frame
+
+    def get_frame_number(self):
+        return self.color_frame.frame_number
+
+    def get_timestamp(self):
+        return self.color_frame.timestamp
+
+class ReplaySource:
+    # RealSenseModel の rs.pipeline と入れ替えて使う再生元 (wait_for_frames / stop)
+    # realtime=True なら記録時のハードウェアタイムスタンプの間隔で、False なら呼ばれるだけ速く返す
+    # rs_frames=True のときは rs.align や RealSense のフィルタが使えるように software_device 経由の
+    # rs.frameset を返す (SDK 側へのコピーが入る)。False なら mmap のビューをそのまま返す
+    def __init__(self, path, realtime=True, loop=False, rs_frames=False):
+        self.header, offset = read_header(path)
+        self.dtype = record_dtype(self.header)
+        count = (os.path.getsize(path) - offset) // self.dtype.itemsize
+        if count <= 0:
+            raise ValueError(f"Recording has no frames: {path}")
+        self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=offset, shape=(count,))
+        # フィールドごとのビューを一度だけ作っておき、フレームごとには添字でビューを切り出すだけにする
+        self.color = self.records["color"]
+        self.depth = self.records["depth"]
+        self.color_timestamps = np.array(self.records["color_timestamp"])
+        self.depth_timestamps = np.array(self.records["depth_timestamp"])
+        self.color_frame_numbers = np.array(self.records["color_frame_number"])
+        self.depth_frame_numbers = np.array(self.records["depth_frame_number"])
+        self.frame_count = count
+        self.realtime = realtime
+        self.loop = loop
+        self.index = 0
+        self.start_time = None
+        self.finished = False
+
+        self.width = self.header["width"]
+        self.height = self.header["height"]
+        self.fps = self.header["fps"]
+        self.depth_scale = self.header["depth_scale"]
+        self.is_stereo = self.header["is_stereo"]
+        self.color_intrinsics = dict_to_intrinsics(self.header["color_intrinsics"])
+        self.depth_intrinsics = dict_to_intrinsics(self.header["depth_intrinsics"])
+        self.color_to_depth = dict_to_extrinsics(self.header["color_to_depth"])
+        self.depth_to_color = dict_to_extrinsics(self.header["depth_to_color"])
+        self.color_format = self.header["color_format"]
+        self.camera = None
+        if rs_frames:
+            if self.color_format != "rgb8":
+                raise ValueError("rs frame replay needs an rgb8 recording; use depth_mode=roi and align_mode=project")
+            self.camera = SoftwareCamera(
+                self.width, self.height, self.fps, self.depth_intrinsics, self.color_intrinsics,
+                self.depth_to_color, self.depth_scale
+            )
+        self.color_profile = ReplayProfile(COLOR_FORMATS[self.color_format])
+        self.depth_profile = ReplayProfile(rs.format.z16)
+
+    def wait_for_frames(self, timeout_ms=5000):
+        if self.index >= self.frame_count:
+            if not self.loop:
+                # 呼び出し側は finished を見て止まるので、待たずにすぐ RuntimeError にする
+                self.finished = True
+                raise RuntimeError("End of recording")
+            self.index = 0
+            self.start_time = None
+        i = self.index
+        self.index += 1
+        if self.realtime:
+            t = (self.depth_timestamps[i] - self.depth_timestamps[0]) / 1000
+            if self.start_time is None or i == 0:
+                self.start_time = time.perf_counter() - t
+            delay = self.start_time + t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if self.camera is not None:
+            # syncer はタイムスタンプが大きく飛ぶと組を作れないので、SDK には等間隔のタイムスタンプで渡す
+            self.camera.push(self.color[i], self.depth[i])
+            return self.camera.wait_for_frames(timeout_ms)
+        return ReplayFrameset(
+            ReplayFrame(self.color[i], self.color_timestamps[i], self.color_frame_numbers[i], self.color_profile),
+            ReplayFrame(self.depth[i], self.depth_timestamps[i], self.depth_frame_numbers[i], self.depth_profile,
+                        self.depth_scale),
+        )
+
+    def stop(self):
+        if self.camera is not None:
+            self.camera.stop()
+        # 参照を外せば mmap は閉じられる (ビューが残っている間は開いたまま)
+        self.records = self.color = self.depth = None
@@ -0,0 +1,251 @@
+import ipaddress
+import json
+from model import RealSenseModel
+from face_roi import FACE_INPUT_MODES
+from landmark_backends import LANDMARK_BACKENDS
+from osc_sender import OSCSender, OSCWorker, OutputGroup, parse_destination
+from shm_sink import SharedPoseSink
+from prediction import PosePredictor
+from smoothing import SmoothingChain, parse_chain, build_stage
+from viewers import ViewerTracker
+
+OUTPUTS = ("osc", "shm", "both")
+
+# ConfigWindow.on_start と同じキーを持つ設定のデフォルト値
+DEFAULT_CONFIG = {
+    "serial": None,
+    "flip": 0,
+    "ip": "127.0.0.1",
+    "port": 8000,
+    "width": 640,
+    "height": 480,
+    "fps": 30,
+    "osc_right_addr": "/eye/right",
+    "osc_left_addr": "/eye/left",
+    "osc_center_addr": "/eye/center",
+    "osc_right_enable": True,
+    "osc_left_enable": True,
+    "osc_center_enable": True,
+    "depth_mode": "full",
+    "align_mode": "align",
+    "depth_window": 5,
+    "depth_estimator": "median",
+    "hole_filling": False,
+    # 目の位置を求める backend: "face_mesh" (MediaPipe FaceMesh) / "haar" (OpenCV の Haar カスケード + 瞳の暗部)
+    # landmark_min_confidence 未満の顔は見つからなかったものとして扱う
+    "landmark_backend": "face_mesh",
+    "landmark_min_confidence": 0.0,
+    # backend の入力: "full" (フレーム全体) / "roi" (前フレームの顔の周りだけ)。face_input_size > 0 なら長辺をその画素数に縮小
+    "face_input": "full",
+    "face_input_size": 0,
+    "face_roi_padding": 0.5,
+    "face_redetect_interval": 30,
+    # backend を動かすフレームの間隔 (1 なら毎フレーム)。間のフレームは虹彩の点をオプティカルフローで追跡する
+    "keyframe_interval": 1,
+    "keyframe_max_drift": 1.0,
+    "preview_fps": 15,
+    "preview_scale": 0.5,
+    "smoothing": [],
+    "record": None,
+    "replay": None,
+    "replay_realtime": True,
+    "replay_loop": False,
+    "trace": None,
+    "osc_stats_addr": "/eyetracker/stats",
+    "osc_stats_enable": False,
+    "osc_bundle": False,
+    # ip/port に加えて同じ内容を送る送信先: "host:port[=right,left,center,stats]" または {"ip", "port", "<addr>_enable"}
+    "osc_destinations": [],
+    "osc_multicast_ttl": 1,
+    # 姿勢の出力先: OSC, 同じマシン向けの共有メモリ, またはその両方
+    "output": "osc",
+    "shm_name": "eyetracker",
+    # 送信時刻 (+ predict_target_ms) まで姿勢を外挿する。速度はスムージングの kalman / one_euro の段の推定を使う
+    "predict": False,
+    "predict_target_ms": 0.0,
+    "predict_max_ms": 100.0,
+    "predict_max_distance": 0.05,
+    "capture_latency_ms": 0.0,
+    # 複数カメラ (multi_camera.py)。空なら serial / replay の 1 台だけを使う
+    "cameras": [],
+    "fusion_max_age_ms": 100.0,
+    # 複数人 (viewers.py)。2 人以上なら人ごとに ID を付け、OSC は osc_viewer_prefix を付けたアドレスで送る
+    "max_viewers": 1,
+    "viewer_max_distance": 0.2,
+    "viewer_max_missed": 15,
+    "osc_viewer_prefix": "/viewer/{id}",
+    "osc_viewers_addr": "/eyetracker/viewers",
+    "stats_interval": 1.0,
+}
+
+def parse_profile(profile_str):
+    # "640x480 @ 30fps" (ConfigWindow の表記) と "640x480@30" の両方を受け付ける
+    try:
+        resolution_part, fps_part = profile_str.replace(" ", "").split("@")
+        width_str, height_str = resolution_part.split("x")
+        fps_str = fps_part.replace("fps", "")
+        return int(width_str), int(height_str), int(fps_str)
+    except ValueError:
+        raise ValueError(f"Invalid profile: {profile_str}")
+
+def load_config_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"Config file must contain a JSON object: {path}")
+    if "profile" in config:
+        config["width"], config["height"], config["fps"] = parse_profile(config.pop("profile"))
+    return config
+
+def validate_config(config):
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+    try:
+        ipaddress.ip_address(config["ip"])
+    except ValueError:
+        raise ValueError("Invalid IP address")
+    if not (1 <= int(config["port"]) <= 65535):
+        raise ValueError("Invalid port number")
+    for key in ("width", "height", "fps"):
+        if int(config[key]) <= 0:
+            raise ValueError("Invalid profile selection")
+    if float(config["preview_fps"]) <= 0 or not (0 < float(config["preview_scale"]) <= 1):
+        raise ValueError("Invalid preview settings")
+    if int(config["depth_window"]) < 1 or int(config["depth_window"]) % 2 == 0:
+        raise ValueError("Depth window must be a positive odd number")
+    if config["landmark_backend"] not in LANDMARK_BACKENDS:
+        raise ValueError(f"Unknown landmark backend: {config['landmark_backend']}")
+    if not (0 <= float(config["landmark_min_confidence"]) <= 1):
+        raise ValueError("landmark_min_confidence must be between 0 and 1")
+    if config["face_input"] not in FACE_INPUT_MODES:
+        raise ValueError(f"Unknown face input mode: {config['face_input']}")
+    if int(config["face_input_size"]) < 0 or float(config["face_roi_padding"]) < 0:
+        raise ValueError("Invalid face input settings")
+    if int(config["face_redetect_interval"]) < 0:
+        raise ValueError("face_redetect_interval must not be negative")
+    if int(config["keyframe_interval"]) < 1 or float(config["keyframe_max_drift"]) <= 0:
+        raise ValueError("Invalid keyframe settings")
+    for destination in osc_destinations(config):
+        try:
+            ipaddress.ip_address(destination["ip"])
+        except (KeyError, ValueError):
+            raise ValueError(f"Invalid OSC destination IP address: {destination.get('ip')}")
+        if not (1 <= int(destination.get("port", 0)) <= 65535):
+            raise ValueError(f"Invalid OSC destination port: {destination.get('port')}")
+    if config["output"] not in OUTPUTS:
+        raise ValueError(f"Unknown output: {config['output']}")
+    for key in ("predict_target_ms", "predict_max_ms", "predict_max_distance", "capture_latency_ms"):
+        if float(config[key]) < 0:
+            raise ValueError(f"{key} must not be negative")
+    if not isinstance(config["cameras"], list):
+        raise ValueError("cameras must be a list")
+    if float(config["fusion_max_age_ms"]) <= 0:
+        raise ValueError("fusion_max_age_ms must be positive")
+    if int(config["max_viewers"]) < 1:
+        raise ValueError("max_viewers must be at least 1")
+    if int(config["max_viewers"]) > 1:
+        if config["cameras"]:
+            raise ValueError("max_viewers > 1 is not supported with multiple cameras")
+        if "{id}" not in config["osc_viewer_prefix"] or not config["osc_viewer_prefix"].startswith("/"):
+            raise ValueError('osc_viewer_prefix must start with "/" and contain "{id}"')
+    if float(config["viewer_max_distance"]) <= 0 or int(config["viewer_max_missed"]) < 0:
+        raise ValueError("Invalid viewer association settings")
+    if float(config["stats_interval"]) <= 0:
+        raise ValueError("Stats interval must be positive")
+    for stage in parse_chain(config["smoothing"]):
+        build_stage(stage)
+    return config
+
+def build_model(config, source=None):
+    # source: 実機や記録の代わりに使うフレームの供給元 (合成カメラなど)
+    width, height, fps = config["width"], config["height"], config["fps"]
+    depth_mode = config.get("depth_mode", "full")
+    align_mode = config.get("align_mode", "align")
+    if source is not None:
+        width, height, fps = source.width, source.height, source.fps
+    elif config.get("replay"):
+        # 記録を再生するときは解像度などは記録に合わせる
+        from recording import ReplaySource
+        source = ReplaySource(
+            config["replay"], realtime=config.get("replay_realtime", True), loop=config.get("replay_loop", False),
+            rs_frames=depth_mode == "full" or align_mode == "align"
+        )
+        width, height, fps = source.width, source.height, source.fps
+    model = RealSenseModel(
+        config["serial"], config["flip"], width, height, fps,
+        depth_mode=depth_mode,
+        align_mode=align_mode,
+        depth_window=config.get("depth_window", 5),
+        depth_estimator=config.get("depth_estimator", "median"),
+        hole_filling=config.get("hole_filling", False),
+        source=source,
+        max_viewers=int(config.get("max_viewers", 1)),
+        face_input=config.get("face_input", "full"),
+        face_input_size=int(config.get("face_input_size", 0)),
+        face_roi_padding=float(config.get("face_roi_padding", 0.5)),
+        face_redetect_interval=int(config.get("face_redetect_interval", 30)),
+        keyframe_interval=int(config.get("keyframe_interval", 1)),
+        keyframe_max_drift=float(config.get("keyframe_max_drift", 1.0)),
+        landmark_backend=config.get("landmark_backend", "face_mesh"),
+        landmark_min_confidence=float(config.get("landmark_min_confidence", 0.0))
+    )
+    if config.get("record"):
+        model.start_recording(config["record"])
+    return model
+
+def osc_destinations(config):
+    return [parse_destination(d) if isinstance(d, str) else d for d in config.get("osc_destinations") or []]
+
+def build_osc_sender(config):
+    # 送信は専用スレッドで行う (追跡のループは送信を待たない)
+    sender = OSCSender(
+        config["ip"], config["port"],
+        right_addr=config.get("osc_right_addr", "/eye/right"),
+        left_addr=config.get("osc_left_addr", "/eye/left"),
+        center_addr=config.get("osc_center_addr", "/eye/center"),
+        right_enable=config.get("osc_right_enable", True),
+        left_enable=config.get("osc_left_enable", True),
+        center_enable=config.get("osc_center_enable", True),
+        stats_addr=config.get("osc_stats_addr", "/eyetracker/stats"),
+        stats_enable=config.get("osc_stats_enable", False),
+        bundle=config.get("osc_bundle", False),
+        destinations=osc_destinations(config),
+        multicast_ttl=int(config.get("osc_multicast_ttl", 1)),
+        viewers=int(config.get("max_viewers", 1)),
+        viewer_prefix=config.get("osc_viewer_prefix", "/viewer/{id}"),
+        viewers_addr=config.get("osc_viewers_addr", "/eyetracker/viewers")
+    )
+    return OSCWorker(sender).start()
+
+def build_output(config):
+    output = config.get("output", "osc")
+    if output == "osc":
+        return build_osc_sender(config)
+    sink = SharedPoseSink(config.get("shm_name", "eyetracker"))
+    if output == "shm":
+        return sink
+    return OutputGroup([build_osc_sender(config), sink])
+
+def build_smoothing_chain(config):
+    return SmoothingChain(config.get("smoothing"))
+
+def build_viewer_tracker(config):
+    # 1 人だけなら対応付けはせず、今まで通りのアドレスで送る
+    if int(config.get("max_viewers", 1)) == 1:
+        return None
+    return ViewerTracker(
+        int(config["max_viewers"]), config.get("smoothing"),
+        max_distance=float(config["viewer_max_distance"]),
+        max_missed=int(config["viewer_max_missed"])
+    )
+
+def build_predictor(config):
+    if not config.get("predict"):
+        return None
+    return PosePredictor(
+        target_ms=float(config["predict_target_ms"]),
+        max_ms=float(config["predict_max_ms"]),
+        max_distance=float(config["predict_max_distance"]),
+        capture_latency_ms=float(config["capture_latency_ms"])
+    )
@@ -0,0 +1,184 @@
+import math
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+# 同じマシンの受信側向けに、最新の姿勢を共有メモリに置く出力
+# OSC のエンコード / UDP / デコードを通さず、受信側は共有メモリを読むだけで最新の姿勢が得られる
+#
+# レイアウト (リトルエンディアン, 128 バイト):
+#   0: magic "EYES", version (uint32), サイズ (uint32), 書き込むプロセスの PID (uint32)
+#  16: seqlock のカウンタ (uint64)。書き込み中は奇数
+#  24: count (uint64, 書き込むごとに 1 増える), フレームのタイムスタンプ (double, ms),
+#      書き込んだ時刻 (uint64, perf_counter_ns), flags (uint32), 予約, right / left / center (double x3 x3, m)
+# 書き込みは 1 プロセス (トラッカー) だけ。読む側はロックを取らず、カウンタが前後で同じで偶数なら一貫した値とみなす
+MAGIC = b"EYES"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+SEQ = struct.Struct("<Q")
+PAYLOAD = struct.Struct("<QdQI4x9d")
+STATUS = struct.Struct("<QdQI")  # PAYLOAD の先頭 (位置を除く部分)
+SEQ_OFFSET = HEADER.size
+PAYLOAD_OFFSET = SEQ_OFFSET + SEQ.size
+SIZE = PAYLOAD_OFFSET + PAYLOAD.size
+
+# flags
+RIGHT_VALID = 1
+LEFT_VALID = 2
+CENTER_VALID = 4
+FACE_FOUND = 8
+
+DEFAULT_NAME = "eyetracker"
+NAN3 = (math.nan, math.nan, math.nan)
+
+def _open_untracked(name):
+    # 既存の共有メモリを開く。開いただけのプロセスが終了するときに消してしまわないように、resource_tracker の管理から外す
+    try:
+        shm = shared_memory.SharedMemory(name, track=False)  # Python 3.13 以降
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+def _process_alive(pid):
+    if os.name != "posix":
+        # Windows の共有メモリは開いているプロセスがなくなると消えるので、残っていれば使用中
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _valid(pos):
+    # デプスが取れなかった目はデプロジェクションで z=0 になる
+    return pos[2] > 0 and math.isfinite(pos[0]) and math.isfinite(pos[1]) and math.isfinite(pos[2])
+
+class SharedPoseSink:
+    # OSCWorker と同じ send / send_stats / snapshot / close を持つ出力
+    # send は共有メモリへの書き込みだけなので、出力スレッドでそのまま呼んでもよい (数 us)
+    def __init__(self, name=DEFAULT_NAME):
+        self.name = name
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=SIZE)
+        except FileExistsError:
+            # 同じ名前で動いている別のトラッカーがあれば、その出力を上書きしないように止める
+            # 書いていたプロセスがもういない (前回異常終了したときの残り) か、レイアウトが違うものは作り直す
+            shm = _open_untracked(name)
+            owner = None
+            if shm.size >= SIZE:
+                magic, version, size, pid = HEADER.unpack_from(shm.buf, 0)
+                if magic == MAGIC and version == VERSION and size == SIZE and pid and _process_alive(pid):
+                    owner = pid
+            shm.close()
+            if owner is not None:
+                raise RuntimeError(f"Shared memory '{name}' is in use by another eye tracker (pid {owner}); "
+                                   "stop it or set a different shm_name")
+            # unlink で resource_tracker の登録も外れるので、外したものを戻してから消す
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=SIZE)
+        self.buf = self.shm.buf
+        self.seq = 0
+        self.count = 0
+        SEQ.pack_into(self.buf, SEQ_OFFSET, 0)
+        PAYLOAD.pack_into(self.buf, PAYLOAD_OFFSET, 0, 0.0, 0, 0, *NAN3, *NAN3, *NAN3)
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, SIZE, os.getpid())
+
+    def send(self, eye_pos, timestamp=None):
+        if self.buf is None:
+            return
+        self.count += 1
+        buf = self.buf
+        SEQ.pack_into(buf, SEQ_OFFSET, self.seq + 1)
+        if eye_pos is None:
+            # 顔を見失ったことも伝える。位置は上書きせず (前回のまま)、count / タイムスタンプ / flags だけを更新する
+            STATUS.pack_into(buf, PAYLOAD_OFFSET, self.count, timestamp or 0.0, time.perf_counter_ns(), 0)
+        else:
+            right, left = eye_pos
+            flags = FACE_FOUND
+            if _valid(right):
+                flags |= RIGHT_VALID
+            if _valid(left):
+                flags |= LEFT_VALID
+            if flags & RIGHT_VALID and flags & LEFT_VALID:
+                flags |= CENTER_VALID
+            PAYLOAD.pack_into(buf, PAYLOAD_OFFSET, self.count, timestamp or 0.0, time.perf_counter_ns(), flags,
+                              right[0], right[1], right[2], left[0], left[1], left[2],
+                              (right[0] + left[0]) * 0.5, (right[1] + left[1]) * 0.5, (right[2] + left[2]) * 0.5)
+        self.seq += 2
+        SEQ.pack_into(buf, SEQ_OFFSET, self.seq)
+
+    def send_viewers(self, viewers, timestamp=None):
+        # 1 人分のレイアウトなので、複数人のときは ID が最も小さい人だけを置く
+        self.send(viewers[0][1] if viewers else None, timestamp)
+
+    def send_stats(self, stats):
+        pass
+
+    def snapshot(self):
+        return {"shm_published": self.count}
+
+    def close(self):
+        if self.buf is None:
+            return
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+class SharedPose:
+    __slots__ = ("count", "timestamp", "write_time_ns", "flags", "right", "left", "center")
+
+    def __init__(self, values):
+        self.count, self.timestamp, self.write_time_ns, self.flags = values[:4]
+        self.right = values[4:7]
+        self.left = values[7:10]
+        self.center = values[10:13]
+
+    @property
+    def face_found(self):
+        return bool(self.flags & FACE_FOUND)
+
+class SharedPoseReader:
+    # 受信側で使う読み込み用 (このファイルだけをコピーして使えるように、トラッカーの他のモジュールには依存しない)
+    #   reader = SharedPoseReader()
+    #   pose = reader.read()  # まだ何も書かれていなければ None
+    def __init__(self, name=DEFAULT_NAME):
+        self.shm = _open_untracked(name)
+        self.buf = self.shm.buf
+        magic, version, size, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION or size < SIZE:
+            self.close()
+            raise ValueError(f"Not an eye tracker shared memory block: {name}")
+        self.last_count = 0
+
+    def read(self, retries=100):
+        buf = self.buf
+        for _ in range(retries):
+            seq = SEQ.unpack_from(buf, SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            values = PAYLOAD.unpack_from(buf, PAYLOAD_OFFSET)
+            if SEQ.unpack_from(buf, SEQ_OFFSET)[0] == seq:
+                return SharedPose(values) if values[0] else None
+        return None
+
+    def read_new(self):
+        # 前回読んだものより新しい姿勢があれば返す
+        pose = self.read()
+        if pose is None or pose.count == self.last_count:
+            return None
+        self.last_count = pose.count
+        return pose
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
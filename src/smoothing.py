@@ -0,0 +1,124 @@
+import time
+from filter_engine import MovingAverageFilter, KalmanFilter, KalmanAccelFilter, OneEuroFilter, OutlierGate
+
+# 眼の位置 (デプロジェクション後、メートル) に順にかけるスムージングの段
+# 設定では段の名前、またはパラメータ付きの {"type": 名前, ...} をリストで並べる
+# 例: ["outlier", {"type": "kalman", "threshold": 0.1}, "one_euro"]、コマンドラインでは "outlier,kalman,one_euro"
+STAGE_TYPES = {
+    "outlier": (OutlierGate, {}),
+    "moving_average": (MovingAverageFilter, {"window": 5, "threshold": 0.15}),
+    "kalman": (KalmanFilter, {"threshold": 0.10}),
+    "kalman_accel": (KalmanAccelFilter, {}),
+    "one_euro": (OneEuroFilter, {"min_cutoff": 0.3, "beta": 0.5, "d_cutoff": 0.3}),
+}
+
+# 表示側で選べるようにしておく組み合わせ
+SMOOTHING_PRESETS = ("none", "one_euro", "kalman", "outlier,kalman", "outlier,kalman,one_euro", "moving_average")
+
+def parse_chain(spec):
+    # 文字列 ("none" / "a,b,c") とリストのどちらでも受け付け、{"type": ..., パラメータ} のリストに揃える
+    if spec is None:
+        return []
+    if isinstance(spec, str):
+        spec = [name.strip() for name in spec.replace(">", ",").split(",") if name.strip()]
+        if spec == ["none"]:
+            spec = []
+    if not isinstance(spec, (list, tuple)):
+        raise ValueError(f"Invalid smoothing chain: {spec!r}")
+    stages = []
+    for stage in spec:
+        stage = dict(stage) if isinstance(stage, dict) else {"type": stage}
+        if stage.get("type") not in STAGE_TYPES:
+            raise ValueError(f"Unknown smoothing stage: {stage.get('type')!r} (choose from {', '.join(STAGE_TYPES)})")
+        stages.append(stage)
+    return stages
+
+def format_chain(spec):
+    names = [stage["type"] for stage in parse_chain(spec)]
+    return ",".join(names) if names else "none"
+
+def build_stage(stage):
+    stage = dict(stage)
+    cls, defaults = STAGE_TYPES[stage.pop("type")]
+    try:
+        return cls(**dict(defaults, **stage))
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters for smoothing stage: {e}")
+
+class SmoothingStage:
+    def __init__(self, name, filter):
+        self.name = name
+        self.filter = filter
+        self.count = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+
+    def reset(self):
+        self.filter.reset()
+
+    def process(self, eye_pos, dt):
+        start = time.perf_counter()
+        eye_pos = self.filter.process(eye_pos, dt)
+        self.last_time = time.perf_counter() - start
+        self.total_time += self.last_time
+        self.count += 1
+        return eye_pos
+
+    def mean_time(self):
+        return self.total_time / self.count if self.count else 0.0
+
+class SmoothingChain:
+    def __init__(self, spec=None, max_dt=0.5):
+        self.max_dt = max_dt
+        self.last_time = None
+        self.stages = []
+        self.set_stages(spec)
+
+    def set_stages(self, spec):
+        # 新しい段を組み立ててから差し替えるので、別スレッドの process() は古い段か新しい段のどちらかを一通り使う
+        stages = [SmoothingStage(stage["type"], build_stage(stage)) for stage in parse_chain(spec)]
+        self.stages = stages
+        self.last_time = None
+
+    def describe(self):
+        return ",".join(stage.name for stage in self.stages) or "none"
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, eye_pos, dt=None):
+        # dt を渡さなければ前回の呼び出しからの経過時間を使う (顔を見失っていた間も含む)
+        now = time.perf_counter()
+        if dt is None:
+            dt = now - self.last_time if self.last_time is not None else None
+        self.last_time = now
+        stages = self.stages
+        if not stages:
+            return eye_pos
+        if dt is None or dt > self.max_dt:
+            # 間が空いたら全段を初期化し、各段には最初のフレームとして渡す
+            self.reset()
+            dt = 0.0
+        for stage in stages:
+            eye_pos = stage.process(eye_pos, dt)
+        return eye_pos.tolist()
+
+    def motion(self):
+        # 速度 / 加速度の推定 (持っている段がなければ None)
+        # カルマンの段の状態を優先し、なければ One Euro の出力の差分から求めた速度を使う
+        # (d_cutoff で平滑化するので、動き始めや止まったときは追従が遅れる)
+        stages = sorted(reversed(self.stages), key=lambda stage: not isinstance(stage.filter, KalmanFilter))
+        for stage in stages:
+            motion = stage.filter.motion()
+            if motion is not None:
+                return motion
+        return None
+
+    def timing_text(self):
+        return "  ".join(f"{stage.name} {stage.mean_time() * 1e6:.0f}us" for stage in self.stages)
+
+    def reset_timing(self):
+        for stage in self.stages:
+            stage.count = 0
+            stage.total_time = 0.0
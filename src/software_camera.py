@@ -0,0 +1,108 @@
+import numpy as np
+import pyrealsense2 as rs
+
+# rs.software_device を使ったカメラの代用品
+# push() で渡したカラー/デプス画像が実機と同じ rs.frameset として wait_for_frames() から出てくる
+
+def make_intrinsics(width, height, fov_x_deg, ppx=None, ppy=None, model=rs.distortion.none, coeffs=None):
+    intrinsics = rs.intrinsics()
+    intrinsics.width = width
+    intrinsics.height = height
+    intrinsics.fx = intrinsics.fy = (width / 2) / np.tan(np.radians(fov_x_deg) / 2)
+    intrinsics.ppx = width / 2 if ppx is None else ppx
+    intrinsics.ppy = height / 2 if ppy is None else ppy
+    intrinsics.model = model
+    intrinsics.coeffs = coeffs or [0.0] * 5
+    return intrinsics
+
+def make_extrinsics(translation, rotation=(1, 0, 0, 0, 1, 0, 0, 0, 1)):
+    extrinsics = rs.extrinsics()
+    extrinsics.rotation = list(rotation)
+    extrinsics.translation = list(translation)
+    return extrinsics
+
+def inverse_extrinsics(extrinsics):
+    rotation = np.asarray(extrinsics.rotation, dtype=np.float64).reshape(3, 3)
+    translation = np.asarray(extrinsics.translation, dtype=np.float64)
+    # transform_points の列優先の約束に合わせて逆変換を作る
+    return make_extrinsics((-translation @ rotation.T).tolist(), rotation.T.reshape(-1).tolist())
+
+class SoftwareCamera:
+    def __init__(self, width, height, fps=30, depth_intrinsics=None, color_intrinsics=None,
+                 depth_to_color=None, depth_units=0.001):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.depth_units = depth_units
+        self.depth_intrinsics = depth_intrinsics or make_intrinsics(width, height, 87)
+        self.color_intrinsics = color_intrinsics or make_intrinsics(width, height, 69)
+        self.depth_to_color = depth_to_color or make_extrinsics((0.015, 0.0, 0.0))
+        self.color_to_depth = inverse_extrinsics(self.depth_to_color)
+        self.frame_number = 0
+
+        self.device = rs.software_device()
+        self.depth_sensor = self.device.add_sensor("Depth")
+        self.color_sensor = self.device.add_sensor("Color")
+        self.depth_profile = self._add_stream(self.depth_sensor, rs.stream.depth, rs.format.z16, 2, self.depth_intrinsics, 0)
+        self.color_profile = self._add_stream(self.color_sensor, rs.stream.color, rs.format.rgb8, 3, self.color_intrinsics, 1)
+        self.depth_sensor.add_read_only_option(rs.option.depth_units, depth_units)
+        self.depth_profile.register_extrinsics_to(self.color_profile, self.depth_to_color)
+        self.color_profile.register_extrinsics_to(self.depth_profile, self.color_to_depth)
+        self.device.create_matcher(rs.matchers.default)
+
+        self.syncer = rs.syncer()
+        self.depth_sensor.open(self.depth_profile)
+        self.color_sensor.open(self.color_profile)
+        self.depth_sensor.start(self.syncer)
+        self.color_sensor.start(self.syncer)
+        self._prime()
+
+    def _prime(self):
+        # syncer は最初のフレームをカラー単独で出してしまうので、空のフレームを一組流して捨てておく
+        self.push(np.zeros((self.height, self.width, 3), np.uint8), np.zeros((self.height, self.width), np.uint16))
+        while self.syncer.try_wait_for_frames(100)[0]:
+            pass
+
+    def _add_stream(self, sensor, stream_type, fmt, bpp, intrinsics, uid):
+        stream = rs.video_stream()
+        stream.type = stream_type
+        stream.index = 0
+        stream.uid = uid
+        stream.width = self.width
+        stream.height = self.height
+        stream.fps = self.fps
+        stream.bpp = bpp
+        stream.fmt = fmt
+        stream.intrinsics = intrinsics
+        return sensor.add_video_stream(stream)
+
+    def _video_frame(self, pixels, bpp, profile, timestamp):
+        frame = rs.software_video_frame()
+        frame.pixels = pixels
+        frame.stride = self.width * bpp
+        frame.bpp = bpp
+        frame.timestamp = timestamp
+        frame.domain = rs.timestamp_domain.hardware_clock
+        frame.frame_number = self.frame_number
+        frame.profile = profile.as_video_stream_profile()
+        return frame
+
+    def push(self, color_arr, depth_arr, timestamp=None):
+        if timestamp is None:
+            timestamp = self.frame_number * 1000.0 / self.fps
+        self.depth_sensor.on_video_frame(self._video_frame(np.ascontiguousarray(depth_arr, dtype=np.uint16), 2, self.depth_profile, timestamp))
+        self.color_sensor.on_video_frame(self._video_frame(np.ascontiguousarray(color_arr, dtype=np.uint8), 3, self.color_profile, timestamp))
+        self.frame_number += 1
+
+    def wait_for_frames(self, timeout_ms=1000):
+        # syncer は片方のストリームだけの frameset を返すことがあるので揃うまで待つ
+        while True:
+            frames = self.syncer.wait_for_frames(timeout_ms)
+            if frames.get_depth_frame() and frames.get_color_frame():
+                return frames
+
+    def stop(self):
+        self.depth_sensor.stop()
+        self.color_sensor.stop()
+        self.depth_sensor.close()
+        self.color_sensor.close()
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# フレームごとの処理段階のトレース
+# wait_for_frames から OSC 送信・表示更新まで、各段階の開始/終了を単調時計 (perf_counter_ns) で記録し、
+# RealSense のフレーム番号とハードウェアタイムスタンプに結びつける
+# フレームはスレッドをまたいで流れるので、トレースはキューでフレームと一緒に渡し、各スレッドで activate() する
+# 無効なとき span() は何もしないオブジェクトを返すだけなので、計測コードは常に残しておける
+
+HISTOGRAM_EDGES_US = np.concatenate(([0], np.logspace(1, 6, 26)))  # 10us 〜 1s の対数ビン
+
+class FrameTrace:
+    def __init__(self, frame_number, hw_timestamp):
+        self.frame_number = frame_number
+        self.hw_timestamp = hw_timestamp
+        self.spans = []  # (name, start_ns, end_ns, thread_id)
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("tracer", "trace", "name", "start")
+
+    def __init__(self, tracer, trace, name):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.trace, self.name, self.start, time.perf_counter_ns())
+        return False
+
+class Tracer:
+    def __init__(self, capacity=2000, window=1000):
+        self.enabled = False
+        self.traces = deque(maxlen=capacity)      # 直近のフレームのトレース (Chrome trace 用)
+        self.window = window
+        self.durations = {}                       # 段階ごとの直近 window 回の所要時間 (ns)
+        self.thread_names = {}
+        self.local = threading.local()
+        self.origin_ns = time.perf_counter_ns()
+
+    def enable(self, capacity=None, window=None):
+        if capacity is not None:
+            self.traces = deque(maxlen=capacity)
+        if window is not None:
+            self.window = window
+        self.enabled = True
+
+    def now(self):
+        return time.perf_counter_ns()
+
+    def begin_frame(self, frames, wait_start=None):
+        # wait_for_frames() が返したフレームのトレースを作り、このスレッドで有効にする
+        if not self.enabled:
+            return None
+        try:
+            trace = FrameTrace(int(frames.get_frame_number()), float(frames.get_timestamp()))
+        except Exception:
+            trace = FrameTrace(None, None)
+        self.traces.append(trace)
+        self.local.trace = trace
+        if wait_start is not None:
+            self.record(trace, "wait_for_frames", wait_start, time.perf_counter_ns())
+        return trace
+
+    def activate(self, trace):
+        self.local.trace = trace
+
+    def current(self):
+        return getattr(self.local, "trace", None)
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        trace = getattr(self.local, "trace", None)
+        if trace is None:
+            return _NULL_SPAN
+        return _Span(self, trace, name)
+
+    def record(self, trace, name, start_ns, end_ns):
+        thread = threading.current_thread()
+        if thread.ident not in self.thread_names:
+            self.thread_names[thread.ident] = thread.name
+        trace.spans.append((name, start_ns, end_ns, thread.ident))
+        durations = self.durations.get(name)
+        if durations is None:
+            durations = self.durations.setdefault(name, deque(maxlen=self.window))
+        durations.append(end_ns - start_ns)
+
+    def histograms(self):
+        # 段階ごとの直近 window 回の分布 (us)
+        result = {}
+        for name, durations in list(self.durations.items()):
+            values = np.array(durations, dtype=np.float64) / 1000
+            if values.size == 0:
+                continue
+            counts, _ = np.histogram(values, bins=np.append(HISTOGRAM_EDGES_US, np.inf))
+            result[name] = {
+                "count": int(values.size),
+                "p50_us": float(np.percentile(values, 50)),
+                "p90_us": float(np.percentile(values, 90)),
+                "p99_us": float(np.percentile(values, 99)),
+                "max_us": float(values.max()),
+                "bucket_edges_us": [round(float(e), 1) for e in HISTOGRAM_EDGES_US],
+                "bucket_counts": counts.tolist(),
+            }
+        return result
+
+    def summary_text(self):
+        lines = []
+        for name, h in self.histograms().items():
+            lines.append(f"  {name:16s} n={h['count']:5d}  p50 {h['p50_us']:8.1f} us  p90 {h['p90_us']:8.1f} us"
+                         f"  p99 {h['p99_us']:8.1f} us  max {h['max_us']:8.1f} us")
+        return "\n".join(lines)
+
+    def chrome_events(self):
+        # Chrome trace / Perfetto の JSON 形式 (ts, dur は us)
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in self.thread_names.items()]
+        for flow_id, trace in enumerate(list(self.traces)):
+            spans = sorted(trace.spans, key=lambda span: span[1])
+            args = {"frame_number": trace.frame_number, "hw_timestamp_ms": trace.hw_timestamp}
+            for i, (name, start, end, tid) in enumerate(spans):
+                ts = (start - self.origin_ns) / 1000
+                events.append({"name": name, "cat": "frame", "ph": "X", "pid": pid, "tid": tid,
+                               "ts": ts, "dur": (end - start) / 1000, "args": args})
+                # スレッドをまたいだ 1 フレームの流れを矢印でつなぐ
+                if len(spans) > 1:
+                    phase = "s" if i == 0 else ("f" if i == len(spans) - 1 else "t")
+                    event = {"name": "frame", "cat": "frame", "ph": phase, "id": flow_id, "pid": pid, "tid": tid, "ts": ts}
+                    if phase != "s":
+                        event["bp"] = "e"
+                    events.append(event)
+        return events
+
+    def export_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.chrome_events(), "displayTimeUnit": "ms",
+                       "otherData": {"histograms": self.histograms()}}, f)
+        print(f"Trace written to {path} ({len(self.traces)} frames)")
+
+# プロセス全体で共有するトレーサ (設定で有効にしたときだけ記録する)
+tracer = Tracer()
@@ -1,8 +1,27 @@
 import tkinter as tk
+from tkinter import ttk
+import cv2
 from PIL import Image, ImageTk
+from overlay import OverlayRenderer, OVERLAY_LAYERS
+from smoothing import SMOOTHING_PRESETS
+
+def preview_size(width, height, scale):
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+def prepare_preview(image, scale, overlay=None, landmarks=None):
+    # 縮小してからオーバーレイを描くので、描画と変換のコストも縮小後の画素数で済む
+    if scale != 1.0:
+        image = cv2.resize(image, preview_size(image.shape[1], image.shape[0], scale), interpolation=cv2.INTER_AREA)
+    if overlay is not None:
+        image = overlay.draw(image, landmarks)
+    return Image.fromarray(image)
 
 class RealSenseView:
-    def __init__(self, title, info_text):
+    def __init__(self, title, info_text, preview_fps=15, preview_scale=0.5):
+        # プレビューはトラッキングとは別の周期・解像度で更新する
+        self.preview_interval_ms = max(1, int(1000 / preview_fps))
+        self.preview_scale = preview_scale
+        self.imgtk = None
         self.win = tk.Tk()
         self.win.title(title)
         self.win.resizable(False, False)
@@ -21,11 +40,54 @@ class RealSenseView:
         self.eye_pos_label = tk.Label(self.info_frame, justify="right", anchor="e")
         self.eye_pos_label.pack(side=tk.LEFT, expand=True, fill=tk.X)
 
-    def update(self, image, info_text, fps_text, eye_pos_text):
-        im = Image.fromarray(image)
-        imgtk = ImageTk.PhotoImage(image=im)
-        self.image_label.imgtk = imgtk  # keep a reference
-        self.image_label.configure(image=imgtk)
+        # オーバーレイのレイヤー切り替え
+        self.overlay = OverlayRenderer()
+        self.overlay_frame = tk.Frame(self.win)
+        self.overlay_frame.pack(fill=tk.X)
+        self.overlay_vars = {}
+        for name in OVERLAY_LAYERS:
+            var = tk.IntVar(value=1)
+            tk.Checkbutton(
+                self.overlay_frame, text=name, variable=var,
+                command=lambda name=name, var=var: self.overlay.set_layer(name, var.get())
+            ).pack(side=tk.LEFT, padx=5)
+            self.overlay_vars[name] = var
+
+        # スムージングの段の切り替え (候補から選ぶか "outlier,kalman" のように入力して Enter)
+        self.smoothing_handler = None
+        tk.Label(self.overlay_frame, text="smoothing:").pack(side=tk.LEFT, padx=(15, 0))
+        self.smoothing_var = tk.StringVar(value="none")
+        self.smoothing_combobox = ttk.Combobox(
+            self.overlay_frame, textvariable=self.smoothing_var, values=SMOOTHING_PRESETS, width=28
+        )
+        self.smoothing_combobox.pack(side=tk.LEFT, padx=5)
+        self.smoothing_combobox.bind("<<ComboboxSelected>>", self.on_smoothing_changed)
+        self.smoothing_combobox.bind("<Return>", self.on_smoothing_changed)
+        self.smoothing_current = "none"
+
+    def set_smoothing_handler(self, handler, current):
+        self.smoothing_handler = handler
+        self.smoothing_current = current
+        self.smoothing_var.set(current)
+
+    def on_smoothing_changed(self, event=None):
+        if self.smoothing_handler is None:
+            return
+        try:
+            self.smoothing_current = self.smoothing_handler(self.smoothing_var.get())
+        except ValueError as e:
+            print("Error changing smoothing:", e)
+        self.smoothing_var.set(self.smoothing_current)
+
+    def update(self, image, info_text, fps_text, eye_pos_text, landmarks=None):
+        im = prepare_preview(image, self.preview_scale, self.overlay, landmarks)
+        if self.imgtk is None or (self.imgtk.width(), self.imgtk.height()) != im.size:
+            self.imgtk = ImageTk.PhotoImage(image=im)
+            self.image_label.imgtk = self.imgtk  # keep a reference
+            self.image_label.configure(image=self.imgtk)
+        else:
+            # 同じ PhotoImage に書き込み直して、毎フレームの確保を避ける
+            self.imgtk.paste(im)
         self.info_label.config(text=info_text)
         self.fps_label.config(text=fps_text)
         self.eye_pos_label.config(text=eye_pos_text)
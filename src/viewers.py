@@ -0,0 +1,89 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from smoothing import SmoothingChain
+
+# 複数人の眼の位置に、フレームをまたいで変わらない ID を付ける
+# FaceMesh の顔の順番はフレームごとに入れ替わるので、両目の中点 (ワールド座標, m) の距離で前フレームの人と対応付ける
+# (距離を重みにした割り当て問題をハンガリアン法で解く)。ID は 0 から max_viewers - 1 のスロット番号で、
+# 出力のアドレス (/viewer/{id}/...) にそのまま使う。スムージングの状態は人ごとに持つ
+
+class Viewer:
+    def __init__(self, id, smoothing_spec):
+        self.id = id
+        self.smoothing = SmoothingChain(smoothing_spec)
+        self.center = None
+        self.missed = 0
+
+class ViewerTracker:
+    def __init__(self, max_viewers, smoothing_spec=None, max_distance=0.2, max_missed=15):
+        self.max_viewers = max_viewers
+        self.smoothing_spec = smoothing_spec
+        # 前フレームの位置からこれ以上離れた顔は別の人とみなす (m)
+        self.max_distance = max_distance
+        # 見失ってもこのフレーム数までは ID を残しておく (横切った人に一瞬隠れたときなど)
+        self.max_missed = max_missed
+        self.viewers = [None] * max_viewers
+
+    def set_smoothing(self, spec):
+        self.smoothing_spec = spec
+        for viewer in self.viewers:
+            if viewer is not None:
+                viewer.smoothing.set_stages(spec)
+
+    def active(self):
+        return [viewer for viewer in self.viewers if viewer is not None]
+
+    def associate(self, faces):
+        # faces: (N, 2, 3) の右目・左目のワールド座標。(Viewer, 顔の番号) のリストを ID 順に返す
+        faces = np.asarray(faces, dtype=np.float64).reshape(-1, 2, 3)
+        # デプスが取れなかった目 (z=0) は中点に使わない。両目とも取れなければその顔は対応付けない
+        valid = faces[:, :, 2] > 0
+        counts = valid.sum(axis=1)
+        centers = (faces * valid[:, :, None]).sum(axis=1) / np.maximum(counts, 1)[:, None]
+        candidates = np.flatnonzero(counts > 0)
+        tracked = [viewer for viewer in self.viewers if viewer is not None and viewer.center is not None]
+        matches = []
+        unmatched = set(candidates.tolist())
+        if tracked and candidates.size:
+            previous = np.array([viewer.center for viewer in tracked])
+            cost = np.linalg.norm(previous[:, None, :] - centers[None, candidates, :], axis=-1)
+            for row, col in zip(*linear_sum_assignment(cost)):
+                if cost[row, col] <= self.max_distance:
+                    matches.append((tracked[row], int(candidates[col])))
+                    unmatched.discard(int(candidates[col]))
+        matched = {id(viewer) for viewer, _ in matches}
+        for i, viewer in enumerate(self.viewers):
+            if viewer is not None and id(viewer) not in matched:
+                viewer.missed += 1
+                if viewer.missed > self.max_missed:
+                    self.viewers[i] = None
+        # 新しく現れた顔には空いているスロットの小さい番号から割り当てる (空きがなければ出力しない)
+        for index in sorted(unmatched):
+            if None not in self.viewers:
+                break
+            slot = self.viewers.index(None)
+            viewer = Viewer(slot, self.smoothing_spec)
+            self.viewers[slot] = viewer
+            matches.append((viewer, index))
+        for viewer, index in matches:
+            viewer.center = centers[index]
+            viewer.missed = 0
+        return sorted(matches, key=lambda match: match[0].id)
+
+    def process(self, faces, predictor=None, timestamp=None, arrival=None):
+        # 対応付けてから人ごとにスムージング・予測をかけ、(ID, 眼の位置) のリストを返す
+        return self.smooth(self.associate(faces), faces, predictor, timestamp, arrival)
+
+    def smooth(self, matches, faces, predictor=None, timestamp=None, arrival=None):
+        # associate の結果に、人ごとにスムージング・予測をかける
+        poses = []
+        for viewer, index in matches:
+            eye_pos = viewer.smoothing.process(faces[index].tolist())
+            if predictor is not None:
+                eye_pos = predictor.predict(eye_pos, viewer.smoothing.motion(), timestamp, arrival)
+            poses.append((viewer.id, eye_pos))
+        return poses
+
+    def timing_text(self):
+        viewers = self.active()
+        return viewers[0].smoothing.timing_text() if viewers else ""